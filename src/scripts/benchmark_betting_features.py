@@ -0,0 +1,95 @@
+"""
+
+BETTING FEATURES BENCHMARK
+
+Times the postgres and pandas engines for the betting features and checks that
+they produce the same frame. Exits non-zero if any column differs.
+
+"""
+
+import pandas as pd
+import numpy as np
+import sys
+import time
+from utility.reference import sql
+from utility.lines_model import features
+
+WINDOWS = [3, 5, 10]
+SORT_KEYS = ["GAME_DATE", "HOME_TEAM", "AWAY_TEAM"]
+TEXT_COLUMNS = SORT_KEYS + ["FAVORITE"]
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.sort_values(SORT_KEYS).reset_index(drop=True)
+    for column in df.columns:
+        if column in TEXT_COLUMNS:
+            df[column] = df[column].astype(str)
+        else:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(float)
+    return df
+
+
+def compare(expected: pd.DataFrame, actual: pd.DataFrame) -> list:
+    if list(expected.columns) != list(actual.columns):
+        return [f"column order: {list(expected.columns)} != {list(actual.columns)}"]
+    if len(expected) != len(actual):
+        return [f"row count: {len(expected)} != {len(actual)}"]
+
+    expected, actual = normalize(expected), normalize(actual)
+    mismatches = []
+    for column in expected.columns:
+        left, right = expected[column], actual[column]
+        if column in TEXT_COLUMNS:
+            equal = left == right
+        else:
+            equal = (left == right) | (left.isna() & right.isna())
+        if not equal.all():
+            mismatches.append(f"{column}: {(~equal).sum()} rows differ")
+    return mismatches
+
+
+def main():
+    (gamelogs, players, lines), load_seconds = timed(sql.load_betting_feature_inputs)
+    print(f"\nLoaded {len(gamelogs)} gamelogs in {load_seconds:.2f}s")
+
+    failed = False
+    for window in WINDOWS:
+        query = sql._betting_features_query(window)
+        expected, sql_seconds = timed(sql.convert_sql_to_df, query=query)
+        actual, pandas_seconds = timed(
+            features.compute_betting_features, gamelogs, players, lines, window
+        )
+        print(
+            f"\nwindow {window}: sql {sql_seconds:.2f}s, pandas {pandas_seconds:.2f}s"
+        )
+
+        mismatches = compare(sql._decimals_to_float(expected), actual)
+        for mismatch in mismatches:
+            print(f"\tMISMATCH {mismatch}")
+        failed = failed or bool(mismatches)
+
+    query = sql._betting_features_query(WINDOWS)
+    expected, sql_seconds = timed(sql.convert_sql_to_df, query=query)
+    actual, pandas_seconds = timed(
+        features.compute_betting_features, gamelogs, players, lines, WINDOWS
+    )
+    print(
+        f"\nwindows {WINDOWS} in one pass: sql {sql_seconds:.2f}s, pandas {pandas_seconds:.2f}s"
+    )
+
+    mismatches = compare(sql._decimals_to_float(expected), actual)
+    for mismatch in mismatches:
+        print(f"\tMISMATCH {mismatch}")
+    failed = failed or bool(mismatches)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+
+IMPORT TIME BENCHMARK
+
+Imports every scripts/ module in a fresh interpreter with sockets and database
+connections blocked, and reports how long each import took. A module that
+touches the network or the database on import slows every Lambda cold start,
+so the benchmark exits non-zero if any module tries to, or if any module loads
+the ML or plotting stacks at import.
+
+Pass --profile to print each module's slowest top-level imports from
+python -X importtime.
+
+"""
+
+import subprocess
+import argparse
+import json
+import sys
+import os
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.dirname(SCRIPTS_DIR)
+
+# only imported inside the training, prediction and plotting functions
+HEAVY_PACKAGES = ["sklearn", "matplotlib", "seaborn", "scipy"]
+PROFILE_TOP_N = 8
+IMPORT_MARKER = "benchmark_imports: importing"
+
+# runs inside the child interpreter: any connection attempt is recorded and
+# refused, so a module doing I/O on import fails loudly instead of hanging
+PROBE = """
+import importlib, json, socket, sys, time
+
+attempts = []
+
+def refuse(name):
+    def blocked(*args, **kwargs):
+        attempts.append(name)
+        raise ConnectionRefusedError(f"{name} during import")
+    return blocked
+
+socket.socket.connect = refuse("socket.connect")
+socket.create_connection = refuse("socket.create_connection")
+socket.getaddrinfo = refuse("socket.getaddrinfo")
+try:
+    import psycopg
+    psycopg.connect = refuse("psycopg.connect")
+    psycopg.Connection.connect = classmethod(refuse("psycopg.connect"))
+except ImportError:
+    pass
+
+result = {"attempts": attempts, "error": None, "missing": None}
+print(sys.argv[2], file=sys.stderr, flush=True)
+started = time.perf_counter()
+try:
+    importlib.import_module(sys.argv[1])
+except ModuleNotFoundError as e:
+    result["missing"] = e.name
+except BaseException as e:
+    result["error"] = repr(e)
+result["seconds"] = time.perf_counter() - started
+result["heavy"] = [x for x in sys.argv[3].split(",") if x in sys.modules]
+print(json.dumps(result))
+"""
+
+
+def get_script_modules() -> list:
+    return sorted(
+        f"scripts.{name[:-3]}"
+        for name in os.listdir(SCRIPTS_DIR)
+        if name.endswith(".py") and name != os.path.basename(__file__)
+    )
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Returns (package, cumulative seconds) for every top-level import made
+    after the probe's marker, slowest first.
+    """
+    _, _, report = stderr.partition(IMPORT_MARKER)
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, package = line.split("|")
+        # nested imports are indented under the package that pulled them in
+        if cumulative.strip().isdigit() and not package[1:].startswith(" "):
+            imports.append((package.strip(), int(cumulative) / 1e6))
+
+    return sorted(imports, key=lambda x: x[1], reverse=True)
+
+
+def time_import(module: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            PROBE,
+            module,
+            IMPORT_MARKER,
+            ",".join(HEAVY_PACKAGES),
+        ],
+        capture_output=True,
+        text=True,
+        cwd=SRC_DIR,
+        env=env,
+    )
+    try:
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+    except (IndexError, json.JSONDecodeError):
+        result = {
+            "attempts": [],
+            "error": completed.stderr.strip().splitlines()[-1:] or "no output",
+            "missing": None,
+            "seconds": 0.0,
+            "heavy": [],
+        }
+    result["profile"] = parse_importtime(completed.stderr)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", action="store_true")
+    args, _ = parser.parse_known_args()
+
+    modules = get_script_modules()
+    failures = []
+
+    print(f"\n\t{'module':<45}{'seconds':>10}  status")
+    for module in modules:
+        result = time_import(module)
+        if result["attempts"]:
+            status = f"FAIL: I/O on import ({', '.join(sorted(set(result['attempts'])))})"
+            failures.append(module)
+        elif result["heavy"]:
+            status = f"FAIL: loads {', '.join(result['heavy'])} on import"
+            failures.append(module)
+        elif result["missing"]:
+            # a dependency missing from this environment is not the module's fault
+            status = f"unavailable, {result['missing']} not installed"
+        elif result["error"]:
+            status = f"FAIL: {result['error']}"
+            failures.append(module)
+        else:
+            status = "ok"
+        print(f"\t{module:<45}{result['seconds']:>10.3f}  {status}")
+        if args.profile:
+            for package, seconds in result["profile"][:PROFILE_TOP_N]:
+                print(f"\t    {package:<41}{seconds:>10.3f}")
+
+    if failures:
+        print(f"\n{len(failures)} of {len(modules)} modules failed to import cleanly.")
+        sys.exit(1)
+
+    print(
+        f"\nAll {len(modules)} modules imported without network or database I/O "
+        "or the ML and plotting stacks."
+    )
+
+
+if __name__ == "__main__":
+    main()
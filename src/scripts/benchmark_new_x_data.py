@@ -0,0 +1,111 @@
+"""
+
+NEW X DATA BENCHMARK
+
+Times sql.agg_team_new_x_data, the team step of fetch_new_x_data, against the
+previous three-scan version and checks that both return the same frame. Exits
+non-zero if they differ.
+
+"""
+
+import sys
+import time
+from utility.reference import sql
+from utility.reference.sql import convert_sql_to_df
+
+WINDOW_NGAMES = 3
+REPEATS = 5
+
+
+def legacy_agg_team_new_x_data(window_ngames: int = 3):
+    for n in ["HOME", "AWAY", "TOTAL"]:
+
+        query = f"""
+		WITH team_metrics as ( 
+		SELECT 
+        "GAME_DATE",
+        "TEAM_ID",
+		"TEAM", 
+		ROUND(AVG("PTS"::numeric) OVER (PARTITION BY "SEASON_YEAR", "TEAM" 
+			ORDER BY "GAME_DATE" ROWS BETWEEN 
+			UNBOUNDED PRECEDING AND CURRENT ROW)::numeric, 4) AS "SEASON_PPG", 
+		ROUND(AVG("PTS"::numeric) OVER (PARTITION BY "SEASON_YEAR", "TEAM" 
+			ORDER BY "GAME_DATE" ROWS BETWEEN 
+			{window_ngames - 1} PRECEDING AND CURRENT ROW)::numeric, 4) AS "LAST_{str(window_ngames)}_PPG",
+        ROUND(AVG("PTS"::numeric - "PLUS_MINUS"::numeric) OVER (PARTITION BY "SEASON_YEAR", "TEAM"
+			ORDER BY "GAME_DATE" ROWS BETWEEN
+			UNBOUNDED PRECEDING AND CURRENT ROW)::numeric, 4) AS "SEASON_OPP_PPG",
+		ROUND(AVG("PTS"::numeric - "PLUS_MINUS"::numeric) OVER (PARTITION BY "SEASON_YEAR", "TEAM"
+			ORDER BY "GAME_DATE" ROWS BETWEEN
+			{window_ngames - 1} PRECEDING AND CURRENT ROW)::numeric, 4) AS "LAST_{window_ngames}_OPP_PPG", 
+        ROW_NUMBER() OVER (PARTITION BY "TEAM_ID" ORDER BY "GAME_DATE" DESC) AS "rn"
+		FROM  
+			nba_gamelogs.team_gamelogs 
+        WHERE "HOME/AWAY" = '{n}'
+		ORDER BY "GAME_DATE" DESC) 
+		SELECT  
+			MAX("GAME_DATE") AS "LAST_GAME_DATE",
+            "TEAM_ID",
+			"TEAM", 
+			"SEASON_PPG", 
+			"LAST_{window_ngames}_PPG", 
+			"SEASON_OPP_PPG", 
+			"LAST_{window_ngames}_OPP_PPG" 
+		FROM team_metrics 
+		WHERE rn = 1 
+        GROUP BY 
+        	"TEAM_ID", 
+        	"TEAM", 
+            "SEASON_PPG",
+            "LAST_{window_ngames}_PPG", 
+			"SEASON_OPP_PPG", 
+			"LAST_{window_ngames}_OPP_PPG" 
+		LIMIT 30; 
+	"""
+        if n == "HOME":
+            home_df = convert_sql_to_df(query=query)
+        elif n == "AWAY":
+            away_df = convert_sql_to_df(query=query)
+        else:
+            query = query.replace(f"WHERE \"HOME/AWAY\" = '{n}'", "")
+            total_df = convert_sql_to_df(query=query)
+            total_df = total_df[["TEAM_ID", "SEASON_OPP_PPG", f"LAST_{window_ngames}_OPP_PPG"]]
+
+    merged = (
+        home_df.merge(away_df, on="TEAM", suffixes=("_HOME", "_AWAY"))
+        .rename({"TEAM_ID_HOME": "TEAM_ID"}, axis=1)
+        .drop("TEAM_ID_AWAY", axis=1)
+    )
+    return merged.merge(total_df, on="TEAM_ID")
+
+
+def best_of(function, *args):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def main():
+    # open the pooled connection first so neither side pays for the handshake
+    sql.get_connection().connect().close()
+
+    legacy, legacy_seconds = best_of(legacy_agg_team_new_x_data, WINDOW_NGAMES)
+    single, single_seconds = best_of(sql.agg_team_new_x_data, WINDOW_NGAMES)
+
+    print(f"\nthree scans: {legacy_seconds * 1000:.1f}ms (best of {REPEATS})")
+    print(f"single query: {single_seconds * 1000:.1f}ms (best of {REPEATS})")
+
+    legacy = legacy.sort_values("TEAM_ID").reset_index(drop=True)
+    single = single.sort_values("TEAM_ID").reset_index(drop=True)
+    if list(legacy.columns) != list(single.columns) or not legacy.equals(single):
+        print("\nMISMATCH between the three-scan and single query frames")
+        sys.exit(1)
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,63 @@
 from nba_api.stats.endpoints import playergamelog
 import pandas as pd
 import numpy as np
-import time
-import math
-from utility.reference import sql
-import json
-import requests
+from functools import cache
+from utility.reference import sql, nba_fetch, gamelogs, batch_runner
 
 pd.options.mode.chained_assignment = None
 
 START_SEASON = 1979 # The 3pt line was introduced into the NBA in the 1979 season
-PLAYER_DF = sql.convert_sql_to_df("players", "nba_general")
-HEADERS = playergamelog.PlayerGameLog(
-    player_id=PLAYER_DF.loc[0, "PERSON_ID"]
-).get_dict()["resultSets"][0]["headers"]
+SEASON_BATCH_SIZE = 5
+UPSERT_KEYS = ["Game_ID", "Player_ID"]
+
+
+@cache
+def get_player_df():
+    return sql.convert_sql_to_df("players", "nba_general")
+
+
+@cache
+def get_headers():
+    sample = nba_fetch.fetch(
+        playergamelog.PlayerGameLog, player_id=get_player_df().loc[0, "PERSON_ID"]
+    )
+    return sample.get_dict()["resultSets"][0]["headers"]
 
 
 def scrape_game_logs(player_df, seasons):
+    """
+    Returns the gamelogs of every player in seasons, and the seasons for which
+    every player's fetch succeeded.
+    """
 
-    game_logs = []
+    responses = []
+    fetched_seasons = []
 
     for n in seasons:
         print(f"\nGetting gamelogs for {n} season...")
         players = player_df[
             (player_df["FROM_YEAR"] <= n) & (player_df["TO_YEAR"] >= n)
         ][["PERSON_ID", "DISPLAY_FIRST_LAST"]].copy()
-        for i, row in players.iterrows():
-            for attempt in range(0, 5):
-                try:
-                    print(
-                        f"\n\tGrabbing gamelogs for player {row['DISPLAY_FIRST_LAST']}"
-                    )
-                    game_logs.extend(
-                        playergamelog.PlayerGameLog(
-                            player_id=row["PERSON_ID"], season=n
-                        ).get_dict()["resultSets"][0]["rowSet"]
-                    )
-                    time.sleep(1)
-                    break
-                except json.decoder.JSONDecodeError:
-                    print("\n\t\tError, trying again...")
-                    time.sleep(0.5)
-                except requests.exceptions.ReadTimeout:
-                    print("\n\t\tError, trying again...")
-                    time.sleep(3)
-
-    game_log_df = pd.DataFrame(columns=HEADERS, data=game_logs)
-
-    game_log_df["TEAM"] = game_log_df["MATCHUP"].apply(lambda x: x.split()[0])
-    game_log_df["OPPONENT"] = game_log_df["MATCHUP"].apply(lambda x: x.split()[-1])
-    game_log_df["HOME/AWAY"] = game_log_df["MATCHUP"].apply(
-        lambda x: "AWAY" if x.split()[1] == "@" else "HOME"
-    )
+        calls = [
+            (
+                row["DISPLAY_FIRST_LAST"],
+                playergamelog.PlayerGameLog,
+                {"player_id": row["PERSON_ID"], "season": n},
+            )
+            for i, row in players.iterrows()
+        ]
+        failed = 0
+        for player_name, player_logs in nba_fetch.fetch_all(calls):
+            print(f"\n\tGrabbed gamelogs for player {player_name}")
+            if player_logs is None:
+                failed += 1
+                continue
+            responses.append(player_logs)
+        if not failed:
+            fetched_seasons.append(n)
+
+    game_log_df = gamelogs.logs_to_df(responses, headers=get_headers())
+    game_log_df = gamelogs.split_matchup(game_log_df)
 
     game_log_df = game_log_df.drop(columns=["VIDEO_AVAILABLE", "MATCHUP"])
 
@@ -65,27 +71,41 @@ def scrape_game_logs(player_df, seasons):
 
     game_log_df.reset_index(drop=True, inplace=True)
 
-    return game_log_df
+    return game_log_df, fetched_seasons
 
 
-def main():
-    seasons = [n for n in range(START_SEASON, 2026)]
-    number_of_batches = math.ceil(len(seasons) / 5)
+def export_season_batch(season_batch):
+    print(f"\nGrabbing gamelogs for {season_batch} seasons...\n")
+
+    gamelog_df, fetched_seasons = scrape_game_logs(get_player_df(), season_batch)
+    # upserted so a batch that dies before its checkpoint is not loaded twice
+    sql.export_df_to_sql(
+        gamelog_df,
+        table_name="player_gamelogs",
+        schema="nba_gamelogs",
+        behavior="upsert",
+        keys=UPSERT_KEYS,
+    )
+
+    # a season with a failed player fetch is loaded but not checkpointed, so
+    # a resumed run fetches it again
+    return fetched_seasons
 
-    for x in range(0, number_of_batches):
-        season_batch = seasons[(x * 5) :]
-        if len(season_batch) >= 5:
-            season_batch = season_batch[:5]
-        print(f"\nGrabbing gamelogs for {season_batch} seasons...\n")
 
-        gamelog_df = scrape_game_logs(PLAYER_DF, season_batch)
-        sql.export_df_to_sql(
-            gamelog_df,
-            table_name="player_gamelogs",
-            schema="nba_gamelogs",
-            behavior="append",
-        )
+def main():
+    seasons = [n for n in range(START_SEASON, 2026)]
+    batch_runner.run_batches(
+        "get_all_gamelogs",
+        seasons,
+        SEASON_BATCH_SIZE,
+        export_season_batch,
+        checkpoint=lambda season: season != seasons[-1],
+    )
+    # a no-op once the table has it, so it only does work after the first load
+    sql.ensure_game_key("player_gamelogs", "Game_ID")
 
 
 if __name__ == "__main__":
+    batch_runner.parse_args()
+    nba_fetch.parse_args()
     main()
@@ -0,0 +1,191 @@
+from nba_api.stats.endpoints.boxscoreadvancedv3 import BoxScoreAdvancedV3 as bsa
+from nba_api.stats.endpoints.boxscoremiscv3 import BoxScoreMiscV3 as bsm
+from utility.reference import sql, nba_fetch, batch_runner, gamelogs
+import pandas as pd
+import re
+
+BATCH_SIZE = 100
+TEAM_UPSERT_KEYS = ["game_id"]
+PLAYER_UPSERT_KEYS = ["game_id", "player_id"]
+
+# endpoint, response key and the (player, team) tables each one feeds
+ENDPOINTS = {
+    "advanced": (
+        bsa,
+        "boxScoreAdvanced",
+        ("player_advanced_metrics", "team_advanced_metrics"),
+    ),
+    "misc": (bsm, "boxScoreMisc", ("player_misc_metrics", "team_misc_metrics")),
+}
+TABLES = [table for *_, tables in ENDPOINTS.values() for table in tables]
+
+
+def to_snake_case(name):
+    return re.sub("([a-z0-9])([A-Z])", r"\1_\2", name).lower()
+
+
+def parse_box_score(response, row, include_team_id):
+    enum = {"home": "homeTeam", "away": "awayTeam"}
+
+    team_record = {
+        "game_id": response["gameId"],
+        "away_team_id": response["awayTeamId"],
+        "home_team_id": response["homeTeamId"],
+        "date": row["date"],
+        "season": int(row["season"]),
+    }
+
+    player_records = []
+    for team in enum:
+        stats = response[enum[team]]["statistics"]
+        for key in stats:
+            team_record[f"{team}_{key}"] = stats[key]
+
+        for player in response[enum[team]]["players"]:
+            player_record = {
+                "game_id": response["gameId"],
+                "date": row["date"],
+                "season": int(row["season"]),
+            }
+            if include_team_id:
+                player_record["team_id"] = response[enum[team]]["teamId"]
+            player_record["home_away"] = team
+            player_record["player_id"] = player["personId"]
+            player_record["player_slug"] = player["playerSlug"]
+            player_record.update(player["statistics"])
+
+            player_records.append(player_record)
+
+    return player_records, team_record
+
+
+def get_box_score_metrics(game_batch, pending):
+    """
+    Requests each endpoint once per game and fans the parsed response out to
+    every table still missing that game. Returns a frame per table, and the
+    games whose every request succeeded.
+    """
+    print("\nGrabbing new box score metrics data...")
+    records = {table: [] for table in TABLES}
+    failed_games = set()
+
+    calls = [
+        (
+            (n, kind),
+            endpoint,
+            {"game_id": gamelogs.to_api_game_id(row["game_id"])},
+        )
+        for n, row in enumerate(game_batch)
+        for kind, (endpoint, _, tables) in ENDPOINTS.items()
+        if any(row["game_id"] in pending[table] for table in tables)
+    ]
+
+    for completed, ((n, kind), box_score) in enumerate(nba_fetch.fetch_all(calls)):
+        row = game_batch[n]
+        print(
+            f"\n\tGot {kind} metrics data for {row['game_id']} - {completed + 1} of {len(calls)}"
+        )
+        if box_score is None:
+            failed_games.add(row["game_id"])
+            continue
+
+        _, response_key, (player_table, team_table) = ENDPOINTS[kind]
+        try:
+            player_records, team_record = parse_box_score(
+                box_score.get_dict()[response_key], row, include_team_id=kind == "misc"
+            )
+        except (KeyError, TypeError, AttributeError) as e:
+            print(f"\n\t\tError: {e}, skipping {kind} {row['game_id']}...")
+            failed_games.add(row["game_id"])
+            continue
+
+        if row["game_id"] in pending[player_table]:
+            records[player_table].extend(player_records)
+        if row["game_id"] in pending[team_table]:
+            records[team_table].append(team_record)
+
+    frames = {
+        table: pd.DataFrame.from_records(table_records)
+        for table, table_records in records.items()
+    }
+
+    # player misc columns have always been renamed with the team misc mapping,
+    # which leaves their camelCase stat names as stored in player_misc_metrics
+    renames = {table: frames[table].columns for table in TABLES}
+    renames["player_misc_metrics"] = frames["team_misc_metrics"].columns
+
+    for table in TABLES:
+        frames[table] = frames[table].rename(
+            {x: to_snake_case(x) for x in renames[table]}, axis=1
+        )
+
+    fetched_games = [row for row in game_batch if row["game_id"] not in failed_games]
+
+    return frames, fetched_games
+
+
+def get_pending_games():
+    # one scan of player_gamelogs flags which tables are missing each game
+    pending_games = sql.get_pending_games_by_table(TABLES, min_season=1996)
+    pending = {
+        table: set(pending_games.loc[pending_games[table], "game_id"])
+        for table in TABLES
+    }
+
+    return pending_games[["game_id", "date", "season"]], pending
+
+
+def export_box_score_metrics(game_batch, pending):
+    frames, fetched_games = get_box_score_metrics(game_batch, pending)
+
+    for table, df in frames.items():
+        if df.empty:
+            continue
+
+        if table.endswith("advanced_metrics"):
+            sql.export_df_to_sql(
+                df=df, table_name=table, schema="nba_gamelogs", behavior="append"
+            )
+        else:
+            sql.export_df_to_sql(
+                df=df,
+                table_name=table,
+                schema="nba_gamelogs",
+                behavior="upsert",
+                keys=(
+                    TEAM_UPSERT_KEYS
+                    if table.startswith("team")
+                    else PLAYER_UPSERT_KEYS
+                ),
+            )
+
+    return fetched_games
+
+
+def lambda_handler(event, context):
+    batch_runner.configure(event)
+    main()
+
+
+def main():
+    # the pending games query matches on game_key, which a table created by a
+    # previous run's first load gets here. A no-op once a table has it
+    for table in TABLES:
+        sql.ensure_game_key(table, "game_id")
+
+    new_games, pending = get_pending_games()
+    new_games = new_games.to_dict(orient="records")
+
+    batch_runner.run_batches(
+        "get_box_score_metrics_logs",
+        new_games,
+        BATCH_SIZE,
+        lambda game_batch: export_box_score_metrics(game_batch, pending),
+        unit_key=lambda game: game["game_id"],
+    )
+
+
+if __name__ == "__main__":
+    batch_runner.parse_args()
+    nba_fetch.parse_args()
+    main()
@@ -2,15 +2,12 @@ from nba_api.stats.endpoints.teamgamelogs import TeamGameLogs as tgl
 from nba_api.stats.static import teams
 import pandas as pd
 import numpy as np
-import time
-import math
-from utility.reference import sql
-import json
-import requests
+from utility.reference import sql, nba_fetch, gamelogs, batch_runner
 
 pd.options.mode.chained_assignment = None
 
 START_SEASON = 1979
+SEASON_BATCH_SIZE = 5
 COLUMNS = [
     "TEAM_ID",
     "TEAM_ABBREVIATION",
@@ -49,39 +46,35 @@ NBA_TEAM_IDS = pd.DataFrame.from_records(teams.get_teams())["id"].to_list()
 
 
 def scrape_game_logs(seasons):
+    """
+    Returns the gamelogs of every season whose fetch succeeded, and those
+    seasons. The frame is None if no season came back.
+    """
+
+    stage_frames = []
+    fetched_seasons = []
+
+    calls = [
+        (n, tgl, {"season_nullable": str(n) + "-" + str(n + 1)[-2:]})
+        for n in seasons
+    ]
+    for n, season_logs in nba_fetch.fetch_all(calls):
+        print(f"\nGot gamelogs for {n} season...")
+        if season_logs is None:
+            continue
 
-    gamelogs_df = pd.DataFrame()
-
-    for n in seasons:
-        second_year = str(n + 1)[-2:]
-        season_string_param = str(n) + "-" + second_year
-        print(f"\nGetting gamelogs for {n} season...")
-
-        for attempt in range(0, 5):
-            try:
-                season_json = tgl(
-                    season_nullable=season_string_param
-                ).get_dict()["resultSets"]
-                headers = season_json[0]["headers"]
-                data = season_json[0]["rowSet"]
-                stage_df = pd.DataFrame(columns=headers, data=data)
-                stage_df["SEASON_YEAR"] = n
-                gamelogs_df = pd.concat([gamelogs_df, stage_df])
-                time.sleep(0.6)
-                break
-            except json.decoder.JSONDecodeError:
-                print("\n\t\tError, trying again...")
-                time.sleep(0.5)
-            except requests.exceptions.ReadTimeout:
-                print("\n\t\tError, trying again...")
-                time.sleep(3)
+        stage_df = gamelogs.logs_to_df([season_logs])
+        stage_df["SEASON_YEAR"] = n
+        stage_frames.append(stage_df)
+        fetched_seasons.append(n)
+
+    if not stage_frames:
+        return None, fetched_seasons
+
+    gamelogs_df = pd.concat(stage_frames)
     gamelogs_df.dropna(inplace=True)
 
-    gamelogs_df["TEAM"] = gamelogs_df["MATCHUP"].apply(lambda x: x.split()[0])
-    gamelogs_df["OPPONENT"] = gamelogs_df["MATCHUP"].apply(lambda x: x.split()[-1])
-    gamelogs_df["HOME/AWAY"] = gamelogs_df["MATCHUP"].apply(
-        lambda x: "AWAY" if x.split()[1] == "@" else "HOME"
-    )
+    gamelogs_df = gamelogs.split_matchup(gamelogs_df)
 
     gamelogs_df.rename({"SEASON_YEAR": "SEASON"}, inplace=True)
 
@@ -93,7 +86,7 @@ def scrape_game_logs(seasons):
 
     gamelogs_df.reset_index(drop=True, inplace=True)
 
-    return gamelogs_df[COLUMNS]
+    return gamelogs_df[COLUMNS], sorted(fetched_seasons)
 
 
 def get_latest_season():
@@ -104,41 +97,54 @@ def get_latest_season():
 
 
 def lambda_handler(event, context):
+    batch_runner.configure(event)
     main()
 
 
-def drop_current_season_rows(season_year):
-    statement = (
-        f'DELETE FROM nba_gamelogs.team_gamelogs WHERE "SEASON_YEAR" = {season_year}'
+def export_season_batch(season_batch):
+    print(f"\nGrabbing gamelogs for {season_batch} seasons...\n")
+
+    gamelog_df, fetched_seasons = scrape_game_logs(season_batch)
+    if gamelog_df is None:
+        print(f"\nNo gamelogs came back for {season_batch}, nothing to replace.")
+        return []
+
+    # replacing only the seasons that came back makes a rerun of a batch
+    # idempotent without wiping a season whose fetch failed, and the delete
+    # rolls back with the load if the load fails
+    rows = sql.replace_rows_df_to_sql(
+        gamelog_df,
+        table_name="team_gamelogs",
+        schema="nba_gamelogs",
+        column="SEASON_YEAR",
+        values=[int(x) for x in fetched_seasons],
     )
-    sql.execute_database_operations(statement)
+    print(f"\nteam_gamelogs seasons {fetched_seasons} replaced with {rows} rows.")
+
+    return fetched_seasons
 
 
 def main():
     try:
-        start_season = get_latest_season()
-        drop_current_season_rows(start_season)
+        start_season = int(get_latest_season())
     except Exception:
         start_season = START_SEASON
     seasons = [n for n in range(start_season, 2026)]
-    number_of_batches = math.ceil(len(seasons) / 5)
 
-    for x in range(0, number_of_batches):
-        season_batch = seasons[(x * 5) :]
-        if len(season_batch) >= 5:
-            season_batch = season_batch[:5]
-        print(f"\nGrabbing gamelogs for {season_batch} seasons...\n")
-
-        gamelog_df = scrape_game_logs(season_batch)
-
-        behavior = "replace" if x == 0 and start_season == START_SEASON else "append"
-        sql.export_df_to_sql(
-            gamelog_df,
-            table_name="team_gamelogs",
-            schema="nba_gamelogs",
-            behavior=behavior,
-        )
+    # the latest season is still being played, so a later refresh the same
+    # day must fetch it again
+    batch_runner.run_batches(
+        "get_team_gamelogs",
+        seasons,
+        SEASON_BATCH_SIZE,
+        export_season_batch,
+        checkpoint=lambda season: season != seasons[-1],
+    )
+    # a no-op once the table has it, so it only does work after the first load
+    sql.ensure_game_key("team_gamelogs", "GAME_ID")
 
 
 if __name__ == "__main__":
+    batch_runner.parse_args()
+    nba_fetch.parse_args()
     main()
@@ -1,45 +1,38 @@
 # lambda_function.py
+from scripts import refresh
+from utility.reference import batch_runner
 import json
-import subprocess
-import os
+
 
 def lambda_handler(event, context):
     print(f"Received event: {json.dumps(event, indent=2)}")
 
     try:
-        print("Executing refresh.sh...")
-        result = subprocess.run(["./src/scripts/refresh.sh"],
-                                capture_output=True, 
-                                text=True,          
-                                check=True,         
-                                env=os.environ.copy() 
-                               )
-
-        print("Shell script stdout:")
-        print(result.stdout)
-        if result.stderr:
-            print("Shell script stderr:")
-            print(result.stderr)
-
-        print("Shell script executed successfully.")
+        settings = event if isinstance(event, dict) else {}
+        # shard and run id settings in the event apply to every batch job
+        batch_runner.configure(settings)
+
+        print("Running refresh jobs...")
+        results = refresh.run(settings.get("jobs"))
+
+        failed = [name for name, x in results.items() if x["status"] != "succeeded"]
+        if failed:
+            print(f"Refresh jobs did not succeed: {failed}")
+            return {
+                'statusCode': 500,
+                'body': json.dumps({'failed': failed, 'results': results})
+            }
+
+        print("Refresh jobs executed successfully.")
 
         return {
             'statusCode': 200,
-            'body': json.dumps('Shell script and Python scripts executed successfully!')
+            'body': json.dumps({'results': results})
         }
 
-    except subprocess.CalledProcessError as e:
-        print(f"Shell script failed with error code {e.returncode}")
-        print(f"Command: {e.cmd}")
-        print(f"Stdout: {e.stdout}")
-        print(f"Stderr: {e.stderr}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps(f'Error executing shell script: {e.stderr}')
-        }
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return {
             'statusCode': 500,
             'body': json.dumps(f'An unexpected error occurred: {str(e)}')
-        }
\ No newline at end of file
+        }
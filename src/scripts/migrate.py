@@ -0,0 +1,13 @@
+from utility.reference import migrations
+
+
+def lambda_handler(event, context):
+    main()
+
+
+def main():
+    migrations.migrate()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,6 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.svm import SVC
-from sklearn.feature_selection import SelectKBest, f_classif, mutual_info_classif
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-from sklearn.inspection import permutation_importance
 from utility.reference.sql import convert_sql_to_df
-import matplotlib.pyplot as plt
-import seaborn as sns
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -22,7 +12,7 @@ def load_and_prepare_data():
             "TEAM" as "team",
             "OPPONENT" as "opp",
             "HOME/AWAY" as "home_away",
-            "GAME_ID" as "game_id",
+            "game_key",
             "GAME_DATE" as "date",
             "WL",
             "MIN" as "min",
@@ -52,7 +42,7 @@ def load_and_prepare_data():
     ),
     misc_metrics_filtered as (
         SELECT
-            "game_id",
+            "game_key",
             "date",
             "away_team_id" as "team_id",
             "away_points_off_turnovers" as "pts_off_turnovers",
@@ -69,7 +59,7 @@ def load_and_prepare_data():
         UNION
 
         SELECT
-            "game_id",
+            "game_key",
             "date",
             "home_team_id" as "team_id",
             "home_points_off_turnovers" as "pts_off_turnovers",
@@ -85,7 +75,7 @@ def load_and_prepare_data():
     ),
     advanced_metrics_filtered as (
         SELECT
-            "game_id",
+            "game_key",
             "date",
             "away_team_id" as "team_id",
             "away_assist_to_turnover" as "assist_to_turnover",
@@ -96,7 +86,7 @@ def load_and_prepare_data():
         UNION
 
         SELECT
-            "game_id",
+            "game_key",
             "date",
             "home_team_id" as "team_id",
             "home_assist_to_turnover" as "assist_to_turnover",
@@ -140,14 +130,14 @@ def load_and_prepare_data():
         "pace"
     FROM tradlogs as tl
     JOIN misc_metrics_filtered as mm
-        ON tl."game_id" = mm."game_id"
+        ON tl."game_key" = mm."game_key"
         AND tl."team_id" = mm."team_id"
     JOIN advanced_metrics_filtered as am
-        ON mm."game_id" = am."game_id"
+        ON mm."game_key" = am."game_key"
         AND mm."team_id" = am."team_id"
     ORDER BY "date";
     """
-    df = convert_sql_to_df(query=query)
+    df = convert_sql_to_df(query=query, cache=True)
     
     df['win'] = df['win?'].astype(int)
     
@@ -174,6 +164,13 @@ def load_and_prepare_data():
 
 def run_feature_importance_analysis(X, y):
     """Run comprehensive feature importance analysis using multiple methods"""
+    from sklearn.model_selection import train_test_split, cross_val_score
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.feature_selection import SelectKBest, f_classif, mutual_info_classif
+    from sklearn.metrics import accuracy_score
+    from sklearn.inspection import permutation_importance
     
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
     
@@ -270,6 +267,8 @@ def create_feature_ranking_summary(feature_importance_results):
     return importance_df, ranking_df
 
 def plot_feature_importance(importance_df, top_n=15):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     
     plt.figure(figsize=(12, 8))
     top_features = importance_df.head(top_n)
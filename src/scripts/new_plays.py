@@ -1,11 +1,8 @@
-from utility.reference import sql
+from utility.reference import sql, nba_fetch, batch_runner, gamelogs
 from nba_api.stats.endpoints import playbyplayv3 as pp
 import pandas as pd
 import numpy as np
-import time
-import json
-import requests
-import math
+import os
 
 COLUMNS = [
     "gameId",
@@ -34,6 +31,11 @@ COLUMNS = [
     "actionId",
 ]
 
+# SEASON is the partition key, so it has to be part of the unique key
+UPSERT_KEYS = ["gameId", "actionNumber", "SEASON"]
+GAME_BATCH_SIZE = 100
+FLUSH_ROWS = int(os.getenv("play_by_play_flush_rows", 20000))
+
 HTTP_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
     "Referer": "https://www.nba.com",
@@ -46,109 +48,103 @@ HTTP_HEADERS = {
 }
 
 
-def get_play_by_play_data(game_batch, columns):
-
-    staging_df = pd.DataFrame(columns=columns)
-
+def iter_play_by_play_data(game_batch, columns):
+    """
+    Yields each game and its normalized actions as soon as its response
+    arrives, so only one game is held at a time. Games whose fetch failed are
+    skipped.
+    """
     print("\nGrabbing new play by play data...")
 
-    for n, row in enumerate(game_batch):
-        for attempt in range(0, 5):
-            print(
-                f"\n\tGetting playbyplay data for {row['Game_ID']} - {n + 1} of {len(game_batch)}"
-            )
-            try:
-                try:
-                    play = pp.PlayByPlayV3(game_id=row['Game_ID'], headers=HTTP_HEADERS)
-                except IndexError:
-                    play = pp.PlayByPlayV3(game_id=f"00{row['Game_ID']}", headers=HTTP_HEADERS)
-
-                new_plays = pd.DataFrame(
-                            columns=columns, data=play.play_by_play.get_dict()["data"]
-                        )
-                new_plays['GAME_DATE'] = row['GAME_DATE']
-                new_plays['SEASON'] = row['SEASON']
-                new_plays.drop(columns='videoAvailable', inplace=True)
-
-                staging_df = pd.concat(
-                    [
-                        staging_df,
-                        new_plays,
-                    ]
-                )
-                time.sleep(0.6)
-                break
-            except json.decoder.JSONDecodeError as e:
-                print(f"\n\t\tError: {e}, trying again...")
-                time.sleep(1)
-            except requests.exceptions.ReadTimeout as e:
-                print(f"\n\t\tError: {e}, trying again...")
-                time.sleep(3)
-            except IndexError as e:
-                print(f"\n\t\tError: {e}, trying again...")
-                time.sleep(1)
-
-    return staging_df
-
-def lambda_handler(event, context):
-    main()
-    
-def main():
-    print("\nLoading gamelogs df...")
+    calls = [
+        (
+            n,
+            pp.PlayByPlayV3,
+            {"game_id": gamelogs.to_api_game_id(row["Game_ID"]), "headers": HTTP_HEADERS},
+        )
+        for n, row in enumerate(game_batch)
+    ]
 
-    # the nba only began tracking play by play data in 1996
+    for completed, (n, play) in enumerate(nba_fetch.fetch_all(calls)):
+        row = game_batch[n]
+        print(
+            f"\n\tGot playbyplay data for {row['Game_ID']} - {completed + 1} of {len(game_batch)}"
+        )
+        if play is None:
+            continue
 
-    log_query = """
-                SELECT 
-                    DISTINCT("Game_ID"), 
-                    "GAME_DATE", 
-                    RIGHT("SEASON_ID", 4)::numeric AS "SEASON"
-                FROM nba_gamelogs.player_gamelogs
-                WHERE CAST("SEASON_ID" AS INTEGER) >= 21996
-                """
+        new_plays = pd.DataFrame(
+            columns=columns, data=play.play_by_play.get_dict()["data"]
+        )
+        new_plays['GAME_DATE'] = row['GAME_DATE']
+        new_plays['SEASON'] = row['SEASON']
+        new_plays.drop(columns='videoAvailable', inplace=True)
 
-    logs = sql.convert_sql_to_df(query=log_query)
+        yield row, new_plays.replace("", np.nan)
 
-    logs["Game_ID"] = logs["Game_ID"].apply(lambda x: str(x).lstrip("00"))
 
-    game_ids = logs["Game_ID"].unique()
+def flush_play_by_play(buffer):
+    if not buffer:
+        return
 
-    print("\nLoading play by play df...")
+    export = pd.concat(buffer, ignore_index=True)
+    sql.ensure_play_by_play_partitions(export, UPSERT_KEYS)
+    sql.export_df_to_sql(
+        df=export,
+        table_name="play_by_play",
+        schema="nba_gamelogs",
+        behavior="upsert",
+        keys=UPSERT_KEYS,
+    )
+    buffer.clear()
 
-    pbp_query = 'SELECT DISTINCT("gameId") FROM nba_gamelogs.play_by_play;'
-    try:
-        play_by_play = sql.convert_sql_to_df(query=pbp_query)
 
-        play_by_play["gameId"] = play_by_play["gameId"].apply(lambda x: str(x).lstrip("00"))
-        play_by_play_games = play_by_play["gameId"].unique()
+def export_play_by_play(game_batch):
+    # upserts whenever FLUSH_ROWS actions are buffered, so peak memory is set by
+    # the flush size rather than the batch size
+    buffer = []
+    buffered_rows = 0
+    exported = []
+    for row, new_plays in iter_play_by_play_data(game_batch, COLUMNS):
+        exported.append(row)
+        buffer.append(new_plays)
+        buffered_rows += len(new_plays)
+        if buffered_rows >= FLUSH_ROWS:
+            flush_play_by_play(buffer)
+            buffered_rows = 0
 
-        del play_by_play
+    flush_play_by_play(buffer)
 
-        new_ids = [x for x in game_ids if x not in play_by_play_games]
-    except Exception as e:
-        print(f'\nAn error has occurred {e}')
-        new_ids = game_ids
+    return exported
 
-    print(f"\n{len(new_ids)} new game ids found!")
 
-    games = logs.loc[logs["Game_ID"].isin(new_ids)].to_dict(orient='records')
+def lambda_handler(event, context):
+    batch_runner.configure(event)
+    main()
+    
+def main():
+    print("\nFinding games without play by play data...")
 
-    del logs
+    # the nba only began tracking play by play data in 1996
+    games = sql.get_pending_games("play_by_play", min_season=1996)
+    games = games.rename(
+        columns={"game_id": "Game_ID", "date": "GAME_DATE", "season": "SEASON"}
+    ).astype({"SEASON": int})
 
-    number_of_batches = math.ceil(len(games) / 100)
+    print(f"\n{len(games)} new game ids found!")
 
-    for x in range(0, number_of_batches):
-        game_batch = games[(x * 100) :]
-        if len(game_batch) >= 100:
-            game_batch = game_batch[:100]
-        print(f"\nGrabbing plays for batch {x} out of {number_of_batches}...\n")
+    games = games.to_dict(orient="records")
 
-        export = get_play_by_play_data(game_batch, COLUMNS)
-        export = export.replace("", np.nan)
-        sql.export_df_to_sql(
-            df=export, table_name="play_by_play", schema="nba_gamelogs", behavior="append"
-        )
+    batch_runner.run_batches(
+        "new_plays",
+        games,
+        GAME_BATCH_SIZE,
+        export_play_by_play,
+        unit_key=lambda game: game["Game_ID"],
+    )
 
 
 if __name__ == "__main__":
+    batch_runner.parse_args()
+    nba_fetch.parse_args()
     main()
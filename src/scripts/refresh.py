@@ -0,0 +1,185 @@
+"""
+
+DEPENDENCY AWARE REFRESH ORCHESTRATOR
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+import importlib
+import argparse
+import time
+import sys
+import os
+
+# every job runs in this process, so they all share the nba_api token bucket
+# and the sql connection pool
+MAX_WORKERS = int(os.getenv("refresh_max_workers", 3))
+
+
+@dataclass(frozen=True)
+class Job:
+    module: str
+    inputs: tuple = ()
+    outputs: tuple = ()
+    # runs before every other job, which all wait on it
+    first: bool = False
+
+
+JOBS = {
+    "migrate": Job(
+        module="migrate",
+        # schema changes must not run alongside the loads writing those tables
+        first=True,
+    ),
+    "lines_analyzer": Job(
+        module="lines_analyzer",
+        outputs=("nba_general.lines",),
+    ),
+    "update_gamelogs": Job(
+        module="update_gamelogs",
+        # also refreshes betting features, which join today's lines
+        inputs=("nba_general.lines",),
+        outputs=("nba_gamelogs.player_gamelogs", "nba_features.betting_features"),
+    ),
+    "get_team_gamelogs": Job(
+        module="get_team_gamelogs",
+        outputs=("nba_gamelogs.team_gamelogs",),
+    ),
+    "new_plays": Job(
+        module="new_plays",
+        inputs=("nba_gamelogs.player_gamelogs",),
+        outputs=("nba_gamelogs.play_by_play",),
+    ),
+    "get_box_score_metrics_logs": Job(
+        module="get_box_score_metrics_logs",
+        inputs=("nba_gamelogs.player_gamelogs",),
+        outputs=(
+            "nba_gamelogs.player_advanced_metrics",
+            "nba_gamelogs.team_advanced_metrics",
+            "nba_gamelogs.player_misc_metrics",
+            "nba_gamelogs.team_misc_metrics",
+        ),
+    ),
+}
+
+# the jobs refresh.sh has always run; the play by play and metrics backfills
+# are opted into with refresh_jobs / --jobs
+DEFAULT_JOBS = os.getenv(
+    "refresh_jobs", "lines_analyzer,update_gamelogs,get_team_gamelogs"
+).split(",")
+
+
+def get_dependencies(jobs: list) -> dict:
+    # a job waits on every selected job that writes one of its inputs, and on
+    # every first job
+    return {
+        name: {
+            other
+            for other in jobs
+            if other != name
+            and (
+                (JOBS[other].first and not JOBS[name].first)
+                or set(JOBS[name].inputs) & set(JOBS[other].outputs)
+            )
+        }
+        for name in jobs
+    }
+
+
+def run_job(name: str, result: dict, started: float) -> None:
+    # timed from when a worker picks the job up, not from when it was queued
+    result["start"] = time.perf_counter() - started
+    # src is on the path (PYTHONPATH locally, the image env on Lambda)
+    importlib.import_module(f"scripts.{JOBS[name].module}").main()
+
+
+def print_summary(results: dict, wall_seconds: float) -> None:
+    print("\nRefresh summary:")
+    print(f"\t{'job':<30}{'status':<10}{'start':>10}{'seconds':>10}")
+    for name, result in sorted(results.items(), key=lambda x: x[1]["start"]):
+        print(
+            f"\t{name:<30}{result['status']:<10}"
+            f"{result['start']:>10.1f}{result['seconds']:>10.1f}"
+        )
+
+    serial_seconds = sum(x["seconds"] for x in results.values())
+    print(f"\n\t{wall_seconds:.1f}s wall clock, {serial_seconds:.1f}s if run serially")
+
+
+def run(jobs: list | None = None, max_workers: int = MAX_WORKERS) -> dict:
+    """
+    Runs the selected jobs as soon as the jobs producing their inputs have
+    succeeded, up to max_workers at a time. First jobs such as migrate always
+    run, before all the others. A failed job's dependents are skipped. Returns
+    each job's status, start offset and duration.
+    """
+    jobs = list(jobs or DEFAULT_JOBS)
+    unknown = [x for x in jobs if x not in JOBS]
+    if unknown:
+        raise ValueError(f"Unknown refresh jobs {unknown}, choose from {list(JOBS)}")
+    jobs = [x for x in JOBS if JOBS[x].first and x not in jobs] + jobs
+
+    dependencies = get_dependencies(jobs)
+    pending = set(jobs)
+    results = {}
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            progressed = False
+            for name in sorted(pending):
+                statuses = [results.get(x, {}).get("status") for x in dependencies[name]]
+                if any(x in ("failed", "skipped") for x in statuses):
+                    print(f"\nSkipping {name}, a job it depends on did not succeed.")
+                    results[name] = {
+                        "status": "skipped",
+                        "start": time.perf_counter() - started,
+                        "seconds": 0.0,
+                    }
+                    pending.discard(name)
+                    progressed = True
+                elif all(x == "succeeded" for x in statuses):
+                    print(f"\nStarting {name}...")
+                    results[name] = {"start": time.perf_counter() - started}
+                    running[executor.submit(run_job, name, results[name], started)] = name
+                    pending.discard(name)
+                    progressed = True
+
+            if not running:
+                if not progressed:
+                    raise RuntimeError(f"Refresh jobs {pending} can never start")
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                result = results[name]
+                result["seconds"] = time.perf_counter() - started - result["start"]
+                try:
+                    future.result()
+                    result["status"] = "succeeded"
+                except (Exception, SystemExit) as e:
+                    # scripts call sys.exit on failure, which must not kill the others
+                    print(f"\nERROR: {name} failed: {e!r}")
+                    result["status"] = "failed"
+                print(f"\n{name} {result['status']} in {result['seconds']:.1f}s.")
+
+    print_summary(results, time.perf_counter() - started)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", help=f"comma separated subset of {list(JOBS)}")
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS)
+    args, _ = parser.parse_known_args()
+
+    results = run(args.jobs.split(",") if args.jobs else None, args.max_workers)
+    if any(x["status"] != "succeeded" for x in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,8 @@ def get_restore_file():
 
 
 def main():
-    revert_df = get_restore_file()
+    # a flatfile dumped from the table carries the generated game_key column
+    revert_df = get_restore_file().drop(columns="game_key", errors="ignore")
     sql.export_df_to_sql(
         df=revert_df,
         table_name="player_gamelogs_v2",
@@ -1,39 +1,26 @@
 from nba_api.stats.endpoints import CommonPlayerInfo
 from nba_api.stats.static import players
 from nba_api.stats.endpoints import playergamelog
+from nba_api.stats.endpoints import leaguegamelog
 from datetime import date
-from utility.reference import sql
+from functools import cache
+from utility.reference import sql, nba_fetch, gamelogs
 from utility.logger import get_struct_logger
 import datetime
 import pandas as pd
-import time
-import json
-import requests
 import os
 
 log = get_struct_logger()
 
-HEADERS = sql.convert_sql_to_df(
-    query="SELECT column_name \
-                                FROM information_schema.columns \
-                                WHERE table_name = 'player_gamelogs';"
-)["column_name"].to_list()
 TODAY = date.today()
-ACTIVE_PLAYERS_DF = pd.DataFrame.from_records(players.get_active_players())
-MONTHS = {
-    "JAN": 1,
-    "FEB": 2,
-    "MAR": 3,
-    "APR": 4,
-    "MAY": 5,
-    "JUN": 6,
-    "JUL": 7,
-    "AUG": 8,
-    "SEP": 9,
-    "OCT": 10,
-    "NOV": 11,
-    "DEC": 12,
-}
+
+UPSERT_KEYS = ["Game_ID", "Player_ID"]
+
+# "league" pulls every new player box score with one LeagueGameLog request per
+# season in the date range, "player" falls back to one PlayerGameLog per player
+INGESTION_MODE = os.getenv("gamelog_ingestion_mode", "league")
+SEASON_TYPE = "Regular Season"
+LEAGUE_LOG_COLUMNS = {"PLAYER_ID": "Player_ID", "GAME_ID": "Game_ID"}
 
 REQUEST_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
@@ -42,6 +29,24 @@ REQUEST_HEADERS = {
 }
 
 
+@cache
+def get_headers():
+    # generated columns such as game_key are filled by postgres, never loaded
+    return sql.convert_sql_to_df(
+        query="SELECT column_name \
+                                FROM information_schema.columns \
+                                WHERE table_name = 'player_gamelogs' \
+                                AND table_schema = 'nba_gamelogs' \
+                                AND is_generated = 'NEVER' \
+                                ORDER BY ordinal_position;"
+    )["column_name"].to_list()
+
+
+@cache
+def get_active_players_df():
+    return pd.DataFrame.from_records(players.get_active_players())
+
+
 def find_latest_game_date():
     log.info("Finding last gamedate...")
 
@@ -69,92 +74,90 @@ def get_new_logs(last_game_date):
     new_game_logs = []
 
     player_dict = players.get_active_players()
+    calls = [
+        (
+            x["full_name"],
+            playergamelog.PlayerGameLog,
+            {"player_id": x["id"], "date_from_nullable": last_game_date},
+        )
+        for x in player_dict
+    ]
 
-    for x in player_dict:
-        for attempt in range(0, 5):
-            try:
-                log.info("Grabbing gamelogs", player_name=x["full_name"])
-                new_game_logs.append(
-                    playergamelog.PlayerGameLog(
-                        player_id=x["id"], date_from_nullable=last_game_date, # headers=REQUEST_HEADERS
-                    )
-                )
-                time.sleep(0.400)
-                break
-            except json.decoder.JSONDecodeError as e:
-                log.error("Error, trying again...", e=e, attempt=attempt)
-                time.sleep(0.5)
-            except requests.exceptions.ReadTimeout as e:
-                log.error("Error, trying again...", e=e, attempt=attempt)
-                time.sleep(3)
+    for n, (player_name, response) in enumerate(nba_fetch.fetch_all(calls)):
+        log.info(
+            "Grabbed gamelogs", player_name=player_name, n=n + 1, total=len(calls)
+        )
+        if response is not None:
+            new_game_logs.append(response)
 
     return new_game_logs
 
 
-def convert_new_logs_to_df(new_logs):
-    headers = new_logs[0].get_dict()["resultSets"][0]["headers"]
-    new_logs_df = pd.DataFrame(columns=headers)
-    for x in new_logs:
-        for n in x.get_dict()["resultSets"][0]["rowSet"]:
-            new_logs_df.loc[len(new_logs_df)] = n
-
-    new_logs_df["TEAM"] = new_logs_df["MATCHUP"].apply(get_team)
-    new_logs_df["OPPONENT"] = new_logs_df["MATCHUP"].apply(get_opponent)
-    new_logs_df["HOME/AWAY"] = new_logs_df["MATCHUP"].apply(get_home_away)
-
-    standard_date = lambda x: (
-        str(
-            x.split(" ")[2]
-            + "-"
-            + str(MONTHS[x.split(" ")[0]])
-            + "-"
-            + x.split(" ")[1].rstrip(",")
-        )
-        if x.split(" ")[0] in MONTHS
-        else x
-    )
+def get_season_start_year(game_date: date) -> int:
+    # seasons tip off in october, anything earlier belongs to the previous season
+    return game_date.year if game_date.month >= 10 else game_date.year - 1
 
-    new_logs_df["GAME_DATE"] = new_logs_df.GAME_DATE.apply(standard_date)
-    new_logs_df["GAME_DATE"] = pd.to_datetime(new_logs_df["GAME_DATE"])
 
-    new_logs_df = new_logs_df.merge(
-        ACTIVE_PLAYERS_DF, how="inner", left_on="Player_ID", right_on="id"
-    ).drop(columns=["id", "first_name", "last_name"])
+def get_new_league_logs(last_game_date):
+    log.info("Grabbing new league gamelogs...")
 
-    new_logs_df.rename({"full_name": "player_name"}, axis=1, inplace=True)
+    date_from = datetime.datetime.strptime(last_game_date, "%m/%d/%Y").date()
+    if date_from > TODAY:
+        return []
 
-    new_logs_df.sort_values(by=["GAME_DATE", "TEAM"], ascending=False, inplace=True)
+    seasons = [
+        f"{year}-{str(year + 1)[-2:]}"
+        for year in range(
+            get_season_start_year(date_from), get_season_start_year(TODAY) + 1
+        )
+    ]
+
+    calls = [
+        (
+            season,
+            leaguegamelog.LeagueGameLog,
+            {
+                "player_or_team_abbreviation": "P",
+                "season": season,
+                "season_type_all_star": SEASON_TYPE,
+                "date_from_nullable": last_game_date,
+                "date_to_nullable": TODAY.strftime("%m/%d/%Y"),
+            },
+        )
+        for season in seasons
+    ]
 
-    new_logs_df = new_logs_df.drop_duplicates().reset_index(drop=True)
+    new_game_logs = []
+    for season, response in nba_fetch.fetch_all(calls):
+        log.info("Grabbed league gamelogs", season=season)
+        if response is not None:
+            new_game_logs.append(response)
 
-    return new_logs_df
+    return new_game_logs
 
 
-def clean_matchup_column(matchup):
-    matchup = matchup.split()
-    team = matchup[0]
-    opponent = matchup[-1]
-    if matchup[1] == "@":
-        home_away = "AWAY"
-    else:
-        home_away = "HOME"
+def convert_new_logs_to_df(new_logs, date_format=gamelogs.LEAGUE_LOG_DATE_FORMAT):
+    new_logs_df = gamelogs.logs_to_df(new_logs)
 
-    return team, opponent, home_away
+    # league gamelogs name the id columns differently from PlayerGameLog
+    new_logs_df.rename(LEAGUE_LOG_COLUMNS, axis=1, inplace=True)
 
+    new_logs_df = gamelogs.split_matchup(new_logs_df)
+    new_logs_df["GAME_DATE"] = gamelogs.parse_game_dates(
+        new_logs_df["GAME_DATE"], date_format
+    )
 
-def get_team(matchup):
-    team, opponent, home_away = clean_matchup_column(matchup)
-    return team
+    new_logs_df = new_logs_df.merge(
+        get_active_players_df(), how="inner", left_on="Player_ID", right_on="id"
+    ).drop(columns=["id", "first_name", "last_name"])
 
+    new_logs_df.rename({"full_name": "player_name"}, axis=1, inplace=True)
 
-def get_opponent(matchup):
-    team, opponent, home_away = clean_matchup_column(matchup)
-    return opponent
+    new_logs_df.sort_values(by=["GAME_DATE", "TEAM"], ascending=False, inplace=True)
 
+    new_logs_df = new_logs_df.drop_duplicates().reset_index(drop=True)
 
-def get_home_away(matchup):
-    team, opponent, home_away = clean_matchup_column(matchup)
-    return home_away
+    return new_logs_df
 
 
 def lambda_handler(event, context):
@@ -163,22 +166,39 @@ def lambda_handler(event, context):
 
 def main():
     latest_game_date = find_latest_game_date()
-    new_logs = get_new_logs(latest_game_date)
-    new_logs_df = convert_new_logs_to_df(new_logs)
+    if INGESTION_MODE == "player":
+        new_logs = get_new_logs(latest_game_date)
+        date_format = gamelogs.PLAYER_LOG_DATE_FORMAT
+    else:
+        new_logs = get_new_league_logs(latest_game_date)
+        date_format = gamelogs.LEAGUE_LOG_DATE_FORMAT
 
-    new_logs_df = new_logs_df[HEADERS]
+    if new_logs:
+        new_logs_df = convert_new_logs_to_df(new_logs, date_format)
 
-    new_logs_df.drop_duplicates(inplace=True)
+        new_logs_df = new_logs_df[get_headers()]
 
-    log.info("Exporting to sql db...")
-    sql.export_df_to_sql(
-        df=new_logs_df,
-        table_name="player_gamelogs",
-        schema="nba_gamelogs",
-        behavior="append",
-    )
-    log.info("Export successful.")
+        new_logs_df.drop_duplicates(inplace=True)
+
+        log.info("Exporting to sql db...")
+        sql.export_df_to_sql(
+            df=new_logs_df,
+            table_name="player_gamelogs",
+            schema="nba_gamelogs",
+            behavior="upsert",
+            keys=UPSERT_KEYS,
+        )
+        log.info("Export successful.")
+        sql.ensure_game_key("player_gamelogs", "Game_ID")
+        sql.ensure_player_gamelog_index()
+    else:
+        log.info("No new gamelogs found.")
+
+    log.info("Refreshing betting features...")
+    sql.refresh_betting_features()
+    log.info("Connection pool stats", **sql.get_pool_stats())
 
 
 if __name__ == "__main__":
+    nba_fetch.parse_args()
     main()
@@ -1,10 +1,9 @@
 from nba_api.stats.endpoints import CommonPlayerInfo
 from nba_api.stats.static import players
 from nba_api.stats.endpoints import playergamelog
-from utility.reference import sql
+from utility.reference import sql, nba_fetch
 import pandas as pd
 from datetime import date
-import time
 import os
 
 TODAY = date.today()
@@ -13,28 +12,22 @@ TODAY = date.today()
 def fetch_latest_data():
     player_dict = players.get_players()
 
-    common_player_info_df = pd.DataFrame(
-        columns=CommonPlayerInfo(player_dict[0]["id"]).get_dict()["resultSets"][0][
-            "headers"
-        ]
-    )
+    headers = None
+    rows = []
+    calls = [
+        (player["full_name"], CommonPlayerInfo, {"player_id": player["id"]})
+        for player in player_dict
+    ]
+    for player_name, player_info in nba_fetch.fetch_all(calls):
+        print(f"\n\tGrabbed {player_name} data")
+        if player_info is None:
+            continue
 
-    for player in player_dict:
-        for attempt in range(1, 5):
-            try:
-                print(f"\n\tGrabbing {player['full_name']} data")
-                row = CommonPlayerInfo(player["id"]).get_dict()["resultSets"][0][
-                    "rowSet"
-                ][0]
-                length = len(common_player_info_df)
-                common_player_info_df.loc[length] = row
-                time.sleep(0.200)
-                break
-            except Exception:
-                print("\nTimeout error. Trying again...")
-                time.sleep(0.2 * attempt)
+        result_set = player_info.get_dict()["resultSets"][0]
+        headers = result_set["headers"]
+        rows.extend(result_set["rowSet"][:1])
 
-    return common_player_info_df
+    return pd.DataFrame(columns=headers, data=rows)
 
 
 def get_current_data():
@@ -80,4 +73,5 @@ def main():
 
 
 if __name__ == "__main__":
+    nba_fetch.parse_args()
     main()
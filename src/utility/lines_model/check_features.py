@@ -0,0 +1,382 @@
+"""
+
+BETTING FEATURES PARITY CHECK
+
+Builds a small synthetic gamelogs, players and lines fixture and checks that
+features.compute_betting_features matches a plain row by row computation of
+the same windows, including NULL points, a missing height and each player's
+and team's first game. Needs no database, and exits non-zero on a mismatch.
+
+"""
+
+from utility.lines_model import features
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+from fractions import Fraction
+import datetime as dt
+import pandas as pd
+import numpy as np
+import random
+import sys
+
+WINDOWS = [2, 3]
+SEASON_IDS = ["22022", "22023"]
+ROSTERS = {
+    "AAA": [(1, "Al A", "6-5"), (2, "Bo A", "6-9"), (3, "Cy A", "7-0")],
+    "BBB": [(4, "Di B", "6-1"), (5, "Ed B", None), (6, "Fy B", "6-7")],
+    "CCC": [(7, "Gu C", "6-3"), (8, "Hu C", "6-11"), (9, "Io C", "6-6")],
+}
+# (day, home, away) per season; day 2 and 3 make a back to back for AAA
+SCHEDULE = [
+    (1, "AAA", "BBB"),
+    (2, "CCC", "AAA"),
+    (3, "AAA", "CCC"),
+    (5, "BBB", "CCC"),
+    (6, "BBB", "AAA"),
+    (8, "CCC", "BBB"),
+    (9, "AAA", "BBB"),
+]
+# (player id, game number) of a player who debuts part way through each season
+LATE_DEBUT = (9, 3)
+# (player id, day) with no points recorded, and a (team, day) with none for anyone
+NULL_POINTS = [(2, 1), (5, 4)]
+NULL_TEAM_GAME = ("BBB", 5)
+# games with no betting line are dropped by the join
+UNLINED_GAMES = [8]
+
+
+def build_fixture(seed: int = 7) -> tuple:
+    rng = random.Random(seed)
+    gamelogs, lines = [], []
+    for season_id in SEASON_IDS:
+        start = dt.date(int(season_id[-4:]), 10, 20)
+        for game_number, (day, home, away) in enumerate(SCHEDULE):
+            date = start + dt.timedelta(days=day)
+            game_id = f"00{season_id}{game_number:03d}"
+            home_wins = rng.random() < 0.5
+            scores = {}
+            for team, opponent, venue in [(home, away, "HOME"), (away, home, "AWAY")]:
+                won = home_wins == (venue == "HOME")
+                scores[team] = 0
+                for player_id, name, _ in ROSTERS[team]:
+                    if player_id == LATE_DEBUT[0] and game_number < LATE_DEBUT[1]:
+                        continue
+                    points = rng.randint(0, 35)
+                    if (player_id, day) in NULL_POINTS or (team, day) == NULL_TEAM_GAME:
+                        points = None
+                    scores[team] += points or 0
+                    gamelogs.append(
+                        {
+                            "SEASON_ID": season_id,
+                            "Player_ID": player_id,
+                            "player_name": name,
+                            "Game_ID": game_id,
+                            "GAME_DATE": date.isoformat(),
+                            "TEAM": team,
+                            "OPPONENT": opponent,
+                            "HOME/AWAY": venue,
+                            "PTS": points,
+                            "WL": "W" if won else "L",
+                        }
+                    )
+            if day in UNLINED_GAMES:
+                continue
+            game_total = rng.choice([210.5, 221.0, 230.5])
+            lines.append(
+                {
+                    "game_date": date.isoformat(),
+                    "home_team_abbrev": home,
+                    "visit_team_abbrev": away,
+                    "favorite": home if rng.random() < 0.5 else away,
+                    "total": game_total,
+                    "over_hit": int(scores[home] + scores[away] > game_total),
+                    "favorite_covered": rng.randint(0, 1),
+                    "home_team_score": scores[home],
+                    "visit_team_score": scores[away],
+                }
+            )
+
+    players = pd.DataFrame(
+        [
+            {"PERSON_ID": player_id, "HEIGHT": height}
+            for roster in ROSTERS.values()
+            for player_id, _, height in roster
+        ]
+    )
+    return pd.DataFrame(gamelogs), players, pd.DataFrame(lines)
+
+
+def round_half_up(value, places: int):
+    # postgres ROUND on numeric rounds half away from zero
+    if value is None:
+        return None
+    with localcontext() as context:
+        context.prec = 50
+        if isinstance(value, Fraction):
+            value = Decimal(value.numerator) / Decimal(value.denominator)
+        return value.quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+
+
+def avg(values, places: int):
+    values = [x for x in values if x is not None]
+    if not values:
+        return None
+    return round_half_up(Fraction(sum(values), len(values)), places)
+
+
+def stddev(values, places: int):
+    values = [x for x in values if x is not None]
+    if len(values) < 2:
+        return None
+    mean = Fraction(sum(values), len(values))
+    variance = sum((x - mean) ** 2 for x in values) / (len(values) - 1)
+    with localcontext() as context:
+        context.prec = 50
+        root = (Decimal(variance.numerator) / Decimal(variance.denominator)).sqrt()
+    return round_half_up(root, places)
+
+
+def total(values):
+    # SUM skips NULLs and is NULL when every value is
+    values = [x for x in values if x is not None]
+    return sum(values) if values else None
+
+
+def preceding(rows: list, i: int, n: int | None = None) -> list:
+    # ROWS BETWEEN n PRECEDING AND 1 PRECEDING, or UNBOUNDED PRECEDING
+    return rows[max(0, i - n) if n is not None else 0 : i]
+
+
+def group_sorted(rows: list, key) -> list:
+    groups = {}
+    for row in rows:
+        groups.setdefault(key(row), []).append(row)
+    return [sorted(x, key=lambda row: row["date"]) for x in groups.values()]
+
+
+def reference_features(gamelogs, players, lines, windows) -> pd.DataFrame:
+    heights = {}
+    for player in players.to_dict("records"):
+        if not pd.isna(player["HEIGHT"]):
+            feet, inches = player["HEIGHT"].split("-")
+            heights[player["PERSON_ID"]] = int(feet) * 12 + int(inches)
+
+    logs = []
+    for row in gamelogs.to_dict("records"):
+        home = row["HOME/AWAY"] == "HOME"
+        logs.append(
+            {
+                "season": int(row["SEASON_ID"][-4:]),
+                "date": dt.date.fromisoformat(row["GAME_DATE"]),
+                "player": (row["player_name"], row["Player_ID"]),
+                "game": row["Game_ID"],
+                "team": row["TEAM"],
+                "home": row["TEAM"] if home else row["OPPONENT"],
+                "away": row["OPPONENT"] if home else row["TEAM"],
+                "pts": None if pd.isna(row["PTS"]) else int(row["PTS"]),
+                "w": int(row["WL"] == "W"),
+                "l": int(row["WL"] == "L"),
+                "height": heights.get(row["Player_ID"]),
+            }
+        )
+
+    # each player's windows over their own earlier games that season
+    for rows in group_sorted(logs, lambda x: (x["season"], x["player"])):
+        points = [x["pts"] for x in rows]
+        for i, row in enumerate(rows):
+            for n in windows:
+                row[f"LAST_{n}_PPG"] = avg(preceding(points, i, n), 4)
+                row[f"LAST_{n}_PPG_STDDEV"] = stddev(preceding(points, i, n), 4)
+            row["SEASON_PPG"] = avg(preceding(points, i), 4)
+            row["SEASON_POINTS_STDDEV"] = stddev(preceding(points, i), 4)
+
+    player_features = ["SEASON_PPG", "SEASON_POINTS_STDDEV"]
+    for n in windows:
+        player_features += [f"LAST_{n}_PPG", f"LAST_{n}_PPG_STDDEV"]
+
+    # one row per team per game
+    team_games = []
+    for rows in group_sorted(logs, lambda x: (x["game"], x["team"])):
+        first = rows[0]
+        team_game = {
+            k: first[k]
+            for k in ["season", "date", "game", "team", "home", "away", "w", "l"]
+        }
+        team_game["pts"] = total(x["pts"] for x in rows)
+        team_game["height_avg"] = avg((x["height"] for x in rows), 5)
+        team_game["height_std"] = stddev([x["height"] for x in rows], 5)
+        for column in player_features:
+            team_game[column] = total(x[column] for x in rows)
+        team_games.append(team_game)
+
+    game_points = {}
+    for team_game in team_games:
+        side = "home" if team_game["team"] == team_game["home"] else "away"
+        game_points[(team_game["game"], side)] = team_game["pts"]
+
+    for rows in group_sorted(team_games, lambda x: (x["season"], x["team"])):
+        for i, row in enumerate(rows):
+            earlier = preceding(rows, i)
+            row["cum_w"] = total(x["w"] for x in earlier)
+            row["cum_l"] = total(x["l"] for x in earlier)
+            # averages the game's away (home) score over every earlier game of
+            # the team, as the sql does
+            away_points = [game_points[(x["game"], "away")] for x in rows]
+            home_points = [game_points[(x["game"], "home")] for x in rows]
+            row["opp"] = {
+                None: (
+                    avg(preceding(away_points, i), 4),
+                    avg(preceding(home_points, i), 4),
+                )
+            }
+            for n in windows:
+                row["opp"][n] = (
+                    avg(preceding(away_points, i, n), 4),
+                    avg(preceding(home_points, i, n), 4),
+                )
+
+    for rows in group_sorted(team_games, lambda x: x["team"]):
+        for i, row in enumerate(rows):
+            row["b2b"] = int(i > 0 and (row["date"] - rows[i - 1]["date"]).days == 1)
+
+    games = {}
+    for row in team_games:
+        games.setdefault(row["game"], {})[
+            "home" if row["team"] == row["home"] else "away"
+        ] = row
+
+    records = []
+    for game_id, sides in games.items():
+        home, away = sides["home"], sides["away"]
+        record = {
+            "SEASON": home["season"],
+            "GAME_DATE": home["date"],
+            "GAME_ID": game_id,
+            "HOME_TEAM": home["team"],
+            "AWAY_TEAM": away["team"],
+            "HOME_PTS": game_points[(game_id, "home")],
+            "AWAY_PTS": game_points[(game_id, "away")],
+        }
+        # each side's value is summed with the other team's row, which holds 0,
+        # so a side with no value yet comes out as 0 rather than NULL
+        for column in player_features:
+            record[f"HOME_ACTIVE_PLAYERS_{column}"] = total([home[column], 0])
+            record[f"AWAY_ACTIVE_PLAYERS_{column}"] = total([away[column], 0])
+        record["HOME_TEAM_OPP_PPG"] = total([home["opp"][None][0], 0])
+        record["AWAY_TEAM_OPP_PPG"] = total([away["opp"][None][1], 0])
+        for n in windows:
+            record[f"HOME_TEAM_OPP_LAST_{n}_PPG"] = total([home["opp"][n][0], 0])
+            record[f"AWAY_TEAM_OPP_LAST_{n}_PPG"] = total([away["opp"][n][1], 0])
+        record["HOME_TEAM_2ND_OF_B2B"] = home["b2b"]
+        record["AWAY_TEAM_2ND_OF_B2B"] = away["b2b"]
+        record["HOME_AVG_HEIGHT_INCHES"] = total([home["height_avg"], 0])
+        record["HOME_STDDEV_HEIGHT_INCHES"] = total([home["height_std"], 0])
+        record["AWAY_AVG_HEIGHT_INCHES"] = total([away["height_avg"], 0])
+        record["AWAY_STDDEV_HEIGHT_INCHES"] = total([away["height_std"], 0])
+        for side, row in [("HOME", home), ("AWAY", away)]:
+            # MAX(CASE ... ELSE 0) turns a first game's NULL counts into 0
+            wins, losses = row["cum_w"] or 0, row["cum_l"] or 0
+            record[f"{side}_TEAM_GAMES_PLAYED"] = wins + losses
+            record[f"{side}_TEAM_WIN_PCT"] = (
+                round_half_up(Fraction(wins, wins + losses), 5)
+                if wins + losses
+                else None
+            )
+        records.append(record)
+
+    # home and away scoring averages over the team's earlier home (away) games
+    for side, suffix in [("HOME", "_AT_HOME"), ("AWAY", "_AWAY")]:
+        for rows in group_sorted(
+            [dict(x, date=x["GAME_DATE"]) for x in records],
+            lambda x: (x["SEASON"], x[f"{side}_TEAM"]),
+        ):
+            points = [x[f"{side}_PTS"] for x in rows]
+            for i, row in enumerate(rows):
+                target = next(x for x in records if x["GAME_ID"] == row["GAME_ID"])
+                target[f"{side}_TEAM_PPG{suffix}"] = avg(preceding(points, i), 4)
+                for n in windows:
+                    target[f"{side}_TEAM_LAST_{n}_PPG{suffix}"] = avg(
+                        preceding(points, i, n), 4
+                    )
+
+    lines_by_game = {
+        (
+            dt.date.fromisoformat(x["game_date"]),
+            x["home_team_abbrev"],
+            x["visit_team_abbrev"],
+        ): x
+        for x in lines.to_dict("records")
+    }
+    joined = []
+    for record in records:
+        line = lines_by_game.get(
+            (record["GAME_DATE"], record["HOME_TEAM"], record["AWAY_TEAM"])
+        )
+        if line is None:
+            continue
+        record.update(
+            {
+                "FAVORITE": line["favorite"],
+                "HOME_SCORE": line["home_team_score"],
+                "AWAY_SCORE": line["visit_team_score"],
+                "FAV_HIT": line["favorite_covered"],
+                "DIFF": line["home_team_score"] - line["visit_team_score"],
+                "GAME_TOTAL_PTS": line["total"],
+                "OVER_HIT": line["over_hit"],
+            }
+        )
+        joined.append(record)
+
+    return pd.DataFrame(joined)[features.betting_feature_columns(windows)]
+
+
+def compare(expected: pd.DataFrame, actual: pd.DataFrame) -> list:
+    if list(expected.columns) != list(actual.columns):
+        return [f"column order: {list(expected.columns)} != {list(actual.columns)}"]
+    if len(expected) != len(actual):
+        return [f"row count: {len(expected)} != {len(actual)}"]
+
+    keys = ["GAME_DATE", "HOME_TEAM", "AWAY_TEAM"]
+    expected = expected.sort_values(keys).reset_index(drop=True)
+    actual = actual.sort_values(keys).reset_index(drop=True)
+
+    mismatches = []
+    for column in expected.columns:
+        if column in keys + ["FAVORITE"]:
+            equal = expected[column].astype(str) == actual[column].astype(str)
+        else:
+            left = pd.to_numeric(expected[column]).astype(float)
+            right = pd.to_numeric(actual[column]).astype(float)
+            equal = np.isclose(left, right, rtol=0, atol=1e-9) | (
+                left.isna() & right.isna()
+            )
+        if not np.all(equal):
+            mismatches.append(
+                f"{column}: {int((~np.asarray(equal)).sum())} rows differ"
+            )
+    return mismatches
+
+
+def main():
+    gamelogs, players, lines = build_fixture()
+
+    failed = False
+    for window_ngames in [WINDOWS[0], WINDOWS]:
+        windows = features.get_windows(window_ngames)
+        expected = reference_features(gamelogs, players, lines, windows)
+        actual = features.compute_betting_features(
+            gamelogs, players, lines, window_ngames
+        )
+
+        mismatches = compare(expected, actual)
+        print(
+            f"\nwindows {windows}: {len(actual)} games, {len(mismatches)} mismatched columns"
+        )
+        for mismatch in mismatches:
+            print(f"\tMISMATCH {mismatch}")
+        failed = failed or bool(mismatches)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,6 @@
 import pandas as pd
 from utility.reference import sql
 from nba_api.stats.static import teams
-from utility.lines_model.train_and_predict import fetch_predictions
 
 TEAMS = [x["abbreviation"] for x in teams.get_teams()]
 
@@ -426,6 +425,9 @@ class LinesAnalyzer:
         if self.todays_lines.empty:
             print("\nSorry, there are no games to predict.\n")
         else:
+            # deferred so update_sql_table does not load the prediction stack
+            from utility.lines_model.train_and_predict import fetch_predictions
+
             fetch_predictions()
         self.print_separator()
 
@@ -0,0 +1,409 @@
+"""
+
+VECTORIZED BETTING FEATURES
+
+In-process equivalent of sql.fetch_aggregate_betting_data, built from the raw
+player_gamelogs, players and lines tables.
+
+"""
+
+import pandas as pd
+import numpy as np
+
+GAMELOG_COLUMNS = [
+    "SEASON_ID",
+    "Player_ID",
+    "player_name",
+    "Game_ID",
+    "GAME_DATE",
+    "TEAM",
+    "OPPONENT",
+    "HOME/AWAY",
+    "PTS",
+    "WL",
+]
+PLAYER_COLUMNS = ["PERSON_ID", "HEIGHT"]
+LINES_COLUMNS = [
+    "game_date",
+    "home_team_abbrev",
+    "visit_team_abbrev",
+    "favorite",
+    "total",
+    "over_hit",
+    "favorite_covered",
+    "home_team_score",
+    "visit_team_score",
+]
+
+# postgres rounds these features with ROUND(x, 4) / ROUND(x, 5)
+PPG_SCALE = 10**4
+HEIGHT_SCALE = 10**5
+WIN_PCT_SCALE = 10**5
+
+
+def get_windows(window_ngames: int | list) -> list:
+    if isinstance(window_ngames, (list, tuple)):
+        return [int(x) for x in window_ngames]
+    return [int(window_ngames)]
+
+
+def betting_feature_columns(window_ngames: int | list = 3) -> list:
+    windows = get_windows(window_ngames)
+
+    columns = [
+        "SEASON",
+        "GAME_DATE",
+        "HOME_TEAM",
+        "AWAY_TEAM",
+        "FAVORITE",
+        "HOME_SCORE",
+        "AWAY_SCORE",
+        "FAV_HIT",
+        "DIFF",
+        "GAME_TOTAL_PTS",
+        "OVER_HIT",
+    ]
+    for n in windows:
+        columns += [
+            f"HOME_ACTIVE_PLAYERS_LAST_{n}_PPG",
+            f"HOME_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV",
+            f"AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG",
+            f"AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV",
+        ]
+    columns += [
+        "HOME_ACTIVE_PLAYERS_SEASON_PPG",
+        "HOME_ACTIVE_PLAYERS_SEASON_POINTS_STDDEV",
+        "AWAY_ACTIVE_PLAYERS_SEASON_PPG",
+        "AWAY_ACTIVE_PLAYERS_SEASON_POINTS_STDDEV",
+        "HOME_TEAM_OPP_PPG",
+    ]
+    columns += [f"HOME_TEAM_OPP_LAST_{n}_PPG" for n in windows]
+    columns += ["AWAY_TEAM_OPP_PPG"]
+    columns += [f"AWAY_TEAM_OPP_LAST_{n}_PPG" for n in windows]
+    columns += ["HOME_TEAM_PPG_AT_HOME", "AWAY_TEAM_PPG_AWAY"]
+    for n in windows:
+        columns += [
+            f"HOME_TEAM_LAST_{n}_PPG_AT_HOME",
+            f"AWAY_TEAM_LAST_{n}_PPG_AWAY",
+        ]
+    columns += [
+        "HOME_TEAM_2ND_OF_B2B",
+        "AWAY_TEAM_2ND_OF_B2B",
+        "HOME_AVG_HEIGHT_INCHES",
+        "HOME_STDDEV_HEIGHT_INCHES",
+        "AWAY_AVG_HEIGHT_INCHES",
+        "AWAY_STDDEV_HEIGHT_INCHES",
+        "HOME_TEAM_GAMES_PLAYED",
+        "HOME_TEAM_WIN_PCT",
+        "AWAY_TEAM_GAMES_PLAYED",
+        "AWAY_TEAM_WIN_PCT",
+    ]
+
+    return columns
+
+
+def _sort_partitions(df: pd.DataFrame, partition: list, order: str):
+    group_ids = df.groupby(partition, sort=False, dropna=False).ngroup().to_numpy()
+    sort_index = np.lexsort((df[order].to_numpy(), group_ids))
+    df = df.iloc[sort_index].reset_index(drop=True)
+    group_ids = group_ids[sort_index]
+
+    positions = np.arange(len(df))
+    is_start = np.ones(len(df), dtype=bool)
+    is_start[1:] = group_ids[1:] != group_ids[:-1]
+    starts = np.maximum.accumulate(np.where(is_start, positions, 0))
+
+    return df, starts
+
+
+def _prefix_sums(values) -> tuple:
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    return (
+        np.r_[0.0, np.cumsum(filled)],
+        np.r_[0.0, np.cumsum(filled * filled)],
+        np.r_[0, np.cumsum(valid)],
+    )
+
+
+def _preceding_frame(prefix: tuple, starts, n: int | None = None) -> tuple:
+    # ROWS BETWEEN n PRECEDING AND 1 PRECEDING, or UNBOUNDED PRECEDING when n is None
+    sums, squares, counts = prefix
+    hi = np.arange(len(starts))
+    lo = starts if n is None else np.maximum(hi - n, starts)
+    return sums[hi] - sums[lo], squares[hi] - squares[lo], counts[hi] - counts[lo]
+
+
+def _round_avg(total, count, scale: int):
+    # exact ROUND(AVG(x), places) for integer valued x, half away from zero,
+    # returned in units of 1 / scale so later sums stay exact
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rounded = np.floor_divide(np.abs(total) * 2 * scale + count, 2 * count)
+    return np.where(count > 0, np.sign(total) * rounded, np.nan)
+
+
+def _round_stddev(total, squares, count, scale: int):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = (count * squares - total * total) / (count * (count - 1))
+        rounded = np.floor(np.sqrt(np.maximum(variance, 0)) * scale + 0.5)
+    return np.where(count > 1, rounded, np.nan)
+
+
+def _height_inches(players: pd.DataFrame) -> pd.DataFrame:
+    height = players["HEIGHT"].astype("string").str.split("-", expand=True)
+    feet = pd.to_numeric(height[0], errors="coerce") if 0 in height else np.nan
+    inches = pd.to_numeric(height[1], errors="coerce") if 1 in height else np.nan
+
+    return pd.DataFrame(
+        {"PERSON_ID": players["PERSON_ID"], "HEIGHT_INCHES": feet * 12 + inches}
+    )
+
+
+def _player_windows(gamelogs: pd.DataFrame, players: pd.DataFrame, windows: list):
+    logs = pd.DataFrame(
+        {
+            "GAME_DATE": pd.to_datetime(
+                gamelogs["GAME_DATE"].astype(str).str[:10], format="%Y-%m-%d"
+            ),
+            "SEASON": gamelogs["SEASON_ID"].astype(str).str[-4:].astype(int),
+            "PLAYER_ID": gamelogs["Player_ID"],
+            "PLAYER_NAME": gamelogs["player_name"],
+            "GAME_ID": gamelogs["Game_ID"],
+            "TEAM": gamelogs["TEAM"],
+            "PTS": pd.to_numeric(gamelogs["PTS"], errors="coerce").astype(float),
+            "W": (gamelogs["WL"] == "W").astype(int),
+            "L": (gamelogs["WL"] == "L").astype(int),
+            "HOME_TEAM": np.where(
+                gamelogs["HOME/AWAY"] == "HOME", gamelogs["TEAM"], gamelogs["OPPONENT"]
+            ),
+            "AWAY_TEAM": np.where(
+                gamelogs["HOME/AWAY"] == "AWAY", gamelogs["TEAM"], gamelogs["OPPONENT"]
+            ),
+        }
+    )
+    logs = logs.merge(
+        _height_inches(players), how="left", left_on="PLAYER_ID", right_on="PERSON_ID"
+    ).drop(columns="PERSON_ID")
+
+    logs, starts = _sort_partitions(
+        logs, ["SEASON", "PLAYER_NAME", "PLAYER_ID"], "GAME_DATE"
+    )
+    prefix = _prefix_sums(logs["PTS"])
+
+    for n in windows:
+        total, squares, count = _preceding_frame(prefix, starts, n)
+        logs[f"LAST_{n}_PPG"] = _round_avg(total, count, PPG_SCALE)
+        logs[f"LAST_{n}_PPG_STDDEV"] = _round_stddev(total, squares, count, PPG_SCALE)
+
+    total, squares, count = _preceding_frame(prefix, starts)
+    logs["SEASON_PPG"] = _round_avg(total, count, PPG_SCALE)
+    logs["SEASON_POINTS_STDDEV"] = _round_stddev(total, squares, count, PPG_SCALE)
+
+    return logs
+
+
+def _team_games(logs: pd.DataFrame, windows: list) -> pd.DataFrame:
+    player_features = ["SEASON_PPG", "SEASON_POINTS_STDDEV"]
+    for n in windows:
+        player_features += [f"LAST_{n}_PPG", f"LAST_{n}_PPG_STDDEV"]
+
+    logs["HEIGHT_SQ"] = logs["HEIGHT_INCHES"] ** 2
+    logs["HEIGHT_COUNT"] = logs["HEIGHT_INCHES"].notna().astype(int)
+
+    grouped = logs.groupby(
+        ["SEASON", "GAME_DATE", "GAME_ID", "TEAM", "W", "L", "HOME_TEAM", "AWAY_TEAM"],
+        sort=False,
+        dropna=False,
+    )
+    team = grouped[["PTS"] + player_features].sum(min_count=1)
+    heights = grouped[["HEIGHT_INCHES", "HEIGHT_SQ", "HEIGHT_COUNT"]].sum()
+    team = pd.concat([team, heights], axis=1).reset_index()
+
+    is_home = (team["TEAM"] == team["HOME_TEAM"]).to_numpy()
+    is_away = (team["TEAM"] == team["AWAY_TEAM"]).to_numpy()
+
+    height_avg = _round_avg(team["HEIGHT_INCHES"], team["HEIGHT_COUNT"], HEIGHT_SCALE)
+    height_std = _round_stddev(
+        team["HEIGHT_INCHES"], team["HEIGHT_SQ"], team["HEIGHT_COUNT"], HEIGHT_SCALE
+    )
+    team["HOME_AVG_HEIGHT_INCHES"] = np.where(is_home, height_avg, 0)
+    team["HOME_STDDEV_HEIGHT_INCHES"] = np.where(is_home, height_std, 0)
+    team["AWAY_AVG_HEIGHT_INCHES"] = np.where(is_away, height_avg, 0)
+    team["AWAY_STDDEV_HEIGHT_INCHES"] = np.where(is_away, height_std, 0)
+    team["HOME_PTS"] = np.where(is_home, team["PTS"], 0)
+    team["AWAY_PTS"] = np.where(is_away, team["PTS"], 0)
+
+    for column in player_features:
+        team[f"HOME_ACTIVE_PLAYERS_{column}"] = np.where(is_home, team[column], 0)
+        team[f"AWAY_ACTIVE_PLAYERS_{column}"] = np.where(is_away, team[column], 0)
+
+    team["IS_HOME"] = is_home
+    team["IS_AWAY"] = is_away
+
+    return team.drop(
+        columns=["PTS", "HEIGHT_INCHES", "HEIGHT_SQ", "HEIGHT_COUNT"] + player_features
+    )
+
+
+def _team_cumulative(team: pd.DataFrame, windows: list) -> pd.DataFrame:
+    # LAST_VALUE over the game ordered by points: NULL if either side is NULL
+    for side in ["HOME_PTS", "AWAY_PTS"]:
+        by_game = team[side].groupby(team["GAME_ID"], dropna=False)
+        has_null = team[side].isna().groupby(team["GAME_ID"], dropna=False).transform("any")
+        team[side] = by_game.transform("max").where(~has_null)
+
+    team, starts = _sort_partitions(team, ["TEAM"], "GAME_DATE")
+    previous_date = team["GAME_DATE"].shift(1).where(np.arange(len(team)) != starts)
+    back_to_back = ((team["GAME_DATE"] - previous_date).dt.days == 1).astype(int)
+    team["HOME_TEAM_2ND_OF_B2B"] = np.where(team["IS_HOME"], back_to_back, 0)
+    team["AWAY_TEAM_2ND_OF_B2B"] = np.where(team["IS_AWAY"], back_to_back, 0)
+
+    team, starts = _sort_partitions(team, ["SEASON", "TEAM"], "GAME_DATE")
+    for result, column in [("W", "CUM_WINS"), ("L", "CUM_LOSSES")]:
+        total, squares, count = _preceding_frame(_prefix_sums(team[result]), starts)
+        team[column] = np.where(count > 0, total, np.nan)
+
+    away_prefix = _prefix_sums(team["AWAY_PTS"])
+    home_prefix = _prefix_sums(team["HOME_PTS"])
+    frames = [(None, "")] + [(n, f"_LAST_{n}") for n in windows]
+    for n, label in frames:
+        total, squares, count = _preceding_frame(away_prefix, starts, n)
+        team[f"HOME_TEAM_OPP{label}_PPG"] = np.where(
+            team["IS_HOME"], _round_avg(total, count, PPG_SCALE), 0
+        )
+        total, squares, count = _preceding_frame(home_prefix, starts, n)
+        team[f"AWAY_TEAM_OPP{label}_PPG"] = np.where(
+            team["IS_AWAY"], _round_avg(total, count, PPG_SCALE), 0
+        )
+
+    team["HOME_TEAM_CUM_WINS"] = np.where(team["IS_HOME"], team["CUM_WINS"], 0)
+    team["HOME_TEAM_CUM_LOSSES"] = np.where(team["IS_HOME"], team["CUM_LOSSES"], 0)
+    team["AWAY_TEAM_CUM_WINS"] = np.where(team["IS_AWAY"], team["CUM_WINS"], 0)
+    team["AWAY_TEAM_CUM_LOSSES"] = np.where(team["IS_AWAY"], team["CUM_LOSSES"], 0)
+
+    return team
+
+
+def _per_game(team: pd.DataFrame, windows: list) -> pd.DataFrame:
+    game_keys = [
+        "SEASON",
+        "GAME_DATE",
+        "GAME_ID",
+        "HOME_TEAM",
+        "AWAY_TEAM",
+        "HOME_PTS",
+        "AWAY_PTS",
+    ]
+    cumulative = [
+        "HOME_TEAM_CUM_WINS",
+        "HOME_TEAM_CUM_LOSSES",
+        "AWAY_TEAM_CUM_WINS",
+        "AWAY_TEAM_CUM_LOSSES",
+    ]
+    summed = [
+        x
+        for x in team.columns
+        if x.startswith(("HOME_", "AWAY_"))
+        and x not in game_keys + cumulative
+        and x not in ["HOME_TEAM", "AWAY_TEAM"]
+    ]
+
+    grouped = team.groupby(game_keys, sort=False, dropna=False)
+    games = pd.concat(
+        [grouped[summed].sum(min_count=1), grouped[cumulative].max()], axis=1
+    ).reset_index()
+
+    frames = [(None, "")] + [(n, f"_LAST_{n}") for n in windows]
+    for side, team_column, label_suffix in [
+        ("HOME_PTS", "HOME_TEAM", "_AT_HOME"),
+        ("AWAY_PTS", "AWAY_TEAM", "_AWAY"),
+    ]:
+        games, starts = _sort_partitions(games, ["SEASON", team_column], "GAME_DATE")
+        prefix = _prefix_sums(games[side])
+        for n, label in frames:
+            total, squares, count = _preceding_frame(prefix, starts, n)
+            games[f"{team_column}{label}_PPG{label_suffix}"] = _round_avg(
+                total, count, PPG_SCALE
+            )
+
+    return games
+
+
+def _join_lines(games: pd.DataFrame, lines: pd.DataFrame) -> pd.DataFrame:
+    lines_formatted = pd.DataFrame(
+        {
+            "GAME_DATE": pd.to_datetime(
+                lines["game_date"].astype(str).str[:10], format="%Y-%m-%d"
+            ),
+            "HOME_TEAM": lines["home_team_abbrev"],
+            "AWAY_TEAM": lines["visit_team_abbrev"],
+            "FAVORITE": lines["favorite"],
+            "GAME_TOTAL_PTS": lines["total"],
+            "OVER_HIT": pd.to_numeric(lines["over_hit"], errors="coerce").astype(float),
+            "FAV_HIT": lines["favorite_covered"],
+            "HOME_SCORE": lines["home_team_score"],
+            "AWAY_SCORE": lines["visit_team_score"],
+        }
+    ).dropna(subset=["GAME_DATE", "HOME_TEAM", "AWAY_TEAM"])
+
+    # NULL join keys never match in postgres
+    games = games.dropna(subset=["GAME_DATE", "HOME_TEAM", "AWAY_TEAM"])
+    merged = games.merge(lines_formatted, on=["GAME_DATE", "HOME_TEAM", "AWAY_TEAM"])
+    merged["DIFF"] = merged["HOME_SCORE"] - merged["AWAY_SCORE"]
+
+    return merged
+
+
+def _unscale(merged: pd.DataFrame, windows: list) -> pd.DataFrame:
+    height_columns = [
+        "HOME_AVG_HEIGHT_INCHES",
+        "HOME_STDDEV_HEIGHT_INCHES",
+        "AWAY_AVG_HEIGHT_INCHES",
+        "AWAY_STDDEV_HEIGHT_INCHES",
+    ]
+    ppg_columns = [
+        x
+        for x in betting_feature_columns(windows)
+        if "PPG" in x or "POINTS_STDDEV" in x
+    ]
+    for column in ppg_columns:
+        merged[column] = merged[column] / PPG_SCALE
+    for column in height_columns:
+        merged[column] = merged[column] / HEIGHT_SCALE
+
+    for side in ["HOME", "AWAY"]:
+        wins = merged[f"{side}_TEAM_CUM_WINS"]
+        games_played = wins + merged[f"{side}_TEAM_CUM_LOSSES"]
+        merged[f"{side}_TEAM_GAMES_PLAYED"] = games_played
+        merged[f"{side}_TEAM_WIN_PCT"] = (
+            np.where(
+                games_played.fillna(0) != 0,
+                _round_avg(wins, games_played, WIN_PCT_SCALE),
+                np.nan,
+            )
+            / WIN_PCT_SCALE
+        )
+
+    merged["GAME_DATE"] = merged["GAME_DATE"].dt.date
+
+    return merged
+
+
+def compute_betting_features(
+    gamelogs: pd.DataFrame,
+    players: pd.DataFrame,
+    lines: pd.DataFrame,
+    window_ngames: int | list = 3,
+) -> pd.DataFrame:
+    windows = get_windows(window_ngames)
+
+    logs = _player_windows(gamelogs, players, windows)
+    team = _team_games(logs, windows)
+    team = _team_cumulative(team, windows)
+    games = _per_game(team, windows)
+    merged = _join_lines(games, lines)
+    merged = _unscale(merged, windows)
+
+    return merged[betting_feature_columns(windows)].reset_index(drop=True)
+
@@ -0,0 +1,147 @@
+"""
+
+FITTED MODEL REGISTRY
+
+"""
+
+from utility.reference import sql
+import datetime as dt
+import tempfile
+import hashlib
+import pickle
+import json
+import os
+
+REGISTRY_DIR = os.getenv(
+    "model_registry_dir", os.path.join(tempfile.gettempdir(), "nba_stuff_models")
+)
+# older versions of each model are pruned once more than this many are saved
+REGISTRY_KEEP = int(os.getenv("model_registry_keep", 5))
+
+# bump when the features or targets a model is trained on change, so artifacts
+# fitted by older code are never reloaded
+REGISTRY_VERSION = 2
+
+
+def training_fingerprint(name: str, window_ngames: int, tables: list) -> str | None:
+    """
+    Hashes the versions of the tables the training data is read from, which
+    every load bumps in its own transaction, so the fingerprint changes whenever
+    new rows land. Returns None if a table does not exist yet.
+    """
+    table_versions = sql.get_table_versions(tables)
+    if set(table_versions) != set(tables):
+        return None
+
+    payload = json.dumps(
+        {
+            "name": name,
+            "window_ngames": window_ngames,
+            "tables": table_versions,
+            "version": REGISTRY_VERSION,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _model_dir(name: str) -> str:
+    return os.path.join(REGISTRY_DIR, name)
+
+
+def _artifact_path(name: str, fingerprint: str) -> str:
+    return os.path.join(_model_dir(name), f"{fingerprint}.pkl")
+
+
+def load(name: str, fingerprint: str) -> dict | None:
+    path = _artifact_path(name, fingerprint)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            artifact = pickle.load(f)
+    except Exception as e:
+        print(f"\nDiscarding unreadable {name} model {fingerprint}: {e}")
+        os.remove(path)
+        return None
+
+    # a model pickled by another scikit-learn release may not predict the same
+    import sklearn
+
+    if artifact["sklearn_version"] != sklearn.__version__:
+        return None
+
+    return artifact
+
+
+def save(
+    name: str,
+    fingerprint: str,
+    model,
+    features: list,
+    window_ngames: int,
+    training_rows: int,
+) -> dict:
+    import sklearn
+
+    artifact = {
+        "name": name,
+        "fingerprint": fingerprint,
+        "model": model,
+        "features": list(features),
+        "window_ngames": window_ngames,
+        "training_rows": training_rows,
+        "trained_at": dt.datetime.now().isoformat(timespec="seconds"),
+        "sklearn_version": sklearn.__version__,
+    }
+
+    path = _artifact_path(name, fingerprint)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    staging_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(staging_path, "wb") as f:
+        pickle.dump(artifact, f)
+
+    os.replace(staging_path, path)
+    prune(name)
+
+    return artifact
+
+
+def prune(name: str, keep: int = REGISTRY_KEEP) -> None:
+    model_dir = _model_dir(name)
+    if not os.path.isdir(model_dir):
+        return
+
+    artifacts = sorted(
+        (x for x in os.listdir(model_dir) if x.endswith(".pkl")),
+        key=lambda x: os.stat(os.path.join(model_dir, x)).st_mtime,
+        reverse=True,
+    )
+    for artifact in artifacts[keep:]:
+        os.remove(os.path.join(model_dir, artifact))
+
+
+def get_or_train(name: str, window_ngames: int, tables: list, train) -> dict:
+    """
+    Returns the saved artifact for name if the training tables are unchanged
+    since it was fitted. Otherwise calls train(), which returns
+    (model, features, training_rows), and saves the result as a new version.
+    """
+    fingerprint = training_fingerprint(name, window_ngames, tables)
+    if fingerprint is not None:
+        artifact = load(name, fingerprint)
+        if artifact is not None:
+            print(
+                f"\nLoaded {name} model trained {artifact['trained_at']} "
+                f"on {artifact['training_rows']} games."
+            )
+            return artifact
+
+    print(f"\nTraining {name} model...")
+    model, features, training_rows = train()
+    if fingerprint is None:
+        return {"model": model, "features": list(features), "training_rows": training_rows}
+
+    return save(name, fingerprint, model, features, window_ngames, training_rows)
@@ -5,7 +5,9 @@ import requests
 import datetime as dt
 from nba_api.stats.endpoints.leaguestandings import LeagueStandings as ls
 from utility.reference import sql, injury_scraper as inj
-from sklearn.linear_model import LinearRegression
+from utility.lines_model.features import get_windows
+from utility.lines_model import model_registry
+from functools import cache
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
@@ -13,16 +15,23 @@ HEADERS = {
     "Referer": "google.com",
 }
 
+# the models are trained on the materialized features, so they only need
+# retraining after refresh_betting_features writes to this table
+TRAINING_TABLES = [f"{sql.FEATURES_SCHEMA}.{sql.FEATURES_TABLE}"]
+
+# fitted together as one multi-output model, in this column order
+TARGETS = ["GAME_TOTAL_PTS", "DIFF", "HOME_SCORE", "AWAY_SCORE"]
+PREDICTION_COLUMNS = {
+    "GAME_TOTAL_PTS": "PREDICTED_POINT_TOTAL",
+    "DIFF": "PREDICTED_DIFF",
+    "HOME_SCORE": "PREDICTED_HOME_PTS",
+    "AWAY_SCORE": "PREDICTED_AWAY_PTS",
+}
 
-def get_x_y(training_data: pd.DataFrame, model, window_ngames: int = 3):
-    training_data.replace(r"^\s*$", np.nan, regex=True, inplace=True)
-    training_data.dropna(inplace=True)
-    training_data = training_data.loc[
-        (training_data["HOME_TEAM_GAMES_PLAYED"] >= 5)
-        & (training_data["AWAY_TEAM_GAMES_PLAYED"] >= 5)
-    ]
 
-    predictors = [
+def get_predictors(window_ngames: int = 3) -> list:
+    # training_data may hold several LAST_{n}_ blocks, only this window is used
+    return [
         f"HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
         f"HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
         f"AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
@@ -51,18 +60,59 @@ def get_x_y(training_data: pd.DataFrame, model, window_ngames: int = 3):
         "AWAY_STDDEV_HEIGHT_INCHES",
     ]
 
-    if model == "ou":
-        y = "GAME_TOTAL_PTS"
-    elif model == "lines":
-        y = "DIFF"
 
-    return training_data[predictors], training_data[y]
+def build_training_matrix(training_data: pd.DataFrame, window_ngames: int = 3):
+    """
+    Cleans training_data once and returns read-only float64 arrays X and Y
+    (one column per TARGETS entry), with the predictor names. training_data is
+    not modified.
+    """
+    predictors = get_predictors(window_ngames)
+    required = [
+        x
+        for x in training_data.columns
+        if "_LAST_" not in x or f"_LAST_{window_ngames}_" in x
+    ]
+
+    # blank strings count as missing, only text columns can hold them
+    missing = training_data[required].isna()
+    for column in required:
+        if not pd.api.types.is_numeric_dtype(training_data[column]):
+            missing[column] |= training_data[column].map(
+                lambda x: isinstance(x, str) and not x.strip()
+            )
+
+    keep = (
+        ~missing.any(axis=1)
+        & (training_data["HOME_TEAM_GAMES_PLAYED"] >= 5)
+        & (training_data["AWAY_TEAM_GAMES_PLAYED"] >= 5)
+    )
+
+    X = training_data.loc[keep, predictors].to_numpy(dtype=np.float64)
+    Y = training_data.loc[keep, TARGETS].to_numpy(dtype=np.float64)
+    X.flags.writeable = False
+    Y.flags.writeable = False
+
+    return X, Y, predictors
+
+
+def train_model(training_data, window_ngames: int = 3):
+    # sklearn is only imported when a model is trained, not by the ingestion path
+    from sklearn.linear_model import LinearRegression
 
+    X, Y, predictors = build_training_matrix(training_data, window_ngames)
 
-def train_model(training_data, model):
-    X, y = get_x_y(training_data, model)
+    # one least squares fit per target, all sharing a single factorization of X
+    return LinearRegression().fit(X, Y), predictors, len(X)
 
-    return LinearRegression().fit(X, y), X.columns
+
+def get_trained_model(get_training_data, window_ngames: int = 3):
+    return model_registry.get_or_train(
+        f"lines_ou_last_{window_ngames}",
+        window_ngames,
+        TRAINING_TABLES,
+        lambda: train_model(get_training_data(), window_ngames),
+    )
 
 
 def get_todays_lineups():
@@ -133,70 +183,82 @@ def cross_ref_injury_report(lineups_df):
     ]
 
 
-def get_active_player_data():
+def get_active_player_data(window_ngames: int | list = 3):
     lineups_df = get_todays_lineups()
     active_players = cross_ref_injury_report(lineups_df)
-    active_player_df = sql.agg_active_player_new_x_data(active_players)
+    active_player_df = sql.agg_active_player_new_x_data(active_players, window_ngames)
     active_player_df["STDDEV_HEIGHT_INCHES"] = active_player_df["HEIGHT_INCHES"]
 
+    aggregations = {}
+    for n in get_windows(window_ngames):
+        aggregations[f"LAST_{n}_PPG"] = "sum"
+        aggregations[f"LAST_{n}_PPG_STDDEV"] = "sum"
+    aggregations.update(
+        {
+            "SEASON_PPG": "sum",
+            "SEASON_PPG_STDDEV": "sum",
+            "HEIGHT_INCHES": "mean",
+            "STDDEV_HEIGHT_INCHES": "std",
+        }
+    )
+
     return (
         active_player_df.drop(
-            columns=["Player_ID", "player_name", "GAME_DATE", "SEASON_YEAR", "rn"]
+            columns=["Player_ID", "player_name", "GAME_DATE", "SEASON_YEAR"]
         )
         .groupby("TEAM_ID", as_index=False)
-        .agg(
-            {
-                "LAST_3_PPG": "sum",
-                "LAST_3_PPG_STDDEV": "sum",
-                "SEASON_PPG": "sum",
-                "SEASON_PPG_STDDEV": "sum",
-                "HEIGHT_INCHES": "mean",
-                "STDDEV_HEIGHT_INCHES": "std",
-            }
-        )
+        .agg(aggregations)
     )
 
 
 def filter_and_align_x_data(
-    merged_df: pd.DataFrame, todays_lines: pd.DataFrame, window_ngames: int = 3
+    merged_df: pd.DataFrame, todays_lines: pd.DataFrame, window_ngames: int | list = 3
 ):
-    window_ngames = str(window_ngames)
+    windows = get_windows(window_ngames)
     merged_columns_enum = {
         "SEASON_PPG": "ACTIVE_PLAYERS_SEASON_PPG",
-        f"LAST_{window_ngames}_PPG": f"ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
         "SEASON_OPP_PPG": "TEAM_OPP_PPG",
-        f"LAST_{window_ngames}_OPP_PPG": f"TEAM_OPP_LAST_{window_ngames}_PPG",
         "SEASON_PPG_AWAY": "TEAM_PPG_AWAY",
-        f"LAST_{window_ngames}_PPG_AWAY": f"TEAM_LAST_{window_ngames}_PPG_AWAY",
         "SEASON_PPG_HOME": "TEAM_PPG_AT_HOME",
-        f"LAST_{window_ngames}_PPG_HOME": f"TEAM_LAST_{window_ngames}_PPG_AT_HOME",
-        f"LAST_{window_ngames}_PPG_STDDEV": f"ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
         "SEASON_PPG_STDDEV": "ACTIVE_PLAYERS_SEASON_POINTS_STDDEV",
         "HEIGHT_INCHES": "AVG_HEIGHT_INCHES",
     }
+    for n in windows:
+        merged_columns_enum.update(
+            {
+                f"LAST_{n}_PPG": f"ACTIVE_PLAYERS_LAST_{n}_PPG",
+                f"LAST_{n}_OPP_PPG": f"TEAM_OPP_LAST_{n}_PPG",
+                f"LAST_{n}_PPG_AWAY": f"TEAM_LAST_{n}_PPG_AWAY",
+                f"LAST_{n}_PPG_HOME": f"TEAM_LAST_{n}_PPG_AT_HOME",
+                f"LAST_{n}_PPG_STDDEV": f"ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV",
+            }
+        )
 
-    keep_columns = [
-        "gameDate",
-        "homeTeam",
-        "awayTeam",
-        "OVER_UNDER",
-        "LINE",
-        f"HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
-        f"HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
-        f"AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
-        f"AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
+    keep_columns = ["gameDate", "homeTeam", "awayTeam", "OVER_UNDER", "LINE"]
+    for n in windows:
+        keep_columns += [
+            f"HOME_ACTIVE_PLAYERS_LAST_{n}_PPG",
+            f"HOME_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV",
+            f"AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG",
+            f"AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV",
+        ]
+    keep_columns += [
         "HOME_ACTIVE_PLAYERS_SEASON_PPG",
         "HOME_ACTIVE_PLAYERS_SEASON_POINTS_STDDEV",
         "AWAY_ACTIVE_PLAYERS_SEASON_PPG",
         "AWAY_ACTIVE_PLAYERS_SEASON_POINTS_STDDEV",
         "HOME_TEAM_OPP_PPG",
-        f"HOME_TEAM_OPP_LAST_{window_ngames}_PPG",
-        "AWAY_TEAM_OPP_PPG",
-        f"AWAY_TEAM_OPP_LAST_{window_ngames}_PPG",
-        "HOME_TEAM_PPG_AT_HOME",
-        "AWAY_TEAM_PPG_AWAY",
-        f"HOME_TEAM_LAST_{window_ngames}_PPG_AT_HOME",
-        f"AWAY_TEAM_LAST_{window_ngames}_PPG_AWAY",
+    ]
+    keep_columns += [f"HOME_TEAM_OPP_LAST_{n}_PPG" for n in windows]
+    keep_columns += ["AWAY_TEAM_OPP_PPG"]
+    keep_columns += [f"AWAY_TEAM_OPP_LAST_{n}_PPG" for n in windows]
+    keep_columns += ["HOME_TEAM_PPG_AT_HOME", "AWAY_TEAM_PPG_AWAY"]
+    for n in windows:
+        keep_columns += [
+            f"HOME_TEAM_LAST_{n}_PPG_AT_HOME",
+            f"AWAY_TEAM_LAST_{n}_PPG_AWAY",
+        ]
+    keep_columns += [
         "HOME_TEAM_2ND_OF_B2B",
         "AWAY_TEAM_2ND_OF_B2B",
         "HOME_TEAM_GAMES_PLAYED",
@@ -230,29 +292,28 @@ def filter_and_align_x_data(
     return todays_lines[keep_columns]
 
 
-def fetch_new_x_data():
+def fetch_new_x_data(window_ngames: int | list = 3):
     print("\nGetting new X data...")
-    active_player_agg_data = get_active_player_data()
-    team_agg_data = sql.agg_team_new_x_data()
+    active_player_agg_data = get_active_player_data(window_ngames)
+    team_agg_data = sql.agg_team_new_x_data(window_ngames)
     todays_lines = get_todays_lines()
 
     merged = merge_data(team_agg_data, active_player_agg_data)
 
-    return filter_and_align_x_data(merged, todays_lines)
+    return filter_and_align_x_data(merged, todays_lines, window_ngames)
 
 
-def get_ou_predictions(training_data, new_x):
-    print("\nTraining OU model...")
-    reg_out_linear_ou, predictors = train_model(training_data, "ou")
-    print("\nMaking OU predictions...")
-    return reg_out_linear_ou.predict(new_x[list(predictors)])
-
-
-def get_lines_predictions(training_data, new_x):
-    print("\nTraining lines model...")
-    reg_out_linear_lines, predictors = train_model(training_data, "lines")
-    print("\nMaking lines predictions...")
-    return reg_out_linear_lines.predict(new_x[list(predictors)])
+def get_predictions(get_training_data, new_x, window_ngames: int = 3):
+    lines_model = get_trained_model(get_training_data, window_ngames)
+    print("\nMaking OU, lines and team total predictions...")
+    predictions = lines_model["model"].predict(
+        new_x[lines_model["features"]].to_numpy(dtype=np.float64)
+    )
+    return pd.DataFrame(
+        predictions,
+        columns=[PREDICTION_COLUMNS[x] for x in TARGETS],
+        index=new_x.index,
+    )
 
 
 def get_todays_lines():
@@ -331,21 +392,30 @@ def merge_data(team_data, player_data):
     return merged
 
 
-def fetch_predictions():
+def fetch_predictions(window_ngames: int = 3):
     today = dt.date.today()
-    print("\nGrabbing training data...")
-    training_data = sql.fetch_aggregate_betting_data()
-    new_x_data = fetch_new_x_data()
 
-    ou_predictions = get_ou_predictions(training_data, new_x_data)
-    lines_predictions = get_lines_predictions(training_data, new_x_data)
+    # only loaded if a saved model is missing or out of date
+    @cache
+    def get_training_data():
+        print("\nGrabbing training data...")
+        return sql.fetch_aggregate_betting_data(window_ngames, materialized=True)
+
+    new_x_data = fetch_new_x_data(window_ngames)
 
-    new_x_data["PREDICTED_POINT_TOTAL"] = ou_predictions
-    new_x_data["PREDICTED_DIFF"] = lines_predictions
+    predictions = get_predictions(get_training_data, new_x_data, window_ngames)
+    new_x_data[list(predictions.columns)] = predictions
 
     lines_pred_df = new_x_data[["homeTeam", "awayTeam", "LINE", "PREDICTED_DIFF"]]
     ou_pred_df = new_x_data[
-        ["homeTeam", "awayTeam", "OVER_UNDER", "PREDICTED_POINT_TOTAL"]
+        [
+            "homeTeam",
+            "awayTeam",
+            "OVER_UNDER",
+            "PREDICTED_POINT_TOTAL",
+            "PREDICTED_HOME_PTS",
+            "PREDICTED_AWAY_PTS",
+        ]
     ]
 
     print(f"OU Predictions: \n\n{ou_pred_df}")
@@ -0,0 +1,168 @@
+"""
+
+CHECKPOINTED BATCH RUNNER
+
+"""
+
+from utility.reference import sql
+from datetime import date
+import argparse
+import zlib
+import os
+
+PROGRESS_SCHEMA = "nba_general"
+PROGRESS_TABLE = "batch_progress"
+
+SHARD_ID = int(os.getenv("batch_shard_id", 0))
+SHARD_COUNT = int(os.getenv("batch_shard_count", 1))
+# None means the default, today's date, worked out when a run starts
+RUN_ID = os.getenv("batch_run_id") or None
+
+
+def default_run_id() -> str:
+    # a run id scopes the checkpoints, so the default lets a timed out refresh
+    # resume the same day while tomorrow's refresh starts from a clean slate.
+    # it is read per run rather than at import so a warm Lambda container
+    # that outlives midnight does not keep yesterday's checkpoints
+    return RUN_ID or str(date.today())
+
+
+def configure(settings: dict | None = None) -> None:
+    """
+    Sets the shard and run settings, e.g. from a Lambda event like
+    {"shard_id": 0, "shard_count": 4, "run_id": "backfill-1979"}. Settings
+    missing from settings fall back to the environment, so one invocation's
+    event never leaks into the next one in a warm container.
+    """
+    global SHARD_ID, SHARD_COUNT, RUN_ID
+    settings = settings or {}
+    SHARD_ID = int(os.getenv("batch_shard_id", 0))
+    SHARD_COUNT = int(os.getenv("batch_shard_count", 1))
+    RUN_ID = os.getenv("batch_run_id") or None
+    if settings.get("shard_id") is not None:
+        SHARD_ID = int(settings["shard_id"])
+    if settings.get("shard_count") is not None:
+        SHARD_COUNT = int(settings["shard_count"])
+    if settings.get("run_id") is not None:
+        RUN_ID = str(settings["run_id"])
+
+    if not 0 <= SHARD_ID < SHARD_COUNT:
+        raise ValueError(f"shard_id must be in [0, {SHARD_COUNT}), got {SHARD_ID}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shard-id", type=int)
+    parser.add_argument("--shard-count", type=int)
+    parser.add_argument("--run-id")
+    args, _ = parser.parse_known_args(argv)
+    configure(
+        {
+            "shard_id": args.shard_id,
+            "shard_count": args.shard_count,
+            "run_id": args.run_id,
+        }
+    )
+    return args
+
+
+def ensure_progress_table() -> None:
+    sql.execute_database_operations(
+        f"""
+        CREATE TABLE IF NOT EXISTS {PROGRESS_SCHEMA}.{PROGRESS_TABLE} (
+            "job" TEXT NOT NULL,
+            "run_id" TEXT NOT NULL,
+            "unit" TEXT NOT NULL,
+            "shard_id" INTEGER NOT NULL,
+            "completed_at" TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY ("job", "run_id", "unit")
+        );
+        """
+    )
+
+
+def completed_units(job: str, run_id: str) -> set:
+    query = f"""
+    SELECT "unit"
+    FROM {PROGRESS_SCHEMA}.{PROGRESS_TABLE}
+    WHERE "job" = %(job)s AND "run_id" = %(run_id)s;
+    """
+    done = sql.convert_sql_to_df(query=query, params={"job": job, "run_id": run_id})
+    return set(done["unit"])
+
+
+def mark_completed(job: str, run_id: str, units: list, shard_id: int) -> None:
+    with sql.get_connection().begin() as con:
+        con.exec_driver_sql(
+            f"""
+            INSERT INTO {PROGRESS_SCHEMA}.{PROGRESS_TABLE}
+                ("job", "run_id", "unit", "shard_id")
+            SELECT %(job)s, %(run_id)s, UNNEST(%(units)s::text[]), %(shard_id)s
+            ON CONFLICT DO NOTHING;
+            """,
+            {"job": job, "run_id": run_id, "units": units, "shard_id": shard_id},
+        )
+
+
+def in_shard(unit: str, shard_id: int, shard_count: int) -> bool:
+    # crc32 rather than hash() so every process agrees on the split
+    return zlib.crc32(unit.encode()) % shard_count == shard_id
+
+
+def run_batches(
+    job: str,
+    units: list,
+    batch_size: int,
+    process,
+    unit_key=str,
+    checkpoint=None,
+    shard_id: int | None = None,
+    shard_count: int | None = None,
+    run_id: str | None = None,
+) -> None:
+    """
+    Runs process(batch) over this shard's share of units, batch_size units at a
+    time, skipping units already completed in this run. process returns the
+    units of the batch it finished, and only those are checkpointed once it
+    returns, so a killed run resumes from the last finished batch and a unit
+    whose fetch failed is retried. Units for which checkpoint(unit) is False,
+    such as a season that is still being played, are never checkpointed and
+    so run again every time.
+    """
+    shard_id = SHARD_ID if shard_id is None else shard_id
+    shard_count = SHARD_COUNT if shard_count is None else shard_count
+    run_id = default_run_id() if run_id is None else run_id
+
+    ensure_progress_table()
+    done = completed_units(job, run_id)
+
+    remaining = [
+        unit
+        for unit in units
+        if in_shard(unit_key(unit), shard_id, shard_count)
+        and unit_key(unit) not in done
+    ]
+    number_of_batches = -(-len(remaining) // batch_size)
+
+    print(
+        f"\n{job} run {run_id} shard {shard_id + 1}/{shard_count}: "
+        f"{len(remaining)} units left in {number_of_batches} batches..."
+    )
+
+    for x in range(0, number_of_batches):
+        batch = remaining[x * batch_size : (x + 1) * batch_size]
+        print(f"\nRunning {job} batch {x + 1} out of {number_of_batches}...\n")
+
+        succeeded = process(batch)
+        finished = [
+            unit_key(unit)
+            for unit in succeeded
+            if checkpoint is None or checkpoint(unit)
+        ]
+        if len(succeeded) < len(batch):
+            print(
+                f"\n{len(batch) - len(succeeded)} {job} units failed and will be "
+                "retried on the next run..."
+            )
+        if finished:
+            mark_completed(job, run_id, finished, shard_id)
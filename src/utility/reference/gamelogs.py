@@ -0,0 +1,56 @@
+"""
+
+GAMELOG RESPONSE HELPERS
+
+"""
+
+import pandas as pd
+
+# PlayerGameLog returns "OCT 25, 2023", LeagueGameLog returns "2023-10-25"
+PLAYER_LOG_DATE_FORMAT = "%b %d, %Y"
+LEAGUE_LOG_DATE_FORMAT = "%Y-%m-%d"
+
+
+def to_game_key(game_id) -> int:
+    # "0022300001", "22300001" and 22300001 all map to 22300001
+    return int(str(game_id))
+
+
+def to_api_game_id(game_key) -> str:
+    # the api expects the ten digit id, e.g. 0022300001
+    return str(int(game_key)).zfill(10)
+
+
+def logs_to_df(responses, headers=None, result_set=0):
+    """
+    Builds one frame from the rowSets of a list of nba_api endpoint responses.
+    headers defaults to those of the first response.
+    """
+    rows = []
+    for response in responses:
+        result = response.get_dict()["resultSets"][result_set]
+        if headers is None:
+            headers = result["headers"]
+        rows.extend(result["rowSet"])
+
+    return pd.DataFrame(rows, columns=headers)
+
+
+def split_matchup(df, column="MATCHUP"):
+    """
+    Adds TEAM, OPPONENT and HOME/AWAY from matchups like "BOS vs. LAL" or
+    "BOS @ LAL".
+    """
+    if df.empty:
+        return df.assign(**{"TEAM": None, "OPPONENT": None, "HOME/AWAY": None})
+
+    parts = df[column].str.split(" ", expand=True)
+    df["TEAM"] = parts[0]
+    df["OPPONENT"] = parts[parts.columns[-1]]
+    df["HOME/AWAY"] = parts[1].eq("@").map({True: "AWAY", False: "HOME"})
+
+    return df
+
+
+def parse_game_dates(dates, date_format=PLAYER_LOG_DATE_FORMAT):
+    return pd.to_datetime(dates, format=date_format)
@@ -0,0 +1,92 @@
+"""
+
+VERSIONED DATABASE MIGRATIONS
+
+"""
+
+from utility.reference import sql
+
+MIGRATIONS_SCHEMA = "nba_general"
+MIGRATIONS_TABLE = "schema_migrations"
+
+# api game id column of every table that stores per-game rows
+GAME_ID_COLUMNS = {
+    "player_gamelogs": "Game_ID",
+    "team_gamelogs": "GAME_ID",
+    "play_by_play": "gameId",
+    "player_advanced_metrics": "game_id",
+    "team_advanced_metrics": "game_id",
+    "player_misc_metrics": "game_id",
+    "team_misc_metrics": "game_id",
+}
+
+# the keys each loader upserts on, which ON CONFLICT needs a unique index for
+UPSERT_KEYS = {
+    "player_gamelogs": ["Game_ID", "Player_ID"],
+    "play_by_play": ["gameId", "actionNumber", "SEASON"],
+    "player_misc_metrics": ["game_id", "player_id"],
+    "team_misc_metrics": ["game_id"],
+}
+
+
+def add_game_keys():
+    for table_name, id_column in GAME_ID_COLUMNS.items():
+        print(f"\tAdding game_key to {table_name}...")
+        sql.ensure_game_key(table_name, id_column, "nba_gamelogs")
+
+
+def partition_play_by_play():
+    sql.ensure_play_by_play_table()
+
+
+def add_upsert_keys():
+    # duplicates left by older append-only loads would fail the index build
+    for table_name, keys in UPSERT_KEYS.items():
+        print(f"\tAdding the unique key on {keys} to {table_name}...")
+        deleted = sql.ensure_unique_key(table_name, "nba_gamelogs", keys)
+        if deleted:
+            print(f"\t\tDeleted {deleted} duplicate rows.")
+
+
+# applied in order, each at most once; append new migrations to the end
+MIGRATIONS = [
+    ("0001_canonical_game_key", add_game_keys),
+    ("0002_partition_play_by_play", partition_play_by_play),
+    ("0003_upsert_unique_keys", add_upsert_keys),
+]
+
+
+def applied_migrations() -> set:
+    sql.execute_database_operations(
+        f"""
+        CREATE SCHEMA IF NOT EXISTS {MIGRATIONS_SCHEMA};
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_SCHEMA}.{MIGRATIONS_TABLE} (
+            "migration" TEXT PRIMARY KEY,
+            "applied_at" TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """
+    )
+    applied = sql.convert_sql_to_df(
+        query=f'SELECT "migration" FROM {MIGRATIONS_SCHEMA}.{MIGRATIONS_TABLE};'
+    )
+    return set(applied["migration"])
+
+
+def migrate() -> None:
+    applied = applied_migrations()
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+
+        print(f"\nApplying migration {name}...")
+        migration()
+        with sql.get_connection().begin() as con:
+            con.exec_driver_sql(
+                f'INSERT INTO {MIGRATIONS_SCHEMA}.{MIGRATIONS_TABLE} ("migration") '
+                "VALUES (%(migration)s) ON CONFLICT DO NOTHING;",
+                {"migration": name},
+            )
+
+
+if __name__ == "__main__":
+    migrate()
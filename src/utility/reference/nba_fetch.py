@@ -0,0 +1,218 @@
+"""
+
+RATE LIMITED NBA STATS FETCH CLIENT
+
+"""
+
+from nba_api.stats.library.http import NBAStatsHTTP, NBAStatsResponse
+from utility.reference import response_archive
+from utility.logger import get_struct_logger
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+import requests
+import threading
+import argparse
+import json
+import random
+import time
+import os
+
+# stats.nba.com starts refusing connections somewhere above ~2 requests/sec
+REQUESTS_PER_SECOND = float(os.getenv("nba_api_requests_per_second", 2))
+BURST = int(os.getenv("nba_api_burst", 2))
+MAX_WORKERS = int(os.getenv("nba_api_max_workers", 4))
+MAX_ATTEMPTS = int(os.getenv("nba_api_max_attempts", 5))
+BACKOFF_SECONDS = float(os.getenv("nba_api_backoff_seconds", 1))
+MAX_BACKOFF_SECONDS = 30
+
+# connection failures, timeouts, throttling and server errors, and bodies cut
+# off mid-response are transient. anything else (a bad parameter, a result set
+# that is not where the parser expects it) is a bug and is raised, not retried
+RETRY_EXCEPTIONS = (requests.exceptions.RequestException, json.JSONDecodeError)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+log = get_struct_logger()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_BUCKET = TokenBucket(REQUESTS_PER_SECOND, BURST)
+_SESSION_LOCK = threading.Lock()
+_SESSION = None
+_REPLAY = False
+
+
+def get_session() -> requests.Session:
+    # one keep-alive session shared by every nba_api endpoint in the process
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=max(MAX_WORKERS, 1), max_retries=0
+            )
+            _SESSION.mount("https://", adapter)
+            _SESSION.mount("http://", adapter)
+            # nba_api parses any body it gets back, so an error status is
+            # raised here before its page is mistaken for a response
+            _SESSION.hooks["response"].append(raise_for_status)
+            NBAStatsHTTP.set_session(_SESSION)
+        return _SESSION
+
+
+def raise_for_status(response: requests.Response, *args, **kwargs) -> None:
+    response.raise_for_status()
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRY_STATUS_CODES
+    return True
+
+
+def backoff(attempt: int) -> float:
+    # full jitter, so retrying workers do not hit the api in lockstep
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2**attempt))
+
+
+def set_replay(enabled: bool) -> None:
+    # replay serves every call from the response archive and never hits the api
+    global _REPLAY
+    _REPLAY = enabled
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="rebuild from archived api responses instead of requesting them",
+    )
+    args, _ = parser.parse_known_args(argv)
+    set_replay(args.replay)
+    return args
+
+
+def replay(endpoint, key: str, **kwargs):
+    response = response_archive.load(endpoint.__name__, key)
+    if response is None:
+        log.warning("response not archived", endpoint=endpoint.__name__, params=kwargs)
+        return None
+
+    try:
+        instance = endpoint(**kwargs, get_request=False)
+        instance.nba_response = NBAStatsResponse(
+            response=response, status_code=200, url=None
+        )
+        instance.load_response()
+    except json.JSONDecodeError as e:
+        log.warning(
+            "archived response is not valid json",
+            endpoint=endpoint.__name__,
+            params=kwargs,
+            error=str(e),
+        )
+        return None
+
+    return instance
+
+
+def fetch(endpoint, bucket: TokenBucket = _BUCKET, **kwargs):
+    key = response_archive.archive_key(endpoint.__name__, kwargs)
+    if _REPLAY:
+        return replay(endpoint, key, **kwargs)
+
+    get_session()
+    for attempt in range(MAX_ATTEMPTS):
+        bucket.acquire()
+        try:
+            instance = endpoint(**kwargs)
+        except RETRY_EXCEPTIONS as e:
+            if not is_retryable(e):
+                raise
+            if attempt == MAX_ATTEMPTS - 1:
+                log.error(
+                    "nba_api call failed",
+                    endpoint=endpoint.__name__,
+                    params=kwargs,
+                    attempts=MAX_ATTEMPTS,
+                    error=str(e),
+                )
+                return None
+            delay = backoff(attempt)
+            log.warning(
+                "nba_api call failed, retrying",
+                endpoint=endpoint.__name__,
+                params=kwargs,
+                attempt=attempt + 1,
+                delay=round(delay, 1),
+                error=str(e),
+            )
+            time.sleep(delay)
+            continue
+
+        try:
+            response_archive.save(
+                endpoint.__name__, key, instance.nba_response.get_response()
+            )
+        except OSError as e:
+            # the archive is a convenience, a full or unwritable disk must not
+            # fail the fetch that already succeeded
+            log.warning(
+                "could not archive response",
+                endpoint=endpoint.__name__,
+                params=kwargs,
+                error=str(e),
+            )
+        return instance
+
+
+def fetch_all(calls, max_workers: int = MAX_WORKERS, bucket: TokenBucket = _BUCKET):
+    """
+    calls is an iterable of (key, endpoint, kwargs). Yields (key, endpoint
+    instance) as each request completes, with None in place of the instance once
+    a call has used up its retries on transient errors. Any other error a call
+    raises is re-raised here.
+
+    Only max_workers calls are in flight at a time and a response is released
+    once it has been yielded, so memory does not grow with the number of calls.
+    """
+    calls = iter(calls)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+
+        def submit_next() -> None:
+            for key, endpoint, kwargs in calls:
+                futures[executor.submit(fetch, endpoint, bucket, **kwargs)] = key
+                return
+
+        for _ in range(max_workers):
+            submit_next()
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = futures.pop(future)
+                submit_next()
+                yield key, future.result()
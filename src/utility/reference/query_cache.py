@@ -0,0 +1,106 @@
+"""
+
+LOCAL QUERY RESULT CACHE
+
+"""
+
+import pandas as pd
+import tempfile
+import hashlib
+import json
+import os
+import re
+
+CACHE_DIR = os.getenv(
+    "query_cache_dir", os.path.join(tempfile.gettempdir(), "nba_stuff_query_cache")
+)
+CACHE_MAX_BYTES = int(os.getenv("query_cache_max_mb", 512)) * 1024 * 1024
+
+SOURCE_TABLE_PATTERN = re.compile(
+    r'(?:FROM|JOIN)\s+"?([A-Za-z_]\w*)"?\s*\.\s*"?([A-Za-z_]\w*)"?', re.IGNORECASE
+)
+
+
+def normalize_sql(query: str) -> str:
+    return " ".join(query.split())
+
+
+def source_tables(query: str) -> list:
+    # CTE names are never schema qualified, so only real tables match
+    return sorted(
+        {f"{schema}.{table}" for schema, table in SOURCE_TABLE_PATTERN.findall(query)}
+    )
+
+
+def cache_key(query: str, table_versions: dict, params: dict | None = None) -> str:
+    payload = json.dumps(
+        {"sql": normalize_sql(query), "tables": table_versions, "params": params},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+
+def load(key: str) -> pd.DataFrame | None:
+    path = _cache_path(key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        df = pd.read_parquet(path)
+    except Exception as e:
+        print(f"\nDiscarding unreadable cache entry {key}: {e}")
+        os.remove(path)
+        return None
+
+    # bump the access time so eviction is least recently used
+    os.utime(path)
+    return df
+
+
+def save(key: str, df: pd.DataFrame) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_path(key)
+    staging_path = f"{path}.{os.getpid()}.tmp"
+
+    try:
+        df.to_parquet(staging_path, index=False)
+    except Exception as e:
+        print(f"\nResult could not be cached as parquet: {e}")
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+        return
+
+    os.replace(staging_path, path)
+    evict()
+
+
+def evict(max_bytes: int = CACHE_MAX_BYTES) -> None:
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".parquet"):
+            stat = os.stat(os.path.join(CACHE_DIR, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(x[1] for x in entries)
+    for mtime, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(os.path.join(CACHE_DIR, name))
+        total -= size
+
+
+def clear() -> None:
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".parquet"):
+            os.remove(os.path.join(CACHE_DIR, name))
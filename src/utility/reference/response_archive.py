@@ -0,0 +1,114 @@
+"""
+
+RAW NBA API RESPONSE ARCHIVE
+
+"""
+
+import threading
+import tempfile
+import hashlib
+import gzip
+import json
+import os
+
+# off unless asked for: on Lambda the temp dir is a small ephemeral volume that
+# does not outlive the invocation, so point nba_api_archive_dir at persistent
+# storage (e.g. a mounted EFS path) when turning it on
+ARCHIVE_ENABLED = os.getenv("nba_api_archive", "false").lower() == "true"
+ARCHIVE_DIR = os.getenv(
+    "nba_api_archive_dir",
+    os.path.join(tempfile.gettempdir(), "nba_stuff_api_archive"),
+)
+# the oldest entries are evicted once the archive grows past this
+ARCHIVE_MAX_BYTES = int(os.getenv("nba_api_archive_max_mb", 256)) * 1024 * 1024
+
+_SIZE_LOCK = threading.Lock()
+_archive_bytes = None
+
+
+def archive_key(endpoint_name: str, params: dict) -> str:
+    payload = json.dumps(
+        {"endpoint": endpoint_name, "params": params}, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _archive_path(endpoint_name: str, key: str) -> str:
+    return os.path.join(ARCHIVE_DIR, endpoint_name, key[:2], f"{key}.json.gz")
+
+
+def load(endpoint_name: str, key: str) -> str | None:
+    path = _archive_path(endpoint_name, key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+    except (OSError, EOFError) as e:
+        print(f"\nDiscarding unreadable archive entry {key}: {e}")
+        os.remove(path)
+        return None
+
+
+def save(endpoint_name: str, key: str, response: str) -> None:
+    if not ARCHIVE_ENABLED:
+        return
+
+    path = _archive_path(endpoint_name, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    staging_path = f"{path}.{os.getpid()}.{os.urandom(4).hex()}.tmp"
+
+    try:
+        with gzip.open(staging_path, "wt", encoding="utf-8") as f:
+            f.write(response)
+        os.replace(staging_path, path)
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+
+    _track(os.path.getsize(path))
+
+
+def _entries() -> list:
+    entries = []
+    for root, _, names in os.walk(ARCHIVE_DIR):
+        for name in names:
+            if name.endswith(".json.gz"):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def _track(size: int) -> None:
+    # the archive is walked once per process, then its size is kept as a
+    # running total so every save does not rescan it
+    global _archive_bytes
+    with _SIZE_LOCK:
+        if _archive_bytes is None:
+            _archive_bytes = sum(x[1] for x in _entries())
+        else:
+            _archive_bytes += size
+
+        if _archive_bytes > ARCHIVE_MAX_BYTES:
+            _archive_bytes = evict()
+
+
+def evict(max_bytes: int = ARCHIVE_MAX_BYTES) -> int:
+    """
+    Removes the oldest entries until the archive is back under 90% of
+    max_bytes, so eviction does not rerun on every save. Returns the size left.
+    """
+    entries = _entries()
+    total = sum(x[1] for x in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes * 0.9:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+    return total
@@ -1,25 +1,207 @@
 import psycopg as ps
+from psycopg import sql as pgsql
+from utility.reference import query_cache
+from utility.lines_model.features import (
+    GAMELOG_COLUMNS,
+    PLAYER_COLUMNS,
+    LINES_COLUMNS,
+    betting_feature_columns,
+    compute_betting_features,
+    get_windows,
+)
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 import getpass
 from dotenv import load_dotenv
+from functools import partial, cache
+from decimal import Decimal
+import threading
+import time
+import uuid
+import csv
+import io
 import os
 
 load_dotenv()
 
-USER = os.environ["sql_username"]
-PASSWORD = os.environ["aws_rds_pass"]
-HOST = os.environ["sql_host"]
-PORT = os.environ["sql_port"]
-DATABASE = os.environ["database"]
+# pool settings can be overridden in the .env file
+POOL_SIZE = int(os.getenv("sql_pool_size", 5))
+POOL_MAX_OVERFLOW = int(os.getenv("sql_pool_max_overflow", 5))
+POOL_TIMEOUT = int(os.getenv("sql_pool_timeout", 30))
+POOL_RECYCLE = int(os.getenv("sql_pool_recycle", 1800))
+STATEMENT_TIMEOUT_MS = int(os.getenv("sql_statement_timeout_ms", 0))
 
+# frames with at least this many rows are loaded with COPY instead of INSERT
+BULK_LOAD_THRESHOLD = int(os.getenv("sql_bulk_load_threshold", 10000))
+COPY_CHUNKSIZE = 50000
+COPY_BUFFER_ROWS = 5000
+COPY_NULL = "\\N"
 
-def get_connection():
-    return create_engine(
-        url="postgresql+psycopg://{0}:{1}@{2}:{3}/{4}".format(
-            USER, PASSWORD, HOST, PORT, DATABASE
-        )
+# rows pulled per round-trip by server-side cursors
+FETCH_SIZE = int(os.getenv("sql_fetch_size", 10000))
+
+# heap pages backfilled per transaction when game_key is added to a table
+GAME_KEY_BACKFILL_PAGES = int(os.getenv("game_key_backfill_pages", 1000))
+
+FEATURES_SCHEMA = "nba_features"
+FEATURES_TABLE = "betting_features"
+
+# one row per table, bumped by every write helper below in the same transaction
+# as its write, so query cache keys and model fingerprints follow the data
+VERSIONS_SCHEMA = "nba_general"
+VERSIONS_TABLE = "table_versions"
+
+_ENGINE = None
+_ENGINE_PID = None
+_ENGINE_LOCK = threading.Lock()
+# updated from every thread that touches the pool
+_POOL_STATS_LOCK = threading.Lock()
+POOL_STATS = {
+    "connects": 0,
+    "checkouts": 0,
+    "checkins": 0,
+    "invalidations": 0,
+    "max_overflow_seen": 0,
+    "checkout_waits": 0,
+    "checkout_wait_seconds": 0.0,
+    "max_checkout_wait_seconds": 0.0,
+    "checkout_timeouts": 0,
+}
+
+
+def _record_pool_stat(name: str, increment=1) -> None:
+    with _POOL_STATS_LOCK:
+        POOL_STATS[name] += increment
+
+
+class TimedQueuePool(QueuePool):
+    """
+    A QueuePool that times checkouts made while every connection is in use,
+    i.e. the time a caller spends blocked until another thread checks one in,
+    and counts the checkouts that give up after sql_pool_timeout.
+    """
+
+    def _do_get(self):
+        saturated = self.checkedout() >= self.size() + self._max_overflow
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            _record_pool_stat("checkout_timeouts")
+            raise
+        finally:
+            if saturated:
+                waited = time.perf_counter() - start
+                with _POOL_STATS_LOCK:
+                    POOL_STATS["checkout_waits"] += 1
+                    POOL_STATS["checkout_wait_seconds"] += waited
+                    POOL_STATS["max_checkout_wait_seconds"] = max(
+                        POOL_STATS["max_checkout_wait_seconds"], waited
+                    )
+
+
+def _register_pool_listeners(engine):
+    # dispose() swaps in a new pool that inherits these listeners, so a listener
+    # must read the pool a connection came from rather than engine.pool as it
+    # was at registration
+    pool = engine.pool
+
+    @event.listens_for(pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        _record_pool_stat("connects")
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with _POOL_STATS_LOCK:
+            POOL_STATS["checkouts"] += 1
+            POOL_STATS["max_overflow_seen"] = max(
+                POOL_STATS["max_overflow_seen"], connection_proxy._pool.overflow()
+            )
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        _record_pool_stat("checkins")
+
+    @event.listens_for(pool, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        _record_pool_stat("invalidations")
+
+
+@cache
+def get_credentials() -> dict:
+    # resolved on the first connection rather than on import, so modules that
+    # import sql load without database env vars
+    return {
+        "user": os.environ["sql_username"],
+        "password": os.environ["aws_rds_pass"],
+        "host": os.environ["sql_host"],
+        "port": os.environ["sql_port"],
+        "database": os.environ["database"],
+    }
+
+
+def _create_engine():
+    connect_args = {}
+    if STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+
+    engine = create_engine(
+        url="postgresql+psycopg://{user}:{password}@{host}:{port}/{database}".format(
+            **get_credentials()
+        ),
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=True,
+        poolclass=TimedQueuePool,
+        connect_args=connect_args,
     )
+    _register_pool_listeners(engine)
+
+    return engine
+
+
+def get_connection():
+    global _ENGINE, _ENGINE_PID
+
+    if _ENGINE is None or _ENGINE_PID != os.getpid():
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                _ENGINE = _create_engine()
+            elif _ENGINE_PID != os.getpid():
+                # a forked child must not reuse the parent's sockets
+                _ENGINE.dispose(close=False)
+            _ENGINE_PID = os.getpid()
+
+    return _ENGINE
+
+
+def dispose_connection():
+    global _ENGINE, _ENGINE_PID
+
+    with _ENGINE_LOCK:
+        if _ENGINE is not None:
+            _ENGINE.dispose()
+        _ENGINE = None
+        _ENGINE_PID = None
+
+
+def get_pool_stats() -> dict:
+    with _POOL_STATS_LOCK:
+        stats = dict(POOL_STATS)
+    stats["handshakes_saved"] = stats["checkouts"] - stats["connects"]
+
+    if _ENGINE is not None:
+        stats["pool_size"] = _ENGINE.pool.size()
+        stats["checked_in"] = _ENGINE.pool.checkedin()
+        stats["checked_out"] = _ENGINE.pool.checkedout()
+        stats["overflow"] = _ENGINE.pool.overflow()
+
+    return stats
+
 
 def execute_database_operations(statement: str):
     with get_connection().connect() as con:
@@ -27,11 +209,319 @@ def execute_database_operations(statement: str):
         con.commit() 
 
 
+def _qualified_table(table_name: str, schema: str | None = None):
+    if schema:
+        return pgsql.Identifier(schema, table_name)
+    return pgsql.Identifier(table_name)
+
+
+@cache
+def ensure_table_versions() -> None:
+    execute_database_operations(
+        f"""
+        CREATE SCHEMA IF NOT EXISTS {VERSIONS_SCHEMA};
+        CREATE TABLE IF NOT EXISTS {VERSIONS_SCHEMA}.{VERSIONS_TABLE} (
+            "schema" TEXT NOT NULL,
+            "table" TEXT NOT NULL,
+            "version" BIGINT NOT NULL,
+            "updated_at" TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY ("schema", "table")
+        );
+        """
+    )
+
+
+def bump_table_version(dbapi_connection, table_name: str, schema: str) -> None:
+    """
+    Increments the version of schema.table_name. Call it inside the transaction
+    that writes the table, last, so the row lock is held only until commit and
+    the new version is visible exactly when the rows are. Writes made outside
+    these helpers must call it too, or cached results of the table go stale.
+    """
+    ensure_table_versions()
+    with dbapi_connection.cursor() as cursor:
+        cursor.execute(
+            pgsql.SQL(
+                'INSERT INTO {} AS versions ("schema", "table", "version") '
+                "VALUES (%(schema)s, %(table)s, 1) "
+                'ON CONFLICT ("schema", "table") DO UPDATE '
+                'SET "version" = versions."version" + 1, "updated_at" = now()'
+            ).format(pgsql.Identifier(VERSIONS_SCHEMA, VERSIONS_TABLE)),
+            {"schema": schema, "table": table_name},
+        )
+
+
+def _get_column_type_oids(cursor, table, columns: list) -> list:
+    cursor.execute(
+        """
+        SELECT attname, atttypid::int
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        """,
+        (table.as_string(cursor),),
+    )
+    type_oids = dict(cursor.fetchall())
+    return [type_oids[column] for column in columns]
+
+
+def copy_rows(
+    dbapi_connection,
+    table_name: str,
+    schema: str | None,
+    columns: list,
+    rows,
+    copy_format: str = "csv",
+) -> int:
+    table = _qualified_table(table_name, schema)
+    column_list = pgsql.SQL(", ").join(pgsql.Identifier(c) for c in columns)
+    row_count = 0
+
+    with dbapi_connection.cursor() as cursor:
+        if copy_format == "binary":
+            # binary COPY must match the column types of the target table exactly
+            column_types = _get_column_type_oids(cursor, table, columns)
+            statement = pgsql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+                table, column_list
+            )
+            with cursor.copy(statement) as copy:
+                copy.set_types(column_types)
+                for row in rows:
+                    copy.write_row(row)
+                    row_count += 1
+        elif copy_format == "csv":
+            statement = pgsql.SQL(
+                "COPY {} ({}) FROM STDIN (FORMAT CSV, NULL {})"
+            ).format(table, column_list, pgsql.Literal(COPY_NULL))
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            with cursor.copy(statement) as copy:
+                for row in rows:
+                    writer.writerow([COPY_NULL if x is None else x for x in row])
+                    row_count += 1
+                    if row_count % COPY_BUFFER_ROWS == 0:
+                        copy.write(buffer.getvalue())
+                        buffer.seek(0)
+                        buffer.truncate()
+                copy.write(buffer.getvalue())
+        else:
+            raise ValueError(f"Unsupported copy format: {copy_format}")
+
+    return row_count
+
+
+def _copy_method(pd_table, conn, keys, data_iter, copy_format: str = "csv"):
+    # called by DataFrame.to_sql once per chunk, inside its transaction
+    return copy_rows(
+        conn.connection.driver_connection,
+        pd_table.name,
+        pd_table.schema,
+        list(keys),
+        data_iter,
+        copy_format=copy_format,
+    )
+
+
+def _frame_rows(df: pd.DataFrame):
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def _unique_key_statement(table_name: str, schema: str | None, keys: list):
+    index_name = f"{table_name}_{'_'.join(keys)}_key".lower()[:63]
+    return pgsql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})").format(
+        pgsql.Identifier(index_name),
+        _qualified_table(table_name, schema),
+        pgsql.SQL(", ").join(pgsql.Identifier(k) for k in keys),
+    )
+
+
+def ensure_unique_key(table_name: str, schema: str, keys: list) -> int:
+    """
+    Deletes all but one row of every group sharing the same keys, then adds the
+    unique index upsert_df_to_sql's ON CONFLICT needs, in one transaction.
+    Returns the number of duplicates deleted. Does nothing if the table is
+    missing. Takes a lock that blocks loads, so it is run by migration 0003
+    rather than by the loaders.
+    """
+    if not _table_exists(table_name, schema):
+        return 0
+
+    target = _qualified_table(table_name, schema)
+    key_list = pgsql.SQL(", ").join(pgsql.Identifier(k) for k in keys)
+    # rows with a NULL key never conflict, so they are left alone. tableoid
+    # tells apart rows of different partitions that share a ctid
+    dedupe = pgsql.SQL(
+        "DELETE FROM {target} WHERE (tableoid, ctid) IN ("
+        "SELECT tableoid, ctid FROM ("
+        "SELECT tableoid, ctid, "
+        "ROW_NUMBER() OVER (PARTITION BY {keys} ORDER BY tableoid, ctid DESC) AS n "
+        "FROM {target} WHERE {not_null}"
+        ") AS ranked WHERE n > 1)"
+    ).format(
+        target=target,
+        keys=key_list,
+        not_null=pgsql.SQL(" AND ").join(
+            pgsql.SQL("{} IS NOT NULL").format(pgsql.Identifier(k)) for k in keys
+        ),
+    )
+
+    with get_connection().begin() as con:
+        with con.connection.driver_connection.cursor() as cursor:
+            cursor.execute(dedupe)
+            deleted = cursor.rowcount
+            cursor.execute(_unique_key_statement(table_name, schema, keys))
+        if deleted:
+            bump_table_version(con.connection.driver_connection, table_name, schema)
+
+    return deleted
+
+
+def upsert_df_to_sql(
+    df: pd.DataFrame,
+    table_name: str,
+    schema: str,
+    keys: list,
+    copy_format: str = "csv",
+    dtype: dict | None = None,
+) -> int:
+    columns = list(df.columns)
+    missing_keys = [k for k in keys if k not in columns]
+    if missing_keys:
+        raise ValueError(f"Upsert keys {missing_keys} are not columns of the frame")
+
+    target = _qualified_table(table_name, schema)
+    stage = pgsql.Identifier(f"{table_name}_stage")
+    column_list = pgsql.SQL(", ").join(pgsql.Identifier(c) for c in columns)
+    key_list = pgsql.SQL(", ").join(pgsql.Identifier(k) for k in keys)
+    update_columns = [c for c in columns if c not in keys]
+
+    if update_columns:
+        conflict_action = pgsql.SQL(
+            "DO UPDATE SET ({cols}) = ROW({excluded}) WHERE ({current}) IS DISTINCT FROM ({excluded})"
+        ).format(
+            cols=pgsql.SQL(", ").join(pgsql.Identifier(c) for c in update_columns),
+            excluded=pgsql.SQL(", ").join(
+                pgsql.Identifier("excluded", c) for c in update_columns
+            ),
+            current=pgsql.SQL(", ").join(
+                pgsql.Identifier(table_name, c) for c in update_columns
+            ),
+        )
+    else:
+        conflict_action = pgsql.SQL("DO NOTHING")
+
+    # existing tables get their unique index from migration 0003, so a load
+    # runs no DDL against them and never blocks a concurrent load
+    new_table = not _table_exists(table_name, schema)
+
+    with get_connection().begin() as con:
+        dbapi_connection = con.connection.driver_connection
+        if new_table:
+            # creates the target table and its unique index on the first load
+            df.head(0).to_sql(
+                name=table_name,
+                con=con,
+                schema=schema,
+                if_exists="append",
+                index=False,
+                dtype=dtype,
+            )
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(_unique_key_statement(table_name, schema, keys))
+
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(
+                pgsql.SQL(
+                    "CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP"
+                ).format(stage, target)
+            )
+
+        copy_rows(
+            dbapi_connection,
+            f"{table_name}_stage",
+            None,
+            columns,
+            _frame_rows(df),
+            copy_format=copy_format,
+        )
+
+        # DISTINCT ON keeps a batch with repeated keys from conflicting with itself
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(
+                pgsql.SQL(
+                    "INSERT INTO {target} AS {alias} ({cols}) "
+                    "SELECT DISTINCT ON ({keys}) {cols} FROM {stage} "
+                    "ON CONFLICT ({keys}) {action}"
+                ).format(
+                    target=target,
+                    alias=pgsql.Identifier(table_name),
+                    cols=column_list,
+                    keys=key_list,
+                    stage=stage,
+                    action=conflict_action,
+                )
+            )
+            changed = cursor.rowcount
+
+        if changed:
+            bump_table_version(dbapi_connection, table_name, schema)
+        return changed
+
+
+def replace_rows_df_to_sql(
+    df: pd.DataFrame,
+    table_name: str,
+    schema: str,
+    column: str,
+    values: list,
+    copy_format: str = "csv",
+    dtype: dict | None = None,
+) -> int:
+    """
+    Deletes the rows of schema.table_name whose column is in values and loads
+    df in their place in one transaction, so a failed load keeps the old rows.
+    """
+    with get_connection().begin() as con:
+        # creates the target table on the first load
+        df.head(0).to_sql(
+            name=table_name,
+            con=con,
+            schema=schema,
+            if_exists="append",
+            index=False,
+            dtype=dtype,
+        )
+
+        dbapi_connection = con.connection.driver_connection
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(
+                pgsql.SQL("DELETE FROM {} WHERE {} = ANY(%(values)s)").format(
+                    _qualified_table(table_name, schema), pgsql.Identifier(column)
+                ),
+                {"values": list(values)},
+            )
+
+        rows = copy_rows(
+            dbapi_connection,
+            table_name,
+            schema,
+            list(df.columns),
+            _frame_rows(df),
+            copy_format=copy_format,
+        )
+        bump_table_version(dbapi_connection, table_name, schema)
+        return rows
+
+
 def export_df_to_sql(
     df: pd.DataFrame,
     table_name: str | None = None,
     schema: str | None = None,
     behavior: str | None = None,
+    method: str | None = None,
+    copy_format: str = "csv",
+    chunksize: int | None = None,
+    dtype: dict | None = None,
+    keys: list | None = None,
 ) -> None:
 
     if table_name == None:
@@ -40,6 +530,21 @@ def export_df_to_sql(
     if schema == None:
         schema = input("\nEnter schema to import into: ")
 
+    if behavior == "upsert":
+        if not keys:
+            raise ValueError("behavior='upsert' requires keys")
+        start = time.perf_counter()
+        changed = upsert_df_to_sql(
+            df, table_name, schema, keys, copy_format=copy_format, dtype=dtype
+        )
+        elapsed = time.perf_counter() - start
+        print(f"\n{table_name} successfully upserted into {schema}.")
+        print(
+            f"\t{changed} of {len(df)} rows inserted or changed in {elapsed:.2f}s "
+            f"({len(df) / max(elapsed, 1e-9):,.0f} rows/sec via upsert)"
+        )
+        return
+
     if behavior not in ["replace", "append", "fail"]:
         valid = False
         while valid == False:
@@ -53,20 +558,90 @@ def export_df_to_sql(
             else:
                 print("\nEnter a valid option.")
 
-    df.to_sql(
-        name=table_name,
-        con=get_connection(),
-        schema=schema,
-        if_exists=behavior,
-        index=False,
-    )
+    if method is None:
+        method = "copy" if len(df) >= BULK_LOAD_THRESHOLD else "insert"
+
+    if method == "copy":
+        to_sql_method = partial(_copy_method, copy_format=copy_format)
+        chunksize = chunksize or COPY_CHUNKSIZE
+    elif method == "insert":
+        to_sql_method = None
+    else:
+        raise ValueError(f"Unsupported export method: {method}")
+
+    start = time.perf_counter()
+    with get_connection().begin() as con:
+        df.to_sql(
+            name=table_name,
+            con=con,
+            schema=schema,
+            if_exists=behavior,
+            index=False,
+            method=to_sql_method,
+            chunksize=chunksize,
+            dtype=dtype,
+        )
+        bump_table_version(con.connection.driver_connection, table_name, schema)
+    elapsed = time.perf_counter() - start
 
     print(f"\n{table_name} successfully imported into {schema}.")
+    print(
+        f"\t{len(df)} rows in {elapsed:.2f}s "
+        f"({len(df) / max(elapsed, 1e-9):,.0f} rows/sec via {method})"
+    )
+
+
+def get_table_versions(tables: list) -> dict:
+    # the relids of the table and its partitions change when it is replaced or
+    # repartitioned, and the version row when it is written. Both are catalog or
+    # table rows, so unlike the statistics counters they are transactional and
+    # survive a stats reset, a crash or a failover. Missing tables are left out
+    ensure_table_versions()
+    query = pgsql.SQL(
+        """
+    SELECT
+        requested."table",
+        (
+            -- pg_partition_tree returns nothing for a plain table
+            SELECT ARRAY_AGG("relid"::bigint ORDER BY "relid")
+            FROM (
+                SELECT to_regclass(requested."table") AS "relid"
+                UNION
+                SELECT "relid" FROM pg_partition_tree(to_regclass(requested."table"))
+            ) AS tree
+        ) AS "relids",
+        (
+            -- a partition is written through its parent, which holds the version
+            SELECT COALESCE(SUM(versions."version"), 0)::bigint
+            FROM (
+                SELECT to_regclass(requested."table") AS "relid"
+                UNION
+                SELECT "relid" FROM pg_partition_ancestors(to_regclass(requested."table"))
+            ) AS lineage
+            JOIN pg_class AS class ON class.oid = lineage."relid"
+            JOIN pg_namespace AS namespace ON namespace.oid = class.relnamespace
+            JOIN {versions} AS versions
+                ON versions."schema" = namespace.nspname
+                AND versions."table" = class.relname
+        ) AS "version"
+    FROM UNNEST(%(tables)s::text[]) AS requested("table")
+    WHERE to_regclass(requested."table") IS NOT NULL
+    """
+    ).format(versions=pgsql.Identifier(VERSIONS_SCHEMA, VERSIONS_TABLE))
+    with get_connection().connect() as con:
+        with con.connection.driver_connection.cursor() as cursor:
+            cursor.execute(query, {"tables": list(tables)})
+            return {row[0]: list(row[1:]) for row in cursor.fetchall()}
 
 
 def convert_sql_to_df(
-    table_name: str | None = None, schema: str | None = None, query: bool = False
+    table_name: str | None = None,
+    schema: str | None = None,
+    query: bool = False,
+    cache: bool = False,
+    params: dict | None = None,
 ):
+    # params use psycopg's %(name)s placeholder style, as in stream_sql_to_df
     if (table_name == None) and (query == False):
         table_name = input("\nEnter table name: ")
 
@@ -77,13 +652,164 @@ def convert_sql_to_df(
         return pd.read_sql_table(
             table_name=table_name, con=get_connection(), schema=schema
         )
+
+    tables = query_cache.source_tables(query) if cache else []
+    table_versions = get_table_versions(tables) if tables else {}
+    # a missing source table would give the same key whatever it later holds
+    if not tables or set(table_versions) != set(tables):
+        return pd.read_sql(sql=query, con=get_connection(), params=params)
+
+    key = query_cache.cache_key(query, table_versions, params)
+    df = query_cache.load(key)
+    if df is None:
+        df = pd.read_sql(sql=query, con=get_connection(), params=params)
+        query_cache.save(key, df)
+
+    return df
+
+
+def stream_sql_to_df(
+    table_name: str | None = None,
+    schema: str | None = None,
+    query: str | None = None,
+    columns: list | None = None,
+    where: str | None = None,
+    params: dict | None = None,
+    fetch_size: int = FETCH_SIZE,
+):
+    # query, where and params use psycopg's %(name)s placeholder style
+    if query is None:
+        if table_name is None:
+            raise ValueError("stream_sql_to_df needs a table_name or a query")
+
+        select_list = (
+            pgsql.SQL(", ").join(pgsql.Identifier(c) for c in columns)
+            if columns
+            else pgsql.SQL("*")
+        )
+        statement = pgsql.SQL("SELECT {} FROM {}").format(
+            select_list, _qualified_table(table_name, schema)
+        )
+        if where:
+            statement = pgsql.SQL("{} WHERE {}").format(statement, pgsql.SQL(where))
     else:
-        return pd.read_sql(sql=query, con=get_connection())
+        statement = query
 
+    with get_connection().connect() as con:
+        dbapi_connection = con.connection.driver_connection
+        with dbapi_connection.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = fetch_size
+            cursor.execute(statement, params)
+            column_names = [x.name for x in cursor.description]
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield pd.DataFrame.from_records(rows, columns=column_names)
 
-def fetch_aggregate_betting_data(window_ngames: int = 3, training: bool = True):
-    window_ngames = str(window_ngames)
-    query = f"""
+
+def _betting_features_query(
+    window_ngames: int | list = 3, seasons: list | None = None
+) -> str:
+    # every frame size shares the same named window, so postgres sorts each
+    # partition once no matter how many windows are requested
+    windows = get_windows(window_ngames)
+    # every window below is partitioned by season, so filtering seasons up front is exact
+    season_filter = (
+        f"""WHERE RIGHT(pg_cleaned."SEASON_ID", 4)::numeric IN ({", ".join(str(int(x)) for x in seasons)})"""
+        if seasons
+        else ""
+    )
+
+    def per_window(template: str) -> str:
+        return "".join(template.format(n=n) for n in windows)
+
+    player_windows = per_window(
+        """
+		ROUND(AVG(pg_cleaned."PTS") OVER (player_season
+			ROWS BETWEEN {n} PRECEDING AND 1 PRECEDING
+		), 4) AS "LAST_{n}_PPG",
+		ROUND(STDDEV(pg_cleaned."PTS") OVER (player_season
+			ROWS BETWEEN {n} PRECEDING AND 1 PRECEDING
+		), 4) AS "LAST_{n}_PPG_STDDEV","""
+    )
+    team_player_sums = per_window(
+        """
+		CASE
+			WHEN gamelogs_formatted."PLAYER_TEAM" = gamelogs_formatted."HOME_TEAM" 
+				THEN SUM(gamelogs_formatted."LAST_{n}_PPG") ELSE 0
+					END AS "HOME_ACTIVE_PLAYERS_LAST_{n}_PPG",
+		CASE
+			WHEN gamelogs_formatted."PLAYER_TEAM" = gamelogs_formatted."HOME_TEAM" 
+				THEN SUM(gamelogs_formatted."LAST_{n}_PPG_STDDEV") ELSE 0
+					END AS "HOME_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV",
+		CASE
+			WHEN gamelogs_formatted."PLAYER_TEAM" = gamelogs_formatted."AWAY_TEAM" 
+				THEN SUM(gamelogs_formatted."LAST_{n}_PPG") ELSE 0
+					END AS "AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG",
+		CASE
+			WHEN gamelogs_formatted."PLAYER_TEAM" = gamelogs_formatted."AWAY_TEAM" 
+				THEN SUM(gamelogs_formatted."LAST_{n}_PPG_STDDEV") ELSE 0
+					END AS "AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV","""
+    )
+    team_player_columns = per_window(
+        """
+		"HOME_ACTIVE_PLAYERS_LAST_{n}_PPG",
+		"HOME_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV",
+		"AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG",
+		"AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV","""
+    )
+    home_opp_windows = per_window(
+        """
+		(CASE WHEN "TEAM" = "HOME_TEAM" THEN (ROUND(AVG("AWAY_PTS") OVER (team_season
+				ROWS BETWEEN {n} PRECEDING AND 1 PRECEDING
+				), 4)) ELSE 0 END) AS "HOME_TEAM_OPP_LAST_{n}_PPG","""
+    )
+    away_opp_windows = per_window(
+        """
+		(CASE WHEN "TEAM" = "AWAY_TEAM" THEN (ROUND(AVG("HOME_PTS") OVER (team_season
+				ROWS BETWEEN {n} PRECEDING AND 1 PRECEDING
+				), 4)) ELSE 0 END) AS "AWAY_TEAM_OPP_LAST_{n}_PPG","""
+    )
+    pergame_player_sums = per_window(
+        """
+		SUM("HOME_ACTIVE_PLAYERS_LAST_{n}_PPG") AS "HOME_ACTIVE_PLAYERS_LAST_{n}_PPG",
+		SUM("HOME_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV") AS "HOME_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV",
+		SUM("AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG") AS "AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG",
+		SUM("AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV") AS "AWAY_ACTIVE_PLAYERS_LAST_{n}_PPG_STDDEV","""
+    )
+    pergame_home_opp_sums = per_window(
+        """
+		SUM("HOME_TEAM_OPP_LAST_{n}_PPG") AS "HOME_TEAM_OPP_LAST_{n}_PPG","""
+    )
+    pergame_away_opp_sums = per_window(
+        """
+		SUM("AWAY_TEAM_OPP_LAST_{n}_PPG") AS "AWAY_TEAM_OPP_LAST_{n}_PPG","""
+    )
+    pergame_venue_windows = per_window(
+        """
+		(ROUND(AVG("HOME_PTS") OVER (home_season
+				ROWS BETWEEN {n} PRECEDING AND 1 PRECEDING
+				), 4)) AS "HOME_TEAM_LAST_{n}_PPG_AT_HOME",
+		(ROUND(AVG("AWAY_PTS") OVER (away_season
+				ROWS BETWEEN {n} PRECEDING AND 1 PRECEDING
+				), 4)) AS "AWAY_TEAM_LAST_{n}_PPG_AWAY","""
+    )
+    home_opp_columns = per_window(
+        """
+		"HOME_TEAM_OPP_LAST_{n}_PPG","""
+    )
+    away_opp_columns = per_window(
+        """
+		"AWAY_TEAM_OPP_LAST_{n}_PPG","""
+    )
+    venue_columns = per_window(
+        """
+		"HOME_TEAM_LAST_{n}_PPG_AT_HOME",
+		"AWAY_TEAM_LAST_{n}_PPG_AWAY","""
+    )
+
+    return f"""
    WITH lines_formatted AS (
 	SELECT
 		to_date("game_date", 'YYYY-MM-DD') AS "GAME_DATE",
@@ -116,25 +842,11 @@ pg_cleaned as (
 		player_height."HEIGHT_INCHES" AS "HEIGHT_INCHES",
 		pg_cleaned."Game_ID" AS "GAME_ID",
 		pg_cleaned."TEAM" AS "PLAYER_TEAM",
-		pg_cleaned."PTS" AS "PLAYER_PTS",
-		ROUND(AVG(pg_cleaned."PTS") OVER (
-			PARTITION BY RIGHT(pg_cleaned."SEASON_ID", 4)::numeric, pg_cleaned."player_name", pg_cleaned."Player_ID"
-			ORDER BY pg_cleaned."GAME_DATE"
-			ROWS BETWEEN {window_ngames} PRECEDING AND 1 PRECEDING
-		), 4) AS "LAST_{window_ngames}_PPG",
-		ROUND(STDDEV(pg_cleaned."PTS") OVER (
-			PARTITION BY RIGHT(pg_cleaned."SEASON_ID", 4)::numeric, pg_cleaned."player_name", pg_cleaned."Player_ID"
-			ORDER BY pg_cleaned."GAME_DATE"
-			ROWS BETWEEN {window_ngames} PRECEDING AND 1 PRECEDING
-		), 4) AS "LAST_{window_ngames}_PPG_STDDEV",
-		ROUND(AVG(pg_cleaned."PTS") OVER(
-			PARTITION BY RIGHT(pg_cleaned."SEASON_ID", 4)::numeric, pg_cleaned."player_name", pg_cleaned."Player_ID"
-			ORDER BY pg_cleaned."GAME_DATE"
+		pg_cleaned."PTS" AS "PLAYER_PTS",{player_windows}
+		ROUND(AVG(pg_cleaned."PTS") OVER (player_season
 			ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
 		), 4) AS "SEASON_PPG",
-		ROUND(STDDEV(pg_cleaned."PTS") OVER(
-			PARTITION BY RIGHT(pg_cleaned."SEASON_ID", 4)::numeric, pg_cleaned."player_name", pg_cleaned."Player_ID"
-			ORDER BY pg_cleaned."GAME_DATE"
+		ROUND(STDDEV(pg_cleaned."PTS") OVER (player_season
 			ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
 		), 4) AS "SEASON_POINTS_STDDEV",
 		CASE WHEN pg_cleaned."WL" = 'W' THEN 1 ELSE 0 END AS "W",
@@ -144,6 +856,11 @@ pg_cleaned as (
 	FROM nba_gamelogs.player_gamelogs as pg_cleaned
 	LEFT JOIN player_height
 	ON player_height."PERSON_ID" = pg_cleaned."Player_ID"
+	{season_filter}
+	WINDOW player_season AS (
+		PARTITION BY RIGHT(pg_cleaned."SEASON_ID", 4)::numeric, pg_cleaned."player_name", pg_cleaned."Player_ID"
+		ORDER BY pg_cleaned."GAME_DATE"
+	)
 ),
 gamelogs_formatted as (
 	SELECT
@@ -174,23 +891,7 @@ gamelogs_formatted as (
 		CASE
 			WHEN gamelogs_formatted."PLAYER_TEAM" = gamelogs_formatted."AWAY_TEAM" 
 				THEN SUM(gamelogs_formatted."PLAYER_PTS") ELSE 0
-					END AS "AWAY_PTS",
-		CASE
-			WHEN gamelogs_formatted."PLAYER_TEAM" = gamelogs_formatted."HOME_TEAM" 
-				THEN SUM(gamelogs_formatted."LAST_{window_ngames}_PPG") ELSE 0
-					END AS "HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
-		CASE
-			WHEN gamelogs_formatted."PLAYER_TEAM" = gamelogs_formatted."HOME_TEAM" 
-				THEN SUM(gamelogs_formatted."LAST_{window_ngames}_PPG_STDDEV") ELSE 0
-					END AS "HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
-		CASE
-			WHEN gamelogs_formatted."PLAYER_TEAM" = gamelogs_formatted."AWAY_TEAM" 
-				THEN SUM(gamelogs_formatted."LAST_{window_ngames}_PPG")ELSE 0
-					END AS "AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
-		CASE
-			WHEN gamelogs_formatted."PLAYER_TEAM" = gamelogs_formatted."AWAY_TEAM" 
-				THEN SUM(gamelogs_formatted."LAST_{window_ngames}_PPG_STDDEV") ELSE 0
-					END AS "AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
+					END AS "AWAY_PTS",{team_player_sums}
 		CASE
 			WHEN gamelogs_formatted."PLAYER_TEAM" = gamelogs_formatted."HOME_TEAM" 
 				THEN SUM(gamelogs_formatted."SEASON_PPG") ELSE 0
@@ -231,11 +932,7 @@ active_players_cumulative as (
 		"HOME_AVG_HEIGHT_INCHES",
 		"HOME_STDDEV_HEIGHT_INCHES",
 		"AWAY_AVG_HEIGHT_INCHES",
-		"AWAY_STDDEV_HEIGHT_INCHES",
-		"HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
-		"HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
-		"AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
-		"AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
+		"AWAY_STDDEV_HEIGHT_INCHES",{team_player_columns}
 		"HOME_ACTIVE_PLAYERS_SEASON_PPG",
 		"HOME_ACTIVE_PLAYERS_SEASON_POINTS_STDDEV",
 		"AWAY_ACTIVE_PLAYERS_SEASON_PPG",
@@ -263,27 +960,18 @@ active_players_cumulative as (
 b2b_opp as (
 	SELECT
 		*,
-		(CASE WHEN "TEAM" = "HOME_TEAM" THEN (ROUND(AVG("AWAY_PTS") OVER (
-			PARTITION BY "SEASON", "TEAM" ORDER BY "GAME_DATE"
+		(CASE WHEN "TEAM" = "HOME_TEAM" THEN (ROUND(AVG("AWAY_PTS") OVER (team_season
 				ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
-				), 4)) ELSE 0 END) AS "HOME_TEAM_OPP_PPG",
-		(CASE WHEN "TEAM" = "HOME_TEAM" THEN (ROUND(AVG("AWAY_PTS") OVER (
-			PARTITION BY "SEASON", "TEAM" ORDER BY "GAME_DATE"
-				ROWS BETWEEN {window_ngames} PRECEDING AND 1 PRECEDING
-				), 4)) ELSE 0 END) AS "HOME_TEAM_OPP_LAST_{window_ngames}_PPG",
-		(CASE WHEN "TEAM" = "AWAY_TEAM" THEN (ROUND(AVG("HOME_PTS") OVER (
-			PARTITION BY "SEASON", "TEAM" ORDER BY "GAME_DATE"
+				), 4)) ELSE 0 END) AS "HOME_TEAM_OPP_PPG",{home_opp_windows}
+		(CASE WHEN "TEAM" = "AWAY_TEAM" THEN (ROUND(AVG("HOME_PTS") OVER (team_season
 				ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
-				), 4)) ELSE 0 END) AS "AWAY_TEAM_OPP_PPG",
-		(CASE WHEN "TEAM" = "AWAY_TEAM" THEN (ROUND(AVG("HOME_PTS") OVER (
-			PARTITION BY "SEASON", "TEAM" ORDER BY "GAME_DATE"
-				ROWS BETWEEN {window_ngames} PRECEDING AND 1 PRECEDING
-				), 4)) ELSE 0 END) AS "AWAY_TEAM_OPP_LAST_{window_ngames}_PPG",
+				), 4)) ELSE 0 END) AS "AWAY_TEAM_OPP_PPG",{away_opp_windows}
 		(CASE WHEN "TEAM" = "HOME_TEAM" THEN "2ND_OF_B2B" ELSE 0 END)
 			AS "HOME_TEAM_2ND_OF_B2B",
 		(CASE WHEN "TEAM" = "AWAY_TEAM" THEN "2ND_OF_B2B" ELSE 0 END)
 			AS "AWAY_TEAM_2ND_OF_B2B"
 	FROM active_players_cumulative
+	WINDOW team_season AS (PARTITION BY "SEASON", "TEAM" ORDER BY "GAME_DATE")
 ),
 pergame as (
 	SELECT
@@ -291,11 +979,7 @@ pergame as (
 		"GAME_DATE",
 		"GAME_ID",
 		"HOME_TEAM",
-		"AWAY_TEAM",
-		SUM("HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG") AS "HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
-		SUM("HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV") AS "HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
-		SUM("AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG") AS "AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
-		SUM("AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV") AS "AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
+		"AWAY_TEAM",{pergame_player_sums}
 		SUM("HOME_ACTIVE_PLAYERS_SEASON_PPG") AS "HOME_ACTIVE_PLAYERS_SEASON_PPG",
 		SUM("HOME_ACTIVE_PLAYERS_SEASON_POINTS_STDDEV") AS "HOME_ACTIVE_PLAYERS_SEASON_POINTS_STDDEV",
 		SUM("AWAY_ACTIVE_PLAYERS_SEASON_PPG") AS "AWAY_ACTIVE_PLAYERS_SEASON_PPG",
@@ -304,26 +988,14 @@ pergame as (
 		SUM("HOME_STDDEV_HEIGHT_INCHES") AS "HOME_STDDEV_HEIGHT_INCHES",
 		SUM("AWAY_AVG_HEIGHT_INCHES") AS "AWAY_AVG_HEIGHT_INCHES",
 		SUM("AWAY_STDDEV_HEIGHT_INCHES") AS "AWAY_STDDEV_HEIGHT_INCHES",
-		SUM("HOME_TEAM_OPP_PPG") AS "HOME_TEAM_OPP_PPG",
-		SUM("HOME_TEAM_OPP_LAST_{window_ngames}_PPG") AS "HOME_TEAM_OPP_LAST_{window_ngames}_PPG",
-		SUM("AWAY_TEAM_OPP_PPG") AS "AWAY_TEAM_OPP_PPG",
-		SUM("AWAY_TEAM_OPP_LAST_{window_ngames}_PPG") AS "AWAY_TEAM_OPP_LAST_{window_ngames}_PPG",
-		(ROUND(AVG("HOME_PTS") OVER (
-			PARTITION BY "SEASON", "HOME_TEAM" ORDER BY "GAME_DATE"
+		SUM("HOME_TEAM_OPP_PPG") AS "HOME_TEAM_OPP_PPG",{pergame_home_opp_sums}
+		SUM("AWAY_TEAM_OPP_PPG") AS "AWAY_TEAM_OPP_PPG",{pergame_away_opp_sums}
+		(ROUND(AVG("HOME_PTS") OVER (home_season
 				ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
 				), 4)) AS "HOME_TEAM_PPG_AT_HOME",
-		(ROUND(AVG("AWAY_PTS") OVER (
-			PARTITION BY "SEASON", "AWAY_TEAM" ORDER BY "GAME_DATE"
+		(ROUND(AVG("AWAY_PTS") OVER (away_season
 				ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
-				), 4)) AS "AWAY_TEAM_PPG_AWAY",
-		(ROUND(AVG("HOME_PTS") OVER (
-			PARTITION BY "SEASON", "HOME_TEAM" ORDER BY "GAME_DATE"
-				ROWS BETWEEN {window_ngames} PRECEDING AND 1 PRECEDING
-				), 4)) AS "HOME_TEAM_LAST_{window_ngames}_PPG_AT_HOME",
-		(ROUND(AVG("AWAY_PTS") OVER (
-			PARTITION BY "SEASON", "AWAY_TEAM" ORDER BY "GAME_DATE"
-				ROWS BETWEEN {window_ngames} PRECEDING AND 1 PRECEDING
-				), 4)) AS "AWAY_TEAM_LAST_{window_ngames}_PPG_AWAY",
+				), 4)) AS "AWAY_TEAM_PPG_AWAY",{pergame_venue_windows}
 		SUM("HOME_TEAM_2ND_OF_B2B") AS "HOME_TEAM_2ND_OF_B2B",
 		SUM("AWAY_TEAM_2ND_OF_B2B") AS "AWAY_TEAM_2ND_OF_B2B",
 		MAX(CASE WHEN "TEAM" = "HOME_TEAM" THEN "CUM_WINS" ELSE 0 END) AS "HOME_TEAM_CUM_WINS",
@@ -339,6 +1011,9 @@ pergame as (
 		"AWAY_TEAM",
 		b2b_opp."HOME_PTS",
 		b2b_opp."AWAY_PTS"
+	WINDOW
+		home_season AS (PARTITION BY "SEASON", "HOME_TEAM" ORDER BY "GAME_DATE"),
+		away_season AS (PARTITION BY "SEASON", "AWAY_TEAM" ORDER BY "GAME_DATE")
 ),
 logs_agg as (
 	SELECT 
@@ -352,23 +1027,15 @@ logs_agg as (
 	    "FAV_HIT",
 		("HOME_SCORE" - "AWAY_SCORE") AS "DIFF",
 		"GAME_TOTAL_PTS",
-	    "OVER_HIT"::numeric,
-		"HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
-		"HOME_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
-		"AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG",
-		"AWAY_ACTIVE_PLAYERS_LAST_{window_ngames}_PPG_STDDEV",
+	    "OVER_HIT"::numeric,{team_player_columns}
 		"HOME_ACTIVE_PLAYERS_SEASON_PPG",
 		"HOME_ACTIVE_PLAYERS_SEASON_POINTS_STDDEV",
 		"AWAY_ACTIVE_PLAYERS_SEASON_PPG",
 		"AWAY_ACTIVE_PLAYERS_SEASON_POINTS_STDDEV",
-		"HOME_TEAM_OPP_PPG",
-		"HOME_TEAM_OPP_LAST_{window_ngames}_PPG",
-		"AWAY_TEAM_OPP_PPG",
-		"AWAY_TEAM_OPP_LAST_{window_ngames}_PPG",
+		"HOME_TEAM_OPP_PPG",{home_opp_columns}
+		"AWAY_TEAM_OPP_PPG",{away_opp_columns}
 		"HOME_TEAM_PPG_AT_HOME",
-		"AWAY_TEAM_PPG_AWAY",
-		"HOME_TEAM_LAST_{window_ngames}_PPG_AT_HOME",
-		"AWAY_TEAM_LAST_{window_ngames}_PPG_AWAY",
+		"AWAY_TEAM_PPG_AWAY",{venue_columns}
 		"HOME_TEAM_2ND_OF_B2B",
 		"AWAY_TEAM_2ND_OF_B2B",
 		"HOME_AVG_HEIGHT_INCHES",
@@ -394,109 +1061,765 @@ SELECT * FROM logs_agg;
 
     """
 
-    return convert_sql_to_df(query=query)
 
+def _decimals_to_float(df: pd.DataFrame) -> pd.DataFrame:
+    # postgres numerics arrive as Decimal objects, which to_sql would store as text
+    for column in df.columns:
+        if df[column].dtype == object:
+            sample = df[column].dropna()
+            if not sample.empty and isinstance(sample.iloc[0], Decimal):
+                df[column] = df[column].astype(float)
+    return df
+
+
+def _get_feature_seasons_to_refresh(window_ngames: int) -> list | None:
+    if not inspect(get_connection()).has_table(FEATURES_TABLE, schema=FEATURES_SCHEMA):
+        return None
+
+    query = f"""
+    WITH last_refresh AS (
+        SELECT MAX("GAME_DATE") AS "GAME_DATE"
+        FROM {FEATURES_SCHEMA}.{FEATURES_TABLE}
+        WHERE "WINDOW_NGAMES" = {int(window_ngames)}
+    ),
+    current_season AS (
+        SELECT RIGHT("SEASON_ID", 4)::numeric AS "SEASON"
+        FROM nba_gamelogs.player_gamelogs
+        ORDER BY "GAME_DATE" DESC
+        LIMIT 1
+    )
+    SELECT DISTINCT RIGHT("SEASON_ID", 4)::numeric AS "SEASON"
+    FROM nba_gamelogs.player_gamelogs, last_refresh
+    WHERE last_refresh."GAME_DATE" IS NULL
+        OR to_date("GAME_DATE", 'YYYY-MM-DD') > last_refresh."GAME_DATE"
+    UNION
+    SELECT "SEASON" FROM current_season;
+    """
+    seasons = convert_sql_to_df(query=query)["SEASON"]
+    return sorted(int(x) for x in seasons)
+
+
+def _single_window_features(features: pd.DataFrame, window_ngames: int, windows: list):
+    other_windows = [f"LAST_{x}_" for x in windows if x != window_ngames]
+    features = features[
+        [x for x in features.columns if not any(y in x for y in other_windows)]
+    ].rename(lambda x: x.replace(f"LAST_{window_ngames}_", "LAST_N_"), axis=1)
+    features["WINDOW_NGAMES"] = int(window_ngames)
+    return features
+
+
+def refresh_betting_features(window_ngames: int | list = 3, seasons: list | None = None):
+    # the current season is always rebuilt so late-arriving lines are picked up
+    windows = get_windows(window_ngames)
+    if seasons is None:
+        window_seasons = [_get_feature_seasons_to_refresh(x) for x in windows]
+        if None not in window_seasons:
+            seasons = sorted(set().union(*window_seasons))
+
+    print(f"\nRefreshing betting features for seasons {seasons or 'all'}...")
+    computed = convert_sql_to_df(query=_betting_features_query(windows, seasons))
+    computed = _decimals_to_float(computed)
+
+    features_table = _qualified_table(FEATURES_TABLE, FEATURES_SCHEMA)
+    with get_connection().begin() as con:
+        con.execute(text(f"CREATE SCHEMA IF NOT EXISTS {FEATURES_SCHEMA}"))
+        for window in windows:
+            features = _single_window_features(computed, window, windows)
+            features.head(0).to_sql(
+                name=FEATURES_TABLE,
+                con=con,
+                schema=FEATURES_SCHEMA,
+                if_exists="append",
+                index=False,
+            )
+            with con.connection.driver_connection.cursor() as cursor:
+                cursor.execute(
+                    pgsql.SQL(
+                        "CREATE INDEX IF NOT EXISTS {} ON {} "
+                        '("WINDOW_NGAMES", "SEASON", "GAME_DATE")'
+                    ).format(pgsql.Identifier(f"{FEATURES_TABLE}_window_season_idx"), features_table)
+                )
+                delete = pgsql.SQL('DELETE FROM {} WHERE "WINDOW_NGAMES" = %(window)s').format(
+                    features_table
+                )
+                if seasons:
+                    delete = pgsql.SQL('{} AND "SEASON" = ANY(%(seasons)s)').format(delete)
+                cursor.execute(delete, {"window": window, "seasons": seasons})
+
+            copy_rows(
+                con.connection.driver_connection,
+                FEATURES_TABLE,
+                FEATURES_SCHEMA,
+                list(features.columns),
+                _frame_rows(features),
+            )
+
+            print(f"\t{len(features)} feature rows written for window {window}.")
+
+        bump_table_version(con.connection.driver_connection, FEATURES_TABLE, FEATURES_SCHEMA)
+
+
+def load_betting_features(
+    window_ngames: int = 3, refresh_if_empty: bool = True
+) -> pd.DataFrame:
+    features = pd.DataFrame()
+    if inspect(get_connection()).has_table(FEATURES_TABLE, schema=FEATURES_SCHEMA):
+        query = f"""
+        SELECT *
+        FROM {FEATURES_SCHEMA}.{FEATURES_TABLE}
+        WHERE "WINDOW_NGAMES" = {int(window_ngames)}
+        ORDER BY "GAME_DATE";
+        """
+        features = convert_sql_to_df(query=query)
+
+    if features.empty and refresh_if_empty:
+        refresh_betting_features(window_ngames)
+        return load_betting_features(window_ngames, refresh_if_empty=False)
+    elif features.empty:
+        return features
+
+    return features.drop(columns="WINDOW_NGAMES").rename(
+        lambda x: x.replace("LAST_N_", f"LAST_{window_ngames}_"), axis=1
+    )
+
+
+def load_betting_feature_inputs() -> tuple:
+    def select(columns, table):
+        column_list = ", ".join(f'"{x}"' for x in columns)
+        return convert_sql_to_df(query=f"SELECT {column_list} FROM {table};")
+
+    return (
+        select(GAMELOG_COLUMNS, "nba_gamelogs.player_gamelogs"),
+        select(PLAYER_COLUMNS, "nba_general.players"),
+        select(LINES_COLUMNS, "nba_general.lines"),
+    )
+
+
+def fetch_aggregate_betting_data(
+    window_ngames: int | list = 3,
+    training: bool = True,
+    materialized: bool = False,
+    engine: str = "sql",
+):
+    # every window comes back from a single scan, as LAST_{n}_ column blocks
+    windows = get_windows(window_ngames)
+
+    if materialized:
+        keys = ["SEASON", "GAME_DATE", "HOME_TEAM", "AWAY_TEAM"]
+        merged = load_betting_features(windows[0])
+        for window in windows[1:]:
+            features = load_betting_features(window)
+            merged = merged.merge(
+                features[keys + [x for x in features.columns if x not in merged.columns]],
+                on=keys,
+            )
+        return merged[[x for x in betting_feature_columns(windows) if x in merged.columns]]
+
+    if engine == "pandas":
+        return compute_betting_features(*load_betting_feature_inputs(), windows)
+
+    return convert_sql_to_df(query=_betting_features_query(windows), cache=True)
+
+
+def ensure_player_gamelog_index():
+    # serves the latest-game lookups in agg_active_player_new_x_data
+    execute_database_operations(
+        """
+        CREATE INDEX IF NOT EXISTS player_gamelogs_player_date_idx
+        ON nba_gamelogs.player_gamelogs ("Player_ID", "GAME_DATE" DESC);
+        """
+    )
+
+
+def _table_exists(table_name: str, schema: str) -> bool:
+    exists = convert_sql_to_df(
+        query='SELECT to_regclass(%(table)s) IS NOT NULL AS "exists"',
+        params={"table": f"{schema}.{table_name}"},
+    )
+    return bool(exists["exists"].iloc[0])
+
+
+def _game_key_state(table_name: str, schema: str) -> dict | None:
+    # None when the table is missing
+    state = convert_sql_to_df(
+        query="""
+        SELECT
+            a.attname IS NOT NULL AS "has_column",
+            COALESCE(a.attgenerated <> '', FALSE) AS "generated",
+            EXISTS (
+                SELECT 1 FROM pg_trigger t
+                WHERE t.tgrelid = c.oid AND t.tgname = %(trigger)s
+            ) AS "has_trigger",
+            EXISTS (
+                SELECT 1
+                FROM pg_index i
+                JOIN pg_class ic ON ic.oid = i.indexrelid
+                WHERE i.indrelid = c.oid AND ic.relname = %(index)s AND i.indisvalid
+            ) AS "has_index"
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_attribute a
+            ON a.attrelid = c.oid AND a.attname = 'game_key' AND NOT a.attisdropped
+        WHERE n.nspname = %(schema)s AND c.relname = %(table)s
+        """,
+        params={
+            "schema": schema,
+            "table": table_name,
+            "trigger": f"{table_name}_game_key",
+            "index": f"{table_name}_game_key_idx",
+        },
+    )
+    return None if state.empty else state.iloc[0].to_dict()
+
+
+def _game_key_expression(id_column: str, row=None):
+    column = pgsql.Identifier(row, id_column) if row else pgsql.Identifier(id_column)
+    return pgsql.SQL(
+        "CASE WHEN {column}::text ~ '^[0-9]+$' THEN {column}::text::bigint END"
+    ).format(column=column)
+
+
+def _add_game_key_column(table_name: str, schema: str, id_column: str) -> None:
+    # a nullable column without a default is a catalog change, not a rewrite,
+    # so the ACCESS EXCLUSIVE lock it takes is held only for an instant
+    function = pgsql.Identifier(schema, f"{table_name}_set_game_key")
+    statements = [
+        pgsql.SQL('ALTER TABLE {} ADD COLUMN IF NOT EXISTS "game_key" BIGINT').format(
+            _qualified_table(table_name, schema)
+        ),
+        pgsql.SQL(
+            "CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ "
+            'BEGIN NEW."game_key" := {expression}; RETURN NEW; END; '
+            "$$ LANGUAGE plpgsql"
+        ).format(function=function, expression=_game_key_expression(id_column, "new")),
+        pgsql.SQL("DROP TRIGGER IF EXISTS {} ON {}").format(
+            pgsql.Identifier(f"{table_name}_game_key"),
+            _qualified_table(table_name, schema),
+        ),
+        pgsql.SQL(
+            "CREATE TRIGGER {trigger} BEFORE INSERT OR UPDATE ON {table} "
+            "FOR EACH ROW EXECUTE FUNCTION {function}()"
+        ).format(
+            trigger=pgsql.Identifier(f"{table_name}_game_key"),
+            table=_qualified_table(table_name, schema),
+            function=function,
+        ),
+    ]
+    with get_connection().begin() as con:
+        with con.connection.driver_connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+        bump_table_version(con.connection.driver_connection, table_name, schema)
+
+
+def _leaf_tables(table_name: str, schema: str) -> list:
+    # the partitions of a partitioned table, or the table itself
+    if _table_kind(table_name, schema) != "p":
+        return [table_name]
+    return sorted(_partition_names(table_name, schema))
+
+
+def _backfill_game_key(table_name: str, schema: str, id_column: str) -> int:
+    """
+    Fills game_key on existing rows GAME_KEY_BACKFILL_PAGES heap pages per
+    transaction, so each batch holds its row locks only briefly. Returns the
+    number of rows filled.
+    """
+    filled = 0
+    for leaf in _leaf_tables(table_name, schema):
+        pages = convert_sql_to_df(
+            query="""
+            SELECT pg_relation_size(%(table)s::regclass)
+                / current_setting('block_size')::bigint AS "pages"
+            """,
+            params={"table": f"{schema}.{leaf}"},
+        )["pages"].iloc[0]
+        statement = pgsql.SQL(
+            'UPDATE {table} SET "game_key" = {expression} '
+            "WHERE ctid >= %(start)s::tid AND ctid < %(stop)s::tid "
+            'AND "game_key" IS NULL'
+        ).format(
+            table=_qualified_table(leaf, schema),
+            expression=_game_key_expression(id_column),
+        )
+        for start in range(0, int(pages), GAME_KEY_BACKFILL_PAGES):
+            with get_connection().begin() as con:
+                with con.connection.driver_connection.cursor() as cursor:
+                    # a ctid range is read with a tid range scan, not a seq scan
+                    cursor.execute(
+                        statement,
+                        {
+                            "start": f"({start},0)",
+                            "stop": f"({start + GAME_KEY_BACKFILL_PAGES},0)",
+                        },
+                    )
+                    changed = cursor.rowcount
+                    filled += changed
+                if changed:
+                    # versioned under the table the cached queries read, not
+                    # the partition
+                    bump_table_version(
+                        con.connection.driver_connection, table_name, schema
+                    )
+
+    return filled
+
+
+def _create_index_concurrently(index_name: str, table_name: str, schema: str) -> None:
+    # CONCURRENTLY cannot run in a transaction, and a build that fails leaves an
+    # invalid index behind that IF NOT EXISTS would keep, so that is dropped first
+    index = pgsql.Identifier(schema, index_name)
+    valid = convert_sql_to_df(
+        query="""
+        SELECT i.indisvalid AS "valid"
+        FROM pg_index i
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = ic.relnamespace
+        WHERE n.nspname = %(schema)s AND ic.relname = %(index)s
+        """,
+        params={"schema": schema, "index": index_name},
+    )["valid"]
+
+    with get_connection().connect() as con:
+        con = con.execution_options(isolation_level="AUTOCOMMIT")
+        with con.connection.driver_connection.cursor() as cursor:
+            if not valid.empty and not valid.iloc[0]:
+                cursor.execute(pgsql.SQL("DROP INDEX CONCURRENTLY {}").format(index))
+            cursor.execute(
+                pgsql.SQL(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ("game_key")'
+                ).format(
+                    pgsql.Identifier(index_name), _qualified_table(table_name, schema)
+                )
+            )
+
+
+def _create_game_key_index(table_name: str, schema: str) -> None:
+    index_name = f"{table_name}_game_key_idx"
+    if _table_kind(table_name, schema) != "p":
+        _create_index_concurrently(index_name, table_name, schema)
+        return
+
+    # a partitioned parent cannot be indexed concurrently, so each partition is,
+    # and attaching them all makes the parent's index valid
+    with get_connection().begin() as con:
+        with con.connection.driver_connection.cursor() as cursor:
+            cursor.execute(
+                pgsql.SQL(
+                    'CREATE INDEX IF NOT EXISTS {} ON ONLY {} ("game_key")'
+                ).format(
+                    pgsql.Identifier(index_name), _qualified_table(table_name, schema)
+                )
+            )
+    for partition in _leaf_tables(table_name, schema):
+        _create_index_concurrently(f"{partition}_game_key_idx", partition, schema)
+        with get_connection().begin() as con:
+            with con.connection.driver_connection.cursor() as cursor:
+                cursor.execute(
+                    pgsql.SQL("ALTER INDEX {} ATTACH PARTITION {}").format(
+                        pgsql.Identifier(schema, index_name),
+                        pgsql.Identifier(schema, f"{partition}_game_key_idx"),
+                    )
+                )
 
-def agg_active_player_new_x_data(active_lineup, window_ngames: int = 3):
-    id_list = active_lineup["personId"].astype(str).to_list()
+
+def ensure_game_key(table_name: str, id_column: str, schema: str = "nba_gamelogs"):
+    """
+    Adds the canonical BIGINT "game_key" (the game id without its leading zeros)
+    to a table keyed by an api game id, plus a B-tree index on it. A trigger
+    fills the column on every insert, so loaders never have to set it.
+
+    The table is never rewritten: the column is added nullable, existing rows
+    are backfilled in batches and the index is built concurrently, so loads
+    keep running throughout. Does nothing if the table is missing or already
+    has the column, its trigger and the index, and picks up where it left off
+    if a previous run failed part way. Tables that got game_key as a generated
+    column from an older migration are left as they are.
+    """
+    state = _game_key_state(table_name, schema)
+    if state is None:
+        return
+    if state["has_column"] and state["has_index"]:
+        if state["generated"] or state["has_trigger"]:
+            return
+
+    if not state["generated"]:
+        if not (state["has_column"] and state["has_trigger"]):
+            _add_game_key_column(table_name, schema, id_column)
+        _backfill_game_key(table_name, schema, id_column)
+    _create_game_key_index(table_name, schema)
+
+
+def _table_kind(table_name: str, schema: str) -> str | None:
+    # "r" for a plain heap, "p" for a partitioned parent, None when missing
+    kind = convert_sql_to_df(
+        query="""
+        SELECT c.relkind AS "kind"
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %(schema)s AND c.relname = %(table)s
+        """,
+        params={"schema": schema, "table": table_name},
+    )
+    return None if kind.empty else kind["kind"].iloc[0]
+
+
+def partition_table_by_range(table_name: str, schema: str, column: str):
+    """
+    Rebuilds a plain table as a parent range-partitioned on column, with one
+    partition per distinct integer value, and moves its rows across. Does
+    nothing if the table is missing or already partitioned.
+    """
+    if _table_kind(table_name, schema) != "r":
+        return
+
+    legacy = f"{table_name}_unpartitioned"
+    values = convert_sql_to_df(
+        query=f'SELECT DISTINCT "{column}"::bigint AS "value" FROM {schema}.{table_name} '
+        f'WHERE "{column}" IS NOT NULL;'
+    )["value"]
+    columns = convert_sql_to_df(
+        query="""
+        SELECT attname AS "column"
+        FROM pg_attribute
+        WHERE attrelid = %(table)s::regclass
+        AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+        ORDER BY attnum
+        """,
+        params={"table": f"{schema}.{table_name}"},
+    )["column"]
+    column_list = ", ".join(f'"{x}"' for x in columns)
+
+    print(f"\nPartitioning {schema}.{table_name} by {column}...")
+    with get_connection().begin() as con:
+        con.exec_driver_sql(
+            f"""
+            ALTER TABLE {schema}.{table_name} RENAME TO {legacy};
+            CREATE TABLE {schema}.{table_name}
+                (LIKE {schema}.{legacy} INCLUDING DEFAULTS INCLUDING GENERATED)
+                PARTITION BY RANGE ("{column}");
+            """
+        )
+        for value in values:
+            con.exec_driver_sql(_partition_statement(table_name, schema, int(value)))
+        con.exec_driver_sql(
+            f"""
+            INSERT INTO {schema}.{table_name} ({column_list})
+            SELECT {column_list} FROM {schema}.{legacy};
+            DROP TABLE {schema}.{legacy};
+            """
+        )
+
+
+def _partition_statement(table_name: str, schema: str, value: int) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {schema}.{table_name}_{value} "
+        f"PARTITION OF {schema}.{table_name} FOR VALUES FROM ({value}) TO ({value + 1});"
+    )
+
+
+def _partition_names(table_name: str, schema: str) -> list:
+    return convert_sql_to_df(
+        query="""
+        SELECT c.relname AS "partition"
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %(table)s::regclass
+        """,
+        params={"table": f"{schema}.{table_name}"},
+    )["partition"].to_list()
+
+
+def _range_partition_values(table_name: str, schema: str) -> set:
+    # partitions are named {table_name}_{value} by _partition_statement
+    partitions = _partition_names(table_name, schema)
+    prefix = f"{table_name}_"
+    return {
+        int(x[len(prefix):])
+        for x in partitions
+        if x.startswith(prefix) and x[len(prefix):].isdigit()
+    }
+
+
+def ensure_range_partitions(
+    table_name: str,
+    schema: str,
+    column: str,
+    values,
+    template: pd.DataFrame | None = None,
+) -> bool:
+    """
+    Creates the partitions of a range-partitioned table for those of the given
+    integer values that have none yet. A missing parent is first created with
+    template's columns. Returns True if the parent was created.
+    """
+    created = False
+    if _table_kind(table_name, schema) is None:
+        if template is None:
+            raise ValueError(f"{schema}.{table_name} does not exist and no template was given")
+        with get_connection().begin() as con:
+            template.head(0).to_sql(
+                name=f"{table_name}_template",
+                con=con,
+                schema=schema,
+                if_exists="replace",
+                index=False,
+            )
+            con.exec_driver_sql(
+                f"""
+                CREATE TABLE {schema}.{table_name}
+                    (LIKE {schema}.{table_name}_template INCLUDING DEFAULTS)
+                    PARTITION BY RANGE ("{column}");
+                DROP TABLE {schema}.{table_name}_template;
+                """
+            )
+        created = True
+
+    # checked against the catalog first, since CREATE TABLE ... PARTITION OF
+    # locks the parent even when the partition already exists
+    missing = {int(x) for x in values} - _range_partition_values(table_name, schema)
+    statements = [
+        _partition_statement(table_name, schema, value) for value in sorted(missing)
+    ]
+    if statements:
+        execute_database_operations("\n".join(statements))
+
+    return created
+
+
+def _ensure_play_by_play_indexes():
+    ensure_game_key("play_by_play", "gameId")
+    execute_database_operations(
+        """
+        CREATE INDEX IF NOT EXISTS play_by_play_person_id_idx
+        ON nba_gamelogs.play_by_play ("personId");
+        """
+    )
+
+
+def ensure_play_by_play_table():
+    # one partition per season, so season scoped queries prune to one partition
+    # and past seasons are never rewritten or revacuumed. Run by migration 0002
+    partition_table_by_range("play_by_play", "nba_gamelogs", "SEASON")
+    if _table_kind("play_by_play", "nba_gamelogs") is not None:
+        _ensure_play_by_play_indexes()
+
+
+def ensure_play_by_play_partitions(frame: pd.DataFrame, keys: list):
+    """
+    Creates the play_by_play partitions for frame's seasons that have none yet.
+    Schema changes are left to migrations 0002 and 0003, except on a fresh
+    database where the first load creates the table and its unique index on
+    keys.
+    """
+    if ensure_range_partitions(
+        "play_by_play", "nba_gamelogs", "SEASON", frame["SEASON"], template=frame
+    ):
+        _ensure_play_by_play_indexes()
+        ensure_unique_key("play_by_play", "nba_gamelogs", keys)
+
+
+def get_pending_games_by_table(
+    table_names: list,
+    schema: str = "nba_gamelogs",
+    min_season: int = 1996,
+) -> pd.DataFrame:
+    """
+    Returns the (game_id, date, season) rows of player_gamelogs games from
+    min_season on that have no rows yet in at least one of the tables, with a
+    boolean column per table that is True where that table is missing the game.
+    Every table is matched on its indexed game_key in a single scan of the
+    games. game_id is returned without its leading zeros.
+    """
+    # game_key is added by migration 0001, or by the loader that creates a table
+    flags = [
+        f"""NOT EXISTS (
+            SELECT 1
+            FROM {schema}.{table_name} AS stored
+            WHERE stored."game_key" = games."game_key"
+        ) AS "{table_name}\""""
+        if _table_exists(table_name, schema)
+        else f'TRUE AS "{table_name}"'
+        for table_name in table_names
+    ]
+    query = f"""
+    WITH games AS (
+        SELECT DISTINCT
+            "game_key",
+            "GAME_DATE" AS "date",
+            RIGHT("SEASON_ID", 4) AS "season"
+        FROM nba_gamelogs.player_gamelogs
+        WHERE RIGHT("SEASON_ID", 4)::numeric >= %(min_season)s
+        AND "game_key" IS NOT NULL
+    ),
+    flagged AS (
+        SELECT
+            "game_key"::text AS "game_id",
+            "date",
+            "season",
+            {", ".join(flags)}
+        FROM games
+    )
+    SELECT *
+    FROM flagged
+    WHERE {" OR ".join(f'"{x}"' for x in table_names)}
+    ORDER BY "date" DESC;
+    """
+
+    return convert_sql_to_df(query=query, params={"min_season": min_season})
+
+
+def get_pending_games(
+    table_name: str,
+    schema: str = "nba_gamelogs",
+    min_season: int = 1996,
+) -> pd.DataFrame:
+    """
+    Returns the (game_id, date, season) rows of player_gamelogs games from
+    min_season on that have no rows in schema.table_name yet.
+    """
+    return get_pending_games_by_table([table_name], schema, min_season).drop(
+        columns=table_name
+    )
+
+
+def agg_active_player_new_x_data(active_lineup, window_ngames: int | list = 3):
+    # each player's windows only need the season and name of their latest game,
+    # both found with an index probe on ("Player_ID", "GAME_DATE" DESC)
+    player_ids = [int(x) for x in active_lineup["personId"].drop_duplicates()]
+    windows = get_windows(window_ngames)
+    window_columns = "".join(
+        f"""
+        active_players."LAST_{n}_PPG",
+        active_players."LAST_{n}_PPG_STDDEV","""
+        for n in windows
+    )
+    player_windows = "".join(
+        f"""
+            ROUND(AVG(pg."PTS") OVER (player_season
+                ROWS BETWEEN {n - 1} PRECEDING AND CURRENT ROW
+            ), 4) AS "LAST_{n}_PPG",
+            ROUND(STDDEV(pg."PTS") OVER (player_season
+                ROWS BETWEEN {n - 1} PRECEDING AND CURRENT ROW
+            ), 4) AS "LAST_{n}_PPG_STDDEV","""
+        for n in windows
+    )
     query = f"""
-	WITH active_players AS (
+    WITH active_ids AS (
+        SELECT DISTINCT UNNEST(%(player_ids)s::bigint[]) AS "Player_ID"
+    )
     SELECT
-        pg."Player_ID",
-        pg."player_name",
-        pg."GAME_DATE",
+        active_players."Player_ID",
+        active_players."player_name",
+        active_players."GAME_DATE",
         height."TEAM_ID",
-        RIGHT(pg."SEASON_ID", 4)::numeric AS "SEASON_YEAR",
-        ROUND(AVG(pg."PTS") OVER (
-            PARTITION BY RIGHT(pg."SEASON_ID", 4)::numeric, pg."player_name", pg."Player_ID"
-            ORDER BY pg."GAME_DATE"
-            ROWS BETWEEN {str(window_ngames - 1)} PRECEDING AND CURRENT ROW
-        ), 4) AS "LAST_{str(window_ngames)}_PPG",
-        ROUND(STDDEV(pg."PTS") OVER (
-            PARTITION BY RIGHT(pg."SEASON_ID", 4)::numeric, pg."player_name", pg."Player_ID"
-            ORDER BY pg."GAME_DATE"
-            ROWS BETWEEN {str(window_ngames - 1)} PRECEDING AND CURRENT ROW
-        ), 4) AS "LAST_{str(window_ngames)}_PPG_STDDEV",
-        ROUND(AVG(pg."PTS") OVER (
-            PARTITION BY RIGHT(pg."SEASON_ID", 4)::numeric, pg."player_name", pg."Player_ID"
-            ORDER BY pg."GAME_DATE"
-            ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-        ), 4) AS "SEASON_PPG",
-        ROUND(STDDEV(pg."PTS") OVER (
-            PARTITION BY RIGHT(pg."SEASON_ID", 4)::numeric, pg."player_name", pg."Player_ID"
-            ORDER BY pg."GAME_DATE"
-            ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-        ), 4) AS "SEASON_PPG_STDDEV",
-        ((STRING_TO_ARRAY(height."HEIGHT", '-'))[1]::numeric * 12) + ((STRING_TO_ARRAY(height."HEIGHT", '-'))[2]::numeric) AS "HEIGHT_INCHES",
-        ROW_NUMBER() OVER (PARTITION BY pg."Player_ID" ORDER BY pg."GAME_DATE" DESC) AS "rn"
-    FROM nba_gamelogs.player_gamelogs AS pg
-    LEFT JOIN nba_general.players AS height ON height."PERSON_ID" = pg."Player_ID"
-    WHERE pg."Player_ID" IN ({", ".join(id_list)}))
-	SELECT *
-	FROM active_players
-	WHERE rn = 1
-	ORDER BY "Player_ID", "player_name" DESC LIMIT {len(id_list)};
-	"""
-    return convert_sql_to_df(query=query)
+        active_players."SEASON_YEAR",{window_columns}
+        active_players."SEASON_PPG",
+        active_players."SEASON_PPG_STDDEV",
+        ((STRING_TO_ARRAY(height."HEIGHT", '-'))[1]::numeric * 12) + ((STRING_TO_ARRAY(height."HEIGHT", '-'))[2]::numeric) AS "HEIGHT_INCHES"
+    FROM active_ids
+    CROSS JOIN LATERAL (
+        SELECT latest."SEASON_ID", latest."player_name"
+        FROM nba_gamelogs.player_gamelogs AS latest
+        WHERE latest."Player_ID" = active_ids."Player_ID"
+        ORDER BY latest."GAME_DATE" DESC
+        LIMIT 1
+    ) AS latest_game
+    CROSS JOIN LATERAL (
+        SELECT
+            pg."Player_ID",
+            pg."player_name",
+            pg."GAME_DATE",
+            RIGHT(pg."SEASON_ID", 4)::numeric AS "SEASON_YEAR",{player_windows}
+            ROUND(AVG(pg."PTS") OVER (player_season
+                ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+            ), 4) AS "SEASON_PPG",
+            ROUND(STDDEV(pg."PTS") OVER (player_season
+                ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+            ), 4) AS "SEASON_PPG_STDDEV"
+        FROM nba_gamelogs.player_gamelogs AS pg
+        WHERE pg."Player_ID" = active_ids."Player_ID"
+            AND RIGHT(pg."SEASON_ID", 4) = RIGHT(latest_game."SEASON_ID", 4)
+            AND pg."player_name" = latest_game."player_name"
+        WINDOW player_season AS (ORDER BY pg."GAME_DATE")
+        ORDER BY pg."GAME_DATE" DESC
+        LIMIT 1
+    ) AS active_players
+    LEFT JOIN nba_general.players AS height ON height."PERSON_ID" = active_players."Player_ID"
+    ORDER BY active_players."Player_ID";
+    """
+    return convert_sql_to_df(query=query, params={"player_ids": player_ids})
 
 
-def agg_team_new_x_data(window_ngames: int = 3):
-    for n in ["HOME", "AWAY", "TOTAL"]:
+def agg_team_new_x_data(window_ngames: int | list = 3):
+    # home, away and overall form from a single scan: the venue windows are
+    # partitioned by HOME/AWAY and pivoted back into one row per team with FILTER
+    windows = get_windows(window_ngames)
+    ppg_columns = ["SEASON_PPG"] + [f"LAST_{n}_PPG" for n in windows]
+    opp_columns = ["SEASON_OPP_PPG"] + [f"LAST_{n}_OPP_PPG" for n in windows]
 
-        query = f"""
-		WITH team_metrics as ( 
-		SELECT 
-        "GAME_DATE",
-        "TEAM_ID",
-		"TEAM", 
-		ROUND(AVG("PTS"::numeric) OVER (PARTITION BY "SEASON_YEAR", "TEAM" 
-			ORDER BY "GAME_DATE" ROWS BETWEEN 
-			UNBOUNDED PRECEDING AND CURRENT ROW)::numeric, 4) AS "SEASON_PPG", 
-		ROUND(AVG("PTS"::numeric) OVER (PARTITION BY "SEASON_YEAR", "TEAM" 
-			ORDER BY "GAME_DATE" ROWS BETWEEN 
-			{window_ngames - 1} PRECEDING AND CURRENT ROW)::numeric, 4) AS "LAST_{str(window_ngames)}_PPG",
-        ROUND(AVG("PTS"::numeric - "PLUS_MINUS"::numeric) OVER (PARTITION BY "SEASON_YEAR", "TEAM"
-			ORDER BY "GAME_DATE" ROWS BETWEEN
-			UNBOUNDED PRECEDING AND CURRENT ROW)::numeric, 4) AS "SEASON_OPP_PPG",
-		ROUND(AVG("PTS"::numeric - "PLUS_MINUS"::numeric) OVER (PARTITION BY "SEASON_YEAR", "TEAM"
-			ORDER BY "GAME_DATE" ROWS BETWEEN
-			{window_ngames - 1} PRECEDING AND CURRENT ROW)::numeric, 4) AS "LAST_{window_ngames}_OPP_PPG", 
-        ROW_NUMBER() OVER (PARTITION BY "TEAM_ID" ORDER BY "GAME_DATE" DESC) AS "rn"
-		FROM  
-			nba_gamelogs.team_gamelogs 
-        WHERE "HOME/AWAY" = '{n}'
-		ORDER BY "GAME_DATE" DESC) 
-		SELECT  
-			MAX("GAME_DATE") AS "LAST_GAME_DATE",
-            "TEAM_ID",
-			"TEAM", 
-			"SEASON_PPG", 
-			"LAST_{window_ngames}_PPG", 
-			"SEASON_OPP_PPG", 
-			"LAST_{window_ngames}_OPP_PPG" 
-		FROM team_metrics 
-		WHERE rn = 1 
-        GROUP BY 
-        	"TEAM_ID", 
-        	"TEAM", 
-            "SEASON_PPG",
-            "LAST_{window_ngames}_PPG", 
-			"SEASON_OPP_PPG", 
-			"LAST_{window_ngames}_OPP_PPG" 
-		LIMIT 30; 
-	"""
-        if n == "HOME":
-            home_df = convert_sql_to_df(query=query)
-        elif n == "AWAY":
-            away_df = convert_sql_to_df(query=query)
-        else:
-            query = query.replace(f"WHERE \"HOME/AWAY\" = '{n}'", "")
-            total_df = convert_sql_to_df(query=query)
-            total_df = total_df[["TEAM_ID", "SEASON_OPP_PPG", f"LAST_{window_ngames}_OPP_PPG"]]
+    def frame(n: int | None) -> str:
+        start = "UNBOUNDED" if n is None else n - 1
+        return f"ROWS BETWEEN {start} PRECEDING AND CURRENT ROW"
+
+    def ppg(window: str, n: int | None, alias: str) -> str:
+        return f"""
+		ROUND(AVG("PTS"::numeric) OVER ({window} {frame(n)})::numeric, 4) AS "{alias}","""
+
+    def opp_ppg(window: str, n: int | None, alias: str) -> str:
+        return f"""
+		ROUND(AVG("PTS"::numeric - "PLUS_MINUS"::numeric) OVER ({window} {frame(n)})::numeric, 4) AS "{alias}","""
 
-    merged = (
-        home_df.merge(away_df, on="TEAM", suffixes=("_HOME", "_AWAY"))
-        .rename({"TEAM_ID_HOME": "TEAM_ID"}, axis=1)
-        .drop("TEAM_ID_AWAY", axis=1)
+    def pivot(column: str, venue: str) -> str:
+        return f"""
+		MAX(latest_venue."{column}") FILTER (WHERE latest_venue."HOME/AWAY" = '{venue}') AS "{column}_{venue}","""
+
+    frames = [None] + windows
+    metrics = "".join(ppg("venue_season", n, x) for n, x in zip(frames, ppg_columns))
+    metrics += "".join(opp_ppg("venue_season", n, x) for n, x in zip(frames, opp_columns))
+    metrics += "".join(
+        opp_ppg("team_season", n, f"TOTAL_{x}") for n, x in zip(frames, opp_columns)
     )
-    return merged.merge(total_df, on="TEAM_ID")
+    home_columns = "".join(pivot(x, "HOME") for x in ppg_columns + opp_columns)
+    away_columns = "".join(pivot(x, "AWAY") for x in ppg_columns + opp_columns)
+    total_columns = ",".join(f'\n\t\tlatest."TOTAL_{x}" AS "{x}"' for x in opp_columns)
+    total_group = ",".join(f'\n\t\tlatest."TOTAL_{x}"' for x in opp_columns)
+
+    query = f"""
+	WITH team_metrics AS (
+	SELECT
+		"GAME_DATE",
+		"TEAM_ID",
+		"TEAM",
+		"HOME/AWAY",{metrics.rstrip(",")}
+	FROM nba_gamelogs.team_gamelogs
+	WINDOW
+		venue_season AS (PARTITION BY "SEASON_YEAR", "TEAM", "HOME/AWAY" ORDER BY "GAME_DATE"),
+		team_season AS (PARTITION BY "SEASON_YEAR", "TEAM" ORDER BY "GAME_DATE")
+	),
+	latest_venue AS (
+	SELECT DISTINCT ON ("TEAM_ID", "HOME/AWAY") *
+	FROM team_metrics
+	WHERE "HOME/AWAY" IN ('HOME', 'AWAY')
+	ORDER BY "TEAM_ID", "HOME/AWAY", "GAME_DATE" DESC
+	),
+	latest AS (
+	SELECT DISTINCT ON ("TEAM_ID") *
+	FROM team_metrics
+	ORDER BY "TEAM_ID", "GAME_DATE" DESC
+	)
+	SELECT
+		MAX(latest_venue."GAME_DATE") FILTER (WHERE latest_venue."HOME/AWAY" = 'HOME') AS "LAST_GAME_DATE_HOME",
+		latest_venue."TEAM_ID",
+		latest_venue."TEAM",{home_columns}
+		MAX(latest_venue."GAME_DATE") FILTER (WHERE latest_venue."HOME/AWAY" = 'AWAY') AS "LAST_GAME_DATE_AWAY",{away_columns}{total_columns}
+	FROM latest_venue
+	INNER JOIN latest
+		ON latest."TEAM_ID" = latest_venue."TEAM_ID"
+	GROUP BY
+		latest_venue."TEAM_ID",
+		latest_venue."TEAM",{total_group}
+	HAVING COUNT(*) FILTER (WHERE latest_venue."HOME/AWAY" = 'HOME') > 0
+		AND COUNT(*) FILTER (WHERE latest_venue."HOME/AWAY" = 'AWAY') > 0;
+	"""
+    return convert_sql_to_df(query=query)